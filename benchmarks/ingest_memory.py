@@ -0,0 +1,106 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+"""
+Measures the peak resident set size of ingesting a trace, i.e., of the
+Process objects that are alive while a trace is parsed.
+
+    python benchmarks/ingest_memory.py [--events N] [--processes P] [--trace FILE]
+
+The synthetic trace of synthetic_trace.py is used unless a trace file is
+given. Exited processes are discarded, as they would be once stored in
+MongoDB, so the peak comes from the live processes. The result is reported
+as MB of peak RSS per million events.
+"""
+
+from reprozip.pack.system_tap.parse_stap_out import parse_raw_pass_lite_line, Process, PathTable
+from synthetic_trace import generate
+import argparse
+import resource
+import time
+import gc
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def ingest(lines):
+    """
+    Parses the lines as Provenance.index_pass_lite_logs() does, returning
+    the number of events and the maximum number of live processes.
+    """
+    
+    active = {}
+    table = PathTable()
+    events = 0
+    max_live = 0
+    for line in lines:
+        entry = parse_raw_pass_lite_line(line.rstrip('\n'))
+        events += 1
+        p = active.get(entry.pid)
+        if p is None:
+            p = Process(entry.pid, entry.ppid, entry.uid, entry.timestamp, active, table)
+        if p.add_entry(entry):
+            del active[p.pid]
+        if len(active) > max_live:
+            max_live = len(active)
+    return (events, max_live)
+
+def main():
+    parser = argparse.ArgumentParser(description='peak memory of trace ingestion')
+    parser.add_argument('--events', type=int, default=1000000, help='events of the synthetic trace')
+    parser.add_argument('--processes', type=int, default=500, help='live processes of the synthetic trace')
+    parser.add_argument('--trace', help='uncompressed pass-lite trace to ingest instead')
+    args = parser.parse_args()
+    
+    if args.trace:
+        lines = open(args.trace)
+    else:
+        lines = generate(args.events, n_processes=args.processes)
+    
+    gc.collect()
+    base = peak_rss_mb()
+    start = time.time()
+    (events, max_live) = ingest(lines)
+    elapsed = time.time() - start
+    peak = peak_rss_mb()
+    
+    print 'events:              %d' % events
+    print 'max live processes:  %d' % max_live
+    print 'ingest time:         %.1fs' % elapsed
+    print 'peak RSS:            %.1f MB (%.1f MB before ingest)' % (peak, base)
+    print 'MB per million events: %.1f' % ((peak - base) * 1e6 / events)
+
+if __name__ == '__main__':
+    main()
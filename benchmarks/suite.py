@@ -0,0 +1,460 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+"""
+Benchmarks of the stages of ReproZip on a synthetic experiment, from the
+trace to the unpacked package.
+
+    python benchmarks/suite.py [--processes N] [--depth D] [--files-per-process F]
+                               [--out-of-order R] [--file-size BYTES] [--only STAGE,...]
+    python benchmarks/suite.py --compare RESULTS RESULTS
+
+A workspace is created with the input files, programs and outputs of the
+experiment, and a pass-lite.out trace of its process tree is generated
+with synthetic_trace.generate_tree(), so that no tracer is needed. The
+stages are then run as ReproZip does, each in its own interpreter so that
+its peak RSS is its own:
+
+  parse     parse_raw_pass_lite_line() over the lines of the trace
+  ingest    Provenance.index_pass_lite_logs(), storing the processes
+  tree      Experiment.retrieve_experiment_data(): the provenance tree,
+            checked against the one built without aggregate_files()
+  generate  configure(), process_config_file() and
+            generate_reproducible_experiment(): the copy of the files
+  pack      Experiment.pack(): the tar.gz package
+  unpack    reprozip.unpack.unpack()
+
+The database is the SQLite backend, which stands in for MongoDB, in the
+workspace; HOME is also set to the workspace, so that the configuration
+of the user is not read. The workspace cannot be in a directory whose
+files ReproZip ignores, such as /tmp, and is created in this directory
+by default. The results are written to
+results/<commit>.json (with -dirty when the tree has changes), and two of
+them are compared with --compare, as paths or commits.
+"""
+
+from reprozip.pack.system_tap.parse_stap_out import IGNORE_DIRS
+from synthetic_trace import generate_tree, PROGRAMS
+import subprocess
+import argparse
+import tempfile
+import resource
+import shutil
+import pickle
+import time
+import json
+import sys
+import os
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+
+STAGES = ['parse', 'ingest', 'tree', 'generate', 'pack', 'unpack']
+
+SESSION_TAG = 'benchmark'
+
+# name of the package (and of the directory of the experiment)
+PACKAGE_NAME = 'benchmark'
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def git(*args):
+    try:
+        return subprocess.check_output(('git',) + args, cwd=REPO_DIR).strip()
+    except:
+        return None
+
+def commit_name():
+    """
+    Returns the name of the results of the checked out commit.
+    """
+    
+    commit = git('rev-parse', '--short', 'HEAD') or 'unknown'
+    if git('status', '--porcelain', '--untracked-files=no'):
+        commit += '-dirty'
+    return commit
+
+def workspace_paths(workdir):
+    return dict(home=os.path.join(workdir, 'home'),
+                experiment=os.path.join(workdir, 'experiment'),
+                logs=os.path.join(workdir, 'logs'),
+                db=os.path.join(workdir, 'reprozip.db'),
+                pack=os.path.join(workdir, 'pack'),
+                unpack=os.path.join(workdir, 'unpack'),
+                state=os.path.join(workdir, 'experiment.pickle'),
+                params=os.path.join(workdir, 'params.json'))
+
+def setup(workdir, params):
+    """
+    Creates the workspace: the configuration of ReproZip, the files and
+    programs of the experiment, and its trace.
+    """
+    
+    from reprozip.pack.config_parser import Parser
+    
+    paths = workspace_paths(workdir)
+    for d in ('experiment', 'logs', 'pack', 'unpack'):
+        os.makedirs(paths[d])
+    os.makedirs(os.path.join(paths['home'], '.reprozip'))
+    Parser().create_config_file()
+    
+    experiment = paths['experiment']
+    for d in ('bin', 'data', 'out'):
+        os.makedirs(os.path.join(experiment, d))
+    
+    # programs are copied in the experiment, so that the package has no
+    # file to be copied outside of it when unpacked, and run through
+    # symbolic links, whose targets are packed as well
+    os.makedirs(os.path.join(experiment, 'bin', 'real'))
+    programs = []
+    for program in ['/bin/sh'] + PROGRAMS:
+        if os.path.exists(program):
+            name = os.path.basename(program)
+            shutil.copy2(program, os.path.join(experiment, 'bin', 'real', name))
+            link = os.path.join(experiment, 'bin', name)
+            os.symlink(os.path.join('real', name), link)
+            programs.append(link)
+    shell = programs[0]
+    
+    # text that compresses about as well as sources and data files
+    inputs = []
+    for i in xrange(max(100, params['files_per_process'] * 10)):
+        path = os.path.join(experiment, 'data', 'input%d.txt' % i)
+        f = open(path, 'w')
+        f.write(os.urandom(params['file_size'] / 2).encode('hex'))
+        f.close()
+        inputs.append(path)
+    outputs = []
+    for i in xrange(max(10, params['processes'] / 10)):
+        path = os.path.join(experiment, 'out', 'output%d.txt' % i)
+        open(path, 'w').close()
+        outputs.append(path)
+    open(os.path.join(experiment, 'experiment.sh'), 'w').close()
+    
+    params['command'] = 'sh experiment.sh'
+    lines = 0
+    f = open(os.path.join(paths['logs'], 'pass-lite.out.0'), 'w')
+    for line in generate_tree(params['processes'], params['depth'], params['files_per_process'],
+                              params['out_of_order'], inputs, outputs, params['command'],
+                              experiment, shell, programs[1:]):
+        f.write(line + '\n')
+        lines += 1
+    f.close()
+    
+    params['events'] = lines
+    f = open(paths['params'], 'w')
+    json.dump(params, f)
+    f.close()
+    return dict(events=lines, files=len(inputs) + len(outputs))
+
+def load_experiment(paths):
+    f = open(paths['state'], 'rb')
+    experiment = pickle.load(f)
+    f.close()
+    return experiment
+
+def save_experiment(paths, experiment):
+    f = open(paths['state'], 'wb')
+    pickle.dump(experiment, f, pickle.HIGHEST_PROTOCOL)
+    f.close()
+
+def root_files(experiment):
+    """
+    Returns the files, directories, symbolic links and environment of the
+    root of the provenance tree of experiment.
+    """
+    
+    root = experiment.prov_tree.root
+    return dict(files_read=sorted(root.files_read),
+                files_written=sorted(root.files_written),
+                dirs=sorted(root.dirs),
+                symlinks=root.symlink_to_target,
+                env=root.execve_env)
+
+def check_tree(paths, params, experiment):
+    """
+    Checks that the root of the provenance tree gathered by the database
+    (see Storage.aggregate_files) is the one built from the processes.
+    """
+    
+    from reprozip.pack.storage.sqlite_storage import SQLiteStorage
+    from reprozip.pack.experiment.experiment import Experiment
+    
+    class ProcessStorage(SQLiteStorage):
+        def can_aggregate(self):
+            return False
+    
+    baseline = Experiment()
+    baseline.command_line_info = params['command']
+    storage = ProcessStorage(paths['db'], ['ppid', 'creation_time'])
+    baseline.retrieve_experiment_data(storage)
+    storage.stop()
+    
+    (aggregated, expected) = (root_files(experiment), root_files(baseline))
+    for key in sorted(expected):
+        if aggregated[key] != expected[key]:
+            print >> sys.stderr, 'the root gathered by the database differs in %s' % key
+            raise Exception
+    return len(expected['symlinks'])
+
+def run_stage(name, workdir):
+    """
+    Runs a stage in this interpreter, and returns its results; the
+    previous stages must have been run in the same workspace.
+    """
+    
+    from reprozip.pack.system_tap.parse_stap_out import parse_raw_pass_lite_line
+    from reprozip.pack.storage.sqlite_storage import SQLiteStorage
+    from reprozip.pack.experiment.experiment import Experiment
+    from reprozip.pack.store_data import Provenance
+    from reprozip.pack import profiling
+    
+    paths = workspace_paths(workdir)
+    if name == 'setup':
+        return setup(workdir, json.loads(sys.stdin.readline()))
+    params = json.load(open(paths['params']))
+    
+    result = {}
+    if name == 'parse':
+        lines = [line.rstrip('\n') for line in open(os.path.join(paths['logs'], 'pass-lite.out.0'))]
+    
+    # counters and times of the stage (see reprozip.pack.profiling)
+    report = os.path.join(workdir, '%s.profile.json' % name)
+    profiling.start(report)
+    base_rss = peak_rss_kb()
+    try:
+        with profiling.stage(name):
+            if name == 'parse':
+                for line in lines:
+                    parse_raw_pass_lite_line(line)
+                result['lines'] = len(lines)
+            
+            elif name == 'ingest':
+                provenance = Provenance(True, 100)
+                storage = SQLiteStorage(paths['db'], ['ppid', 'creation_time'])
+                provenance.store(paths['logs'], SESSION_TAG, storage)
+                storage.stop()
+                result['events'] = provenance.stats.parsed_total()
+            
+            elif name == 'tree':
+                experiment = Experiment()
+                experiment.command_line_info = params['command']
+                storage = SQLiteStorage(paths['db'], ['ppid', 'creation_time'])
+                experiment.retrieve_experiment_data(storage)
+                storage.stop()
+                save_experiment(paths, experiment)
+            
+            elif name == 'generate':
+                os.chdir(paths['pack'])
+                experiment = load_experiment(paths)
+                experiment.configure()
+                experiment.process_config_file()
+                experiment.generate_reproducible_experiment(PACKAGE_NAME)
+                save_experiment(paths, experiment)
+            
+            elif name == 'pack':
+                os.chdir(paths['pack'])
+                load_experiment(paths).pack()
+            
+            elif name == 'unpack':
+                from reprozip.unpack.unpack import unpack
+                os.chdir(paths['unpack'])
+                unpack({'exp': os.path.join(paths['pack'], '%s.tar.gz' % PACKAGE_NAME),
+                        'wdir': paths['unpack'],
+                        'verbose': False})
+    finally:
+        profiling.stop()
+    
+    stage = json.load(open(report))['stages'][0]
+    result.update(stage['counts'])
+    result['wall_time'] = stage['wall_time']
+    result['cpu_time'] = stage['cpu_user'] + stage['cpu_system']
+    result['maxrss_kb'] = peak_rss_kb()
+    result['maxrss_increase_kb'] = peak_rss_kb() - base_rss
+    for counter in ('lines', 'events'):
+        if counter in result and stage['wall_time'] > 0:
+            result['%s_per_s' % counter] = result[counter] / stage['wall_time']
+    
+    # not measured
+    if name == 'tree':
+        result['symlinks'] = check_tree(paths, params, experiment)
+    return result
+
+def spawn_stage(name, workdir, stdin=''):
+    """
+    Runs a stage in a new interpreter, and returns its results, or None if
+    it failed.
+    """
+    
+    paths = workspace_paths(workdir)
+    env = dict(os.environ)
+    env['HOME'] = paths['home']
+    env['PYTHONPATH'] = os.pathsep.join([REPO_DIR, BENCHMARKS_DIR] +
+                                        [p for p in [os.environ.get('PYTHONPATH')] if p])
+    
+    # the configuration file of the experiment is written in the working
+    # directory
+    cwd = paths['pack']
+    if not os.path.exists(cwd):
+        cwd = workdir
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--stage', name, workdir],
+                             env=env, cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    (out, err) = child.communicate(stdin)
+    result = None
+    for line in out.splitlines():
+        if line.startswith('RESULT '):
+            result = json.loads(line[len('RESULT '):])
+    if child.returncode != 0 or result is None:
+        print >> sys.stderr, 'stage %s failed:\n%s' % (name, out)
+        return None
+    return result
+
+def load_results(name):
+    if not os.path.exists(name):
+        name = os.path.join(RESULTS_DIR, '%s.json' % name)
+    return json.load(open(name))
+
+def compare(old, new):
+    """
+    Prints the results of two runs side by side.
+    """
+    
+    print 'old: %s  %s' % (old['commit'], json.dumps(old['params'], sort_keys=True))
+    print 'new: %s  %s' % (new['commit'], json.dumps(new['params'], sort_keys=True))
+    if old['params'] != new['params']:
+        print 'warning: the runs have different parameters'
+    print '%-10s %-22s %16s %16s %9s' % ('stage', 'metric', 'old', 'new', 'change')
+    for stage in STAGES:
+        a = old['stages'].get(stage) or {}
+        b = new['stages'].get(stage) or {}
+        for metric in sorted(set(a) | set(b)):
+            values = []
+            for run in (a, b):
+                value = run.get(metric, '-')
+                if isinstance(value, float):
+                    value = '%.3f' % value
+                values.append(value)
+            line = '%-10s %-22s %16s %16s' % (stage, metric, values[0], values[1])
+            if a.get(metric) and metric in b:
+                line += ' %+8.1f%%' % ((float(b[metric]) / a[metric] - 1) * 100)
+            print line
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmarks of the stages of ReproZip')
+    parser.add_argument('--processes', type=int, default=2000, help='processes of the experiment')
+    parser.add_argument('--depth', type=int, default=4, help='fork depth of the experiment')
+    parser.add_argument('--files-per-process', type=int, default=50, help='files opened by each process')
+    parser.add_argument('--out-of-order', type=float, default=0.01, help='fraction of the records written late')
+    parser.add_argument('--file-size', type=int, default=8192, help='size of the input files, in bytes')
+    parser.add_argument('--only', help='comma-separated stages to run (the previous ones are run, but not reported)')
+    parser.add_argument('--workdir', help='the workspace to use (outside of /tmp) - by default, a new directory '
+                                          'in benchmarks/, removed at the end')
+    parser.add_argument('--results', default=RESULTS_DIR, help='the directory of the results')
+    parser.add_argument('--compare', nargs=2, metavar='RESULTS', help='compares two results')
+    parser.add_argument('--stage', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.stage:
+        print 'RESULT ' + json.dumps(run_stage(*args.stage))
+        return
+    
+    if args.compare:
+        compare(load_results(args.compare[0]), load_results(args.compare[1]))
+        return
+    
+    only = STAGES
+    if args.only:
+        only = args.only.split(',')
+        for stage in only:
+            if stage not in STAGES:
+                parser.error('unknown stage: %s' % stage)
+    
+    params = dict(processes=args.processes, depth=args.depth,
+                  files_per_process=args.files_per_process,
+                  out_of_order=args.out_of_order, file_size=args.file_size)
+    
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='workspace-', dir=BENCHMARKS_DIR)
+    workdir = os.path.abspath(workdir)
+    for d in IGNORE_DIRS:
+        if (workdir + os.sep).startswith(d):
+            parser.error('the files of the experiment would be ignored in %s' % d)
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+    elif os.listdir(workdir):
+        parser.error('the workspace %s is not empty' % workdir)
+    
+    stages = {}
+    try:
+        start = time.time()
+        workspace = spawn_stage('setup', workdir, json.dumps(params) + '\n')
+        if workspace is None:
+            sys.exit(1)
+        print '%d events, %d files (%.1fs)' % (workspace['events'], workspace['files'], time.time() - start)
+        
+        last = max(STAGES.index(stage) for stage in only)
+        for stage in STAGES[:last + 1]:
+            result = spawn_stage(stage, workdir)
+            if result is None:
+                break
+            if stage in only:
+                stages[stage] = result
+                print '%-10s %8.3fs  %8.3fs CPU  %8d kB peak RSS  %s' % (
+                    stage, result['wall_time'], result['cpu_time'], result['maxrss_kb'],
+                    ', '.join('%s=%s' % (k, int(v)) for (k, v) in sorted(result.iteritems())
+                              if k not in ('wall_time', 'cpu_time', 'maxrss_kb')))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, True)
+    
+    params.update(workspace)
+    commit = commit_name()
+    results = dict(commit=commit,
+                   date=time.strftime('%Y-%m-%d %H:%M:%S'),
+                   python=sys.version.split()[0],
+                   params=params,
+                   stages=stages)
+    if not os.path.exists(args.results):
+        os.makedirs(args.results)
+    path = os.path.join(args.results, '%s.json' % commit)
+    f = open(path, 'w')
+    json.dump(results, f, indent=2, sort_keys=True)
+    f.close()
+    print 'results written to %s' % path
+
+if __name__ == '__main__':
+    main()
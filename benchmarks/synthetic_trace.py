@@ -0,0 +1,300 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+"""
+Generators of synthetic pass-lite traces.
+
+generate() is shaped like a parallel build: a set of long-lived processes
+(compilers, linkers, ...) that open many files from a shared pool of paths
+(system headers, libraries, sources), with a few writes, renames, forks and
+exits.
+
+generate_tree() is shaped like a traced experiment: a process tree of a
+given size and fork depth under a shell running the command line, where
+each process executes a program and opens a number of files, and the
+records of concurrent processes are interleaved, some of them out of
+order as SystemTap writes them from its per-CPU buffers.
+
+    python benchmarks/synthetic_trace.py <events> [<output>]
+    python benchmarks/synthetic_trace.py --tree [--processes N] [--depth D]
+        [--files-per-process F] [--out-of-order R] [<output>]
+"""
+
+import argparse
+import random
+import heapq
+import sys
+
+# fraction of the events of each kind, besides the opens
+WRITE_RATIO = 0.1
+RENAME_RATIO = 0.01
+EXIT_RATIO = 0.002
+
+def path_pool(n_paths, rng):
+    """
+    Returns n_paths absolute paths that share long prefixes, as in a
+    source tree or in /usr/include.
+    """
+    
+    roots = ['/usr/include', '/usr/lib/python2.7', '/usr/lib/x86_64-linux-gnu',
+             '/home/user/project/src', '/home/user/project/build', '/opt/local/share']
+    paths = []
+    for i in xrange(n_paths):
+        depth = rng.randint(0, 3)
+        parts = [rng.choice(roots)]
+        for d in xrange(depth):
+            parts.append('dir%d' % rng.randint(0, 30))
+        parts.append('file%d.h' % i)
+        paths.append('/'.join(parts))
+    return paths
+
+def generate(n_events, n_processes=500, n_paths=50000, seed=0, start_time=1356998400000):
+    """
+    Yields the lines of a synthetic trace with about n_events records.
+    """
+    
+    rng = random.Random(seed)
+    paths = path_pool(n_paths, rng)
+    root = 1000
+    next_pid = root + 1
+    t = start_time
+    env = 'PATH&&=&&/usr/bin:/bin&_&&_&HOME&&=&&/home/user&_&&_&'
+    
+    def header(pid, ppid, name):
+        return '%d||%d||%d||1000||%s||' % (t, pid, ppid, name)
+    
+    yield header(root, 1, 'make') + 'EXECVE||/home/user/project||/usr/bin/make||%s||"make" "-j"' % env
+    yield header(root, 1, 'make') + 'EXECVE_RETURN||0'
+    emitted = 2
+    
+    active = []
+    while emitted < n_events:
+        t += 1
+        if len(active) < n_processes:
+            pid = next_pid
+            next_pid += 1
+            name = rng.choice(['cc1', 'as', 'ld', 'python'])
+            active.append((pid, name))
+            yield header(root, 1, 'make') + 'FORK||%d' % pid
+            yield header(pid, root, 'make') + 'EXECVE||/home/user/project||/usr/bin/%s||%s||"%s" "-c" "file%d.c"' % (name, env, name, pid)
+            yield header(pid, root, name) + 'EXECVE_RETURN||0'
+            emitted += 3
+            continue
+        
+        i = rng.randrange(len(active))
+        (pid, name) = active[i]
+        h = header(pid, root, name)
+        r = rng.random()
+        
+        if r < EXIT_RATIO:
+            yield h + 'EXIT_GROUP||0'
+            active[i] = active[-1]
+            active.pop()
+            emitted += 1
+        elif r < EXIT_RATIO + RENAME_RATIO:
+            path = rng.choice(paths)
+            yield h + 'RENAME||%s.tmp||%s' % (path, path)
+            emitted += 1
+        else:
+            # a few paths are accessed by everybody (hot headers)
+            if rng.random() < 0.5:
+                path = paths[int(rng.paretovariate(1.2)) % 1000]
+            else:
+                path = rng.choice(paths)
+            mode = 'OPEN_WRITE' if rng.random() < WRITE_RATIO else 'OPEN_READ'
+            yield h + 'OPEN_ABSPATH||%s' % path
+            yield h + '%s||%s||3' % (mode, path)
+            yield h + 'CLOSE||3'
+            emitted += 3
+    
+    for (pid, name) in active:
+        yield header(pid, root, name) + 'EXIT_GROUP||0'
+    yield header(root, 1, 'make') + 'EXIT_GROUP||0'
+
+# programs executed by the processes of generate_tree()
+PROGRAMS = ['/bin/cat', '/bin/ls', '/bin/grep', '/bin/sed', '/usr/bin/env']
+
+def generate_tree(n_processes=1000, depth=4, files_per_process=20, out_of_order=0.01,
+                  paths=None, outputs=None, command='sh experiment.sh', pwd='/home/user/experiment',
+                  shell='/bin/sh', programs=PROGRAMS, max_delay=50, seed=0, start_time=1356998400000):
+    """
+    Yields the lines of a synthetic trace of n_processes processes whose
+    fork tree is at most depth levels deep below the process that runs
+    command (with shell). The other processes execute programs, and each
+    process opens files_per_process files: read from paths, or written to
+    outputs (by default, a pool of synthetic paths). A
+    fraction out_of_order of the records is written up to max_delay ms
+    late, with the records after them of the same process, which the
+    reorder window of the parser puts back in order.
+    """
+    
+    rng = random.Random(seed)
+    if paths is None:
+        paths = path_pool(max(1000, files_per_process * 10), rng)
+    if outputs is None:
+        outputs = ['%s/out/file%d.out' % (pwd, i) for i in xrange(max(10, n_processes / 10))]
+    env = 'PATH&&=&&/usr/bin:/bin&_&&_&HOME&&=&&/home/user&_&&_&'
+    
+    # process i: (ppid index, level, program); process 0 runs command
+    level = [0]
+    parent = [None]
+    forkable = [0]
+    for i in xrange(1, n_processes):
+        p = rng.choice(forkable)
+        parent.append(p)
+        level.append(level[p] + 1)
+        if level[i] < depth:
+            forkable.append(i)
+    children = [[] for i in xrange(n_processes)]
+    for i in xrange(1, n_processes):
+        children[parent[i]].append(i)
+    
+    # layout of each process relative to its creation, children first: the
+    # file operations take 1 ms each, the children are forked between them,
+    # and a process exits after its children
+    ops = [None] * n_processes
+    forks = [None] * n_processes
+    duration = [0] * n_processes
+    for i in xrange(n_processes - 1, -1, -1):
+        n_ops = files_per_process
+        ops[i] = n_ops
+        forks[i] = sorted((rng.randint(2, n_ops + 2), c) for c in children[i])
+        end = n_ops + 2
+        for (offset, c) in forks[i]:
+            end = max(end, offset + duration[c])
+        duration[i] = end + 1
+    start = [0] * n_processes
+    start[0] = start_time
+    for i in xrange(n_processes):
+        for (offset, c) in forks[i]:
+            start[c] = start[i] + offset
+    
+    pids = [1000 + i for i in xrange(n_processes)]
+    executed = [shell] + [programs[i % len(programs)] for i in xrange(1, n_processes)]
+    names = [program.rsplit('/', 1)[1] for program in executed]
+    
+    def process_lines(i):
+        pid = pids[i]
+        program = executed[i]
+        name = names[i]
+        ppid = 1
+        parent_name = name
+        if parent[i] is not None:
+            ppid = pids[parent[i]]
+            parent_name = names[parent[i]]
+        if i == 0:
+            argv = ' '.join('"%s"' % arg for arg in command.split())
+        else:
+            argv = '"%s" "%d"' % (program, i)
+        # after the fork in the parent
+        t = start[i] + 1
+        
+        yield (t, '%d||%d||%d||1000||%s||EXECVE||%s||%s||%s||%s' % (t, pid, ppid, parent_name, pwd, program, env, argv))
+        yield (t, '%d||%d||%d||1000||%s||EXECVE_RETURN||0' % (t, pid, ppid, name))
+        
+        pending = list(forks[i])
+        for op in xrange(ops[i]):
+            t = start[i] + 2 + op
+            while pending and start[i] + pending[0][0] <= t:
+                (offset, c) = pending.pop(0)
+                yield (start[c], '%d||%d||%d||1000||%s||FORK||%d' % (start[c], pid, ppid, name, pids[c]))
+            h = '%d||%d||%d||1000||%s||' % (t, pid, ppid, name)
+            if rng.random() < WRITE_RATIO:
+                path = rng.choice(outputs)
+                mode = 'OPEN_WRITE'
+            else:
+                path = rng.choice(paths)
+                mode = 'OPEN_READ'
+            yield (t, h + 'OPEN_ABSPATH||%s' % path)
+            yield (t, h + '%s||%s||3' % (mode, path))
+            yield (t, h + 'CLOSE||3')
+        for (offset, c) in pending:
+            yield (start[c], '%d||%d||%d||1000||%s||FORK||%d' % (start[c], pid, ppid, name, pids[c]))
+        t = start[i] + duration[i] - 1
+        yield (t, '%d||%d||%d||1000||%s||EXIT_GROUP||0' % (t, pid, ppid, name))
+    
+    # records held back: (time of release, sequence, line); the delays
+    # have their own generator, so that the records are the same at any
+    # rate. Like the buffers of the CPUs, a late record delays the
+    # records after it of the same process, which keep their order
+    late = random.Random(seed + 1)
+    held = []
+    released = {}
+    seq = 0
+    for (t, line) in heapq.merge(*[process_lines(i) for i in xrange(n_processes)]):
+        while held and held[0][0] <= t:
+            yield heapq.heappop(held)[2]
+        pid = int(line.split('||', 2)[1])
+        if released.get(pid, 0) > t:
+            heapq.heappush(held, (released[pid], seq, line))
+            seq += 1
+        elif late.random() < out_of_order:
+            released[pid] = t + late.randint(1, max_delay)
+            heapq.heappush(held, (released[pid], seq, line))
+            seq += 1
+        else:
+            yield line
+    while held:
+        yield heapq.heappop(held)[2]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='synthetic pass-lite traces')
+    parser.add_argument('--tree', action='store_true', help='generate a process tree (generate_tree)')
+    parser.add_argument('--processes', type=int, default=1000, help='processes of the tree')
+    parser.add_argument('--depth', type=int, default=4, help='fork depth of the tree')
+    parser.add_argument('--files-per-process', type=int, default=20, help='files opened by each process')
+    parser.add_argument('--out-of-order', type=float, default=0.01, help='fraction of records written late')
+    parser.add_argument('args', nargs='*', help='<events> [<output>], or [<output>] with --tree')
+    args = parser.parse_args()
+    
+    output = None
+    if args.tree:
+        if len(args.args) > 1:
+            parser.error('too many arguments')
+        if args.args:
+            output = args.args[0]
+        lines = generate_tree(args.processes, args.depth, args.files_per_process, args.out_of_order)
+    else:
+        if len(args.args) not in (1, 2):
+            parser.error('the number of events is required')
+        if len(args.args) > 1:
+            output = args.args[1]
+        lines = generate(int(args.args[0]))
+    
+    if output:
+        out = open(output, 'w')
+    else:
+        out = sys.stdout
+    for line in lines:
+        out.write(line + '\n')
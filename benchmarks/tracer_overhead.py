@@ -0,0 +1,173 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+"""
+Compares the wall-clock overhead of the tracer backends on syscall-heavy
+workloads.
+
+    python benchmarks/tracer_overhead.py [--runs N] [--backends native,ptrace,...]
+
+Each workload is executed --runs times with each backend, and the median
+time is reported together with the overhead over the native execution.
+The systemtap backend is only measured if stap can be run (it requires root
+privileges, or sudo); the preload and ptrace backends are compiled into a
+temporary directory.
+"""
+
+from reprozip.pack.preload.shim import build_shim, shim_env
+from reprozip.pack.ptrace.supervisor import build_supervisor, supervisor_command
+from reprozip.install.utils import guess_sudo
+import reprozip.utils
+import subprocess
+import argparse
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+PASS_LITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                         'reprozip', 'pack', 'system_tap', 'pass-lite.stp')
+
+# (name, shell command): open/stat-heavy, fork/exec-heavy, and
+# read/write-heavy (which the ptrace backend must never stop)
+WORKLOADS = [
+    ('open-stat', 'find /usr/include /usr/lib/python2.7 -type f 2>/dev/null | head -20000 | xargs cat > /dev/null'),
+    ('fork-exec', 'i=0; while [ $i -lt 500 ]; do /bin/true; i=$((i+1)); done'),
+    ('read-write', 'dd if=/dev/zero of=/dev/null bs=64 count=2000000 2>/dev/null'),
+]
+
+BACKENDS = ['native', 'preload', 'ptrace', 'systemtap']
+
+def median(values):
+    values = sorted(values)
+    n = len(values)
+    if n % 2:
+        return values[n / 2]
+    return (values[n / 2 - 1] + values[n / 2]) / 2.0
+
+def run_once(command, env=None, wrapper=None):
+    """
+    Runs the workload once, returning the elapsed wall-clock time.
+    """
+    
+    args = ['sh', '-c', command]
+    if wrapper:
+        args = wrapper + args
+    start = time.time()
+    subprocess.check_call(args, env=env)
+    return time.time() - start
+
+def start_stap(tmpdir):
+    """
+    Starts SystemTap in the background, returning its process, or None if
+    it cannot be run.
+    """
+    
+    (found, stap) = reprozip.utils.executable_in_path('stap')
+    if not found:
+        return None
+    command_line = guess_sudo() + ' stap -o %s %s' % (os.path.join(tmpdir, 'stap.out'), PASS_LITE)
+    p = subprocess.Popen(command_line.split(),
+                         stdout=subprocess.PIPE,
+                         stderr=subprocess.PIPE)
+    # same delay as Tracer.run_tracer()
+    time.sleep(10)
+    if p.poll() is not None:
+        return None
+    return p
+
+def main():
+    parser = argparse.ArgumentParser(description='overhead of the tracer backends')
+    parser.add_argument('--runs', type=int, default=5, help='executions of each workload')
+    parser.add_argument('--backends', default=','.join(BACKENDS),
+                        help='comma-separated list of backends (%s)' % ', '.join(BACKENDS))
+    args = parser.parse_args()
+    
+    backends = [b for b in args.backends.split(',') if b]
+    for b in backends:
+        if b not in BACKENDS:
+            parser.error('unknown backend: %s' % b)
+    
+    tmpdir = tempfile.mkdtemp(prefix='reprozip-bench-')
+    log = os.path.join(tmpdir, 'pass-lite.out.0')
+    results = {}
+    stap = None
+    try:
+        for backend in backends:
+            env = None
+            wrapper = None
+            if backend == 'preload':
+                env = shim_env(build_shim(tmpdir), log, 'sh')
+            elif backend == 'ptrace':
+                wrapper = supervisor_command(build_supervisor(tmpdir), log)
+            elif backend == 'systemtap':
+                stap = start_stap(tmpdir)
+                if stap is None:
+                    print >> sys.stderr, 'skipping systemtap: stap could not be started'
+                    continue
+            
+            for (name, command) in WORKLOADS:
+                times = []
+                for i in range(args.runs):
+                    if os.path.exists(log):
+                        os.remove(log)
+                    times.append(run_once(command, env, wrapper))
+                results[(backend, name)] = median(times)
+            
+            if stap is not None:
+                subprocess.call((guess_sudo() + ' kill %d' % stap.pid).split())
+                stap.wait()
+                stap = None
+    finally:
+        if stap is not None:
+            subprocess.call((guess_sudo() + ' kill %d' % stap.pid).split())
+        shutil.rmtree(tmpdir, True)
+    
+    print '%-12s' % 'workload' + ''.join(['%22s' % b for b in backends])
+    for (name, command) in WORKLOADS:
+        line = '%-12s' % name
+        native = results.get(('native', name))
+        for backend in backends:
+            t = results.get((backend, name))
+            if t is None:
+                line += '%22s' % '-'
+            elif native and backend != 'native':
+                line += '%22s' % ('%.3fs (%+.0f%%)' % (t, (t / native - 1) * 100))
+            else:
+                line += '%22s' % ('%.3fs' % t)
+        print line
+
+if __name__ == '__main__':
+    main()
@@ -35,9 +35,28 @@
 import reprozip.debug
 import reprozip.utils
 import argparse
+import sys
 
 def run():
     
+    # reprozip query ...
+    if len(sys.argv) > 1 and sys.argv[1] == 'query':
+        from reprozip.pack.query import query
+        query(sys.argv[2:])
+        return
+    
+    # reprozip analyze ...
+    if len(sys.argv) > 1 and sys.argv[1] == 'analyze':
+        from reprozip.pack.analysis import analyze
+        analyze(sys.argv[2:])
+        return
+    
+    # reprozip export ...
+    if len(sys.argv) > 1 and sys.argv[1] == 'export':
+        from reprozip.pack.trace_export import export
+        export(sys.argv[2:])
+        return
+    
     description = 'a tool to make reproducible experiments'
     
     pack_help = 'indicates the packing phase of ReproZip'
@@ -64,8 +83,20 @@ def run():
     exp_help = 'the experiment to be unpacked (a tar.gz file) - the whole path '
     exp_help += 'should be specified'
     
+    tracer_help = 'the tracer used to record the execution of the command line: '
+    tracer_help += '\'systemtap\' (SystemTap / DTrace, requires root privileges), '
+    tracer_help += '\'preload\' (an LD_PRELOAD shim, Linux only) or \'ptrace\' (a ptrace / seccomp '
+    tracer_help += 'supervisor, Linux x86-64 only); by default, the tracer in the ReproZip '
+    tracer_help += 'configuration file is used'
+    
     verbose_help = 'verbose option'
     
+    profile_help = 'for the packing phase, writes the wall time, CPU time, peak memory and counters '
+    profile_help += 'of each stage to the given JSON file'
+    
+    cprofile_help = 'with --profile, also dumps the cProfile statistics of each stage next to '
+    cprofile_help += 'the JSON file'
+    
 #    def boolean(string):
 #        if (string.title().lower() == 'true') or (string.title().lower() == 'false'):
 #            return eval(string.title())
@@ -86,8 +117,11 @@ def run():
     parser.add_argument('--execute', '-e', action='store_true', help=execute_help)
     parser.add_argument('--wdir', '-w', help=wdir_help)
     parser.add_argument('--env', help=env_help)
+    parser.add_argument('--tracer', choices=['systemtap', 'preload', 'ptrace'], help=tracer_help)
     parser.add_argument('--generate', '-g', action='store_true', help=generate_help)
     parser.add_argument('--name', '-n', help=name_help)
+    parser.add_argument('--profile', metavar='FILE', help=profile_help)
+    parser.add_argument('--cprofile', action='store_true', help=cprofile_help)
     
     # unpacking
     parser.add_argument('--exp', help=exp_help)
@@ -97,7 +131,13 @@ def run():
     
     if args['pack']:
         from reprozip.pack import pack
-        pack.pack(args)
+        from reprozip.pack import profiling
+        if args['profile']:
+            profiling.start(args['profile'], args['cprofile'])
+        try:
+            pack.pack(args)
+        finally:
+            profiling.stop()
     else:
         from reprozip.unpack import unpack
         unpack.unpack(args)
\ No newline at end of file
@@ -32,6 +32,8 @@
 ##
 ###############################################################################
 
+import sys
+
 def error(message):
     """
     Prints an error message.
@@ -59,4 +61,53 @@ def verbose(verbose, message):
     """
     
     if verbose:
-        print '<v> %s' %message
\ No newline at end of file
+        print '<v> %s' %message
+
+# number of messages kept for each category of counted warnings
+WARNING_SAMPLES = 3
+
+# category -> [number of warnings, sample messages]
+_counted_warnings = {}
+
+# print every counted warning as it happens instead of a summary
+_verbose_warnings = False
+
+def set_verbose_warnings(verbose):
+    """
+    Makes count_warning() print every warning on stderr.
+    """
+    
+    global _verbose_warnings
+    _verbose_warnings = verbose
+    
+def count_warning(category, message, *args):
+    """
+    Counts a warning of the given category. The message is formatted with
+    args only if it is kept as a sample or printed, since noisy traces may
+    produce millions of warnings.
+    """
+    
+    counted = _counted_warnings.get(category)
+    if counted is None:
+        counted = [0, []]
+        _counted_warnings[category] = counted
+    counted[0] += 1
+    
+    if _verbose_warnings:
+        print >> sys.stderr, 'WARNING:', message % args
+    elif len(counted[1]) < WARNING_SAMPLES:
+        counted[1].append(message % args)
+        
+def warning_summary():
+    """
+    Prints and resets the counted warnings, one line per category followed
+    by its sample messages.
+    """
+    
+    for category in sorted(_counted_warnings, key=lambda c: _counted_warnings[c][0], reverse=True):
+        (count, samples) = _counted_warnings[category]
+        warning('%d x %s' % (count, category))
+        if not _verbose_warnings:
+            for s in samples:
+                print '    e.g. %s' % s
+    _counted_warnings.clear()
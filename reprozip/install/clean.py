@@ -32,12 +32,10 @@
 ##
 ###############################################################################
 
-from reprozip.pack.mongodb import Mongod
+from reprozip.pack.storage import get_storage
 import reprozip.install.utils
 import reprozip.utils
 import reprozip.debug
-import pymongo
-import time
 import sys
 import os
 
@@ -75,46 +73,36 @@ def clean_stap():
 
 def clean_mongodb():
     """
-    Drops ReproZip collections from the database.
+    Drops ReproZip collections from the database (MongoDB or SQLite,
+    according to the configuration file).
     """
     
-    reprozip.debug.success('Cleaning ReproZip database in MongoDB...')
+    reprozip.debug.success('Cleaning ReproZip database...')
     
-    mongod = Mongod()
-    mongod.run()
-    
-    # give mongod some time to begin
-    time.sleep(3)
-    
-    # connecting to MongoDB
     try:
-        conn = pymongo.MongoClient(port=int(mongod.port))
+        storage = get_storage()
     except:
-        reprozip.debug.error('Could not connect to MongoDB: %s' %sys.exc_info()[1])
-        mongod.stop()
         sys.exit(1)
-
-    # accessing the database
+    
+    storage.start()
+    storage.wait()
+    
+    # connecting to the database
     try:
-        db = conn[reprozip.utils.mongodb_database]
+        storage.connect()
     except:
-        reprozip.debug.error('Could not open the database: %s' %sys.exc_info()[1])
-        conn.close()
-        mongod.stop()
+        storage.stop()
         sys.exit(1)
 
     # dropping ReproZip collections
     try:
-        db.drop_collection(reprozip.utils.mongodb_collection)
-        db.drop_collection(reprozip.utils.mongodb_session_collection)
+        storage.drop()
     except:
         reprozip.debug.error('Error while dropping collections: %s' %sys.exc_info()[1])
-        conn.close()
-        mongod.stop()
+        storage.stop()
         sys.exit(1)
         
-    conn.close()
-    mongod.stop()
+    storage.stop()
     
     reprozip.debug.success('Done!')
     
\ No newline at end of file
@@ -36,4 +36,5 @@ import reprozip.pack.pack
 import reprozip.pack.store_data
 import reprozip.pack.tracer
 import reprozip.pack.config_parser
-import reprozip.pack.mongodb
\ No newline at end of file
+import reprozip.pack.mongodb
+import reprozip.pack.storage
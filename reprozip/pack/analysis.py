@@ -0,0 +1,361 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+from reprozip.pack.storage import get_storage
+from reprozip.pack.query import default_session
+import reprozip.debug
+import reprozip.utils
+import argparse
+import bisect
+import heapq
+import sys
+
+class Span(object):
+    """
+    Lifetime of a process of a tracing session, in ms since the epoch,
+    linked to the ones of its parent and children.
+    """
+    
+    __slots__ = ('id', 'pid', 'ppid', 'name', 'start', 'end', 'subtree_end',
+                 'parent', 'children', 'by_end', 'child_ends')
+    
+    def __init__(self, id, pid, ppid, name, start, end):
+        self.id = id
+        self.pid = pid
+        self.ppid = ppid
+        self.name = name
+        self.start = start
+        self.end = end
+        
+        # end of the last process of the subtree of this process
+        self.subtree_end = end
+        
+        self.parent = None
+        self.children = []
+        
+        # children by subtree end, and their subtree ends, in order
+        self.by_end = []
+        self.child_ends = []
+
+
+    def describe(self):
+        return 'PID %-8d %s' % (self.pid, self.name)
+
+
+def link_children(span, children):
+    """
+    Sorts the children of a span by creation time and indexes them by
+    subtree end, which must be known.
+    """
+    
+    children.sort(key=lambda child: child.start)
+    span.children = children
+    span.by_end = sorted(children, key=lambda child: (child.subtree_end, child.start))
+    span.child_ends = [child.subtree_end for child in span.by_end]
+
+
+class Timeline:
+    """
+    Process tree of a tracing session with the lifetimes of its
+    processes, on which the critical path of the session, its concurrency
+    profile and the exclusive wall time of its processes are computed.
+    The parent of a process is the last process with its ppid created
+    before it, since pids are reused.
+    """
+    
+    def __init__(self, spans):
+        self.spans = spans
+        
+        by_pid = {}
+        for span in spans:
+            by_pid.setdefault(span.pid, []).append(span)
+        starts = {}
+        for (pid, same_pid) in by_pid.iteritems():
+            same_pid.sort(key=lambda span: span.start)
+            starts[pid] = [span.start for span in same_pid]
+        
+        children = {}
+        roots = []
+        for span in spans:
+            if span.ppid in by_pid and span.ppid != span.pid:
+                i = bisect.bisect_right(starts[span.ppid], span.start)
+                if i > 0:
+                    span.parent = by_pid[span.ppid][i - 1]
+                    children.setdefault(span.parent.id, []).append(span)
+                    continue
+            roots.append(span)
+        
+        # parents before children
+        order = list(roots)
+        for span in order:
+            order.extend(children.get(span.id, []))
+        for span in reversed(order):
+            link_children(span, children.get(span.id, []))
+            for child in span.children:
+                span.subtree_end = max(span.subtree_end, child.subtree_end)
+        
+        # the session is the parent of the processes that have none in it
+        self.root = Span(None, None, None, None, None, None)
+        link_children(self.root, roots)
+        if spans:
+            self.root.start = min(span.start for span in spans)
+            self.root.end = self.root.subtree_end = max(span.end for span in spans)
+
+
+    def critical_path(self):
+        """
+        Method that returns the critical path of the session: the chain of
+        processes that its end waited on, as a chronological list of
+        (span, start, end) segments. Walking back from a time in a
+        process, the process is on the path down to the child subtree that
+        ended last before that time, which is followed up to the creation
+        of its root, and so on; children still running at that time do not
+        hold the process up.
+        """
+        segments = []
+        if not self.spans:
+            return segments
+        
+        # (span, time, number of the children by subtree end that can
+        # still be followed)
+        stack = [(self.root, self.root.end, len(self.root.by_end))]
+        while stack:
+            (span, t, limit) = stack.pop()
+            i = min(bisect.bisect_right(span.child_ends, t), limit)
+            if i == 0:
+                if span is not self.root and span.start < t:
+                    segments.append((span, span.start, t))
+                continue
+            child = span.by_end[i - 1]
+            if span is not self.root and child.subtree_end < t:
+                segments.append((span, child.subtree_end, t))
+            stack.append((span, child.start, i - 1))
+            stack.append((child, child.subtree_end, len(child.by_end)))
+        
+        # children that ran for no time split the segments of their parent
+        segments.reverse()
+        merged = []
+        for (span, start, end) in segments:
+            if merged and merged[-1][0] is span and merged[-1][2] == start:
+                merged[-1] = (span, merged[-1][1], end)
+            else:
+                merged.append((span, start, end))
+        return merged
+
+
+    def concurrency(self, buckets=20):
+        """
+        Method that returns the concurrency profile of the session: a dict
+        with the time (ms) spent at each number of running processes
+        ('levels'), the largest number ('peak'), the average one
+        ('average') and the average one over each of buckets slices of
+        the session ('series', as (start of slice, average) pairs).
+        """
+        start = self.root.start
+        wall_time = (self.root.end or 0) - (start or 0)
+        
+        # the session is also bounded by processes that ran for no time
+        events = [(start, 0), (self.root.end, 0)]
+        for span in self.spans:
+            if span.end > span.start:
+                events.append((span.start, 1))
+                events.append((span.end, -1))
+        events.sort()
+        
+        levels = {}
+        width = float(wall_time) / buckets
+        busy = [0.0] * buckets
+        running = 0
+        peak = 0
+        for (i, (t, delta)) in enumerate(events):
+            running += delta
+            peak = max(peak, running)
+            if i + 1 == len(events) or events[i + 1][0] == t:
+                continue
+            # running processes until the next event
+            next_t = events[i + 1][0]
+            levels[running] = levels.get(running, 0) + next_t - t
+            if running:
+                a = t - start
+                b = next_t - start
+                bucket = min(int(a / width), buckets - 1)
+                while bucket < buckets and a < b:
+                    bucket_end = (bucket + 1) * width
+                    if bucket == buckets - 1:
+                        bucket_end = b
+                    busy[bucket] += running * (min(b, bucket_end) - a)
+                    a = bucket_end
+                    bucket += 1
+        
+        average = 0.0
+        series = []
+        if wall_time:
+            average = float(sum(span.end - span.start for span in self.spans)) / wall_time
+            series = [(start + int(i * width), busy[i] / width) for i in xrange(buckets)]
+        return dict(levels=levels, peak=peak, average=average, series=series)
+
+
+    def exclusive_times(self, n=None):
+        """
+        Method that returns the (span, ms) pairs of the processes by
+        exclusive wall time, the part of their lifetime during which none
+        of their children was running, from the largest; n limits them.
+        """
+        times = []
+        for span in self.spans:
+            covered = 0
+            # children are sorted by creation time
+            a = b = span.start
+            for child in span.children:
+                child_start = max(child.start, span.start)
+                child_end = min(child.end, span.end)
+                if child_start >= child_end:
+                    continue
+                if child_start > b:
+                    covered += b - a
+                    a = child_start
+                b = max(b, child_end)
+            covered += b - a
+            times.append((span.end - span.start - covered, span))
+        
+        if n is None:
+            ranked = sorted(times, key=lambda item: item[0], reverse=True)
+        else:
+            ranked = heapq.nlargest(n, times, key=lambda item: item[0])
+        return [(span, exclusive) for (exclusive, span) in ranked]
+
+
+    def report(self, top=10, buckets=20):
+        """
+        Returns a list of lines describing the critical path, the
+        concurrency profile and the processes with the largest exclusive
+        wall time.
+        """
+        if not self.spans:
+            return ['no process with a creation time in the session']
+        
+        wall_time = self.root.end - self.root.start
+        lines = ['%d processes over %d ms' % (len(self.spans), wall_time)]
+        
+        segments = self.critical_path()
+        on_path = {}
+        for (span, start, end) in segments:
+            if span.id not in on_path:
+                on_path[span.id] = [span, 0]
+            on_path[span.id][1] += end - start
+        length = sum(end - start for (span, start, end) in segments)
+        lines.append('')
+        lines.append('critical path: %d ms over %d processes' % (length, len(on_path)))
+        for (span, ms) in heapq.nlargest(top, on_path.itervalues(), key=lambda item: item[1]):
+            lines.append('  %10d ms  %5.1f%%  %s' % (ms, 100.0 * ms / (wall_time or 1), span.describe()))
+        
+        profile = self.concurrency(buckets)
+        lines.append('')
+        lines.append('concurrency: average %.2f, peak %d' % (profile['average'], profile['peak']))
+        for level in sorted(profile['levels']):
+            ms = profile['levels'][level]
+            lines.append('  %4d running  %10d ms  %5.1f%%' % (level, ms, 100.0 * ms / (wall_time or 1)))
+        if profile['series']:
+            lines.append('  over time:')
+        for (t, average) in profile['series']:
+            lines.append('  %+10d ms  %6.2f  %s' % (t - self.root.start, average, '#' * int(round(average))))
+        
+        lines.append('')
+        lines.append('exclusive wall time:')
+        for (span, ms) in self.exclusive_times(top):
+            lines.append('  %10d ms  %s' % (ms, span.describe()))
+        return lines
+
+
+def load(storage, session_tag):
+    """
+    Returns the timeline of the processes of a session stored in the
+    database.
+    """
+    
+    decode = reprozip.utils.decode_datetime
+    spans = []
+    for doc in storage.find_processes(session_tag):
+        start = decode(doc['creation_time'])
+        if start is None:
+            continue
+        # a process that did not exit ends with its most recent event
+        end = decode(doc.get('exit_time')) or decode(doc.get('most_recent_event_timestamp')) or start
+        name = None
+        for phase in doc['phases']:
+            if phase.get('name') is not None:
+                name = phase['name']
+        spans.append(Span(doc['_id'], doc['pid'], doc['ppid'], name, start, max(start, end)))
+    return Timeline(spans)
+
+def analyze(argv=None):
+    """
+    Prints the critical path, the concurrency profile and the processes
+    with the largest exclusive wall time of a tracing session stored in
+    the database: 'reprozip analyze ...'.
+    """
+    
+    parser = argparse.ArgumentParser(prog        = 'reprozip analyze',
+                                     description = 'analyzes the critical path and the parallelism of a tracing session')
+    parser.add_argument('--session', '-s',
+                        help='the session to analyze - by default, the last one traced')
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of processes listed')
+    parser.add_argument('--buckets', type=int, default=20,
+                        help='number of time slices of the concurrency profile')
+    args = parser.parse_args(argv)
+    
+    session_tag = args.session or default_session()
+    if session_tag is None:
+        reprozip.debug.error('No session was traced; use --session.')
+        sys.exit(1)
+    
+    try:
+        storage = get_storage()
+    except:
+        sys.exit(1)
+    
+    storage.start()
+    storage.wait()
+    
+    try:
+        storage.connect()
+        timeline = load(storage, session_tag)
+        print '\n'.join(timeline.report(args.top, max(args.buckets, 1)))
+    except:
+        reprozip.debug.error(sys.exc_info()[1])
+        storage.stop()
+        sys.exit(1)
+    
+    storage.stop()
@@ -63,6 +63,22 @@ class Parser:
         config.set('mongodb', 'dbpath', reprozip.utils.mongodb_dbpath)
         config.set('mongodb', 'port', reprozip.utils.mongodb_port)
         config.set('mongodb', 'on', reprozip.utils.mongodb_on)
+        config.set('mongodb', 'idle_timeout', reprozip.utils.mongodb_idle_timeout)
+        
+        config.add_section('storage')
+        config.set('storage', 'sqlite_path', reprozip.utils.storage_sqlite_path)
+        config.set('storage', 'backend', reprozip.utils.storage_backend)
+        config.set('storage', 'in_process', reprozip.utils.storage_in_process)
+        config.set('storage', 'persist', reprozip.utils.storage_persist)
+        config.set('storage', 'indices', reprozip.utils.storage_indices)
+        config.set('storage', 'session_ttl', reprozip.utils.storage_session_ttl)
+        
+        config.add_section('tracer')
+        config.set('tracer', 'backend', reprozip.utils.tracer_backend)
+        config.set('tracer', 'compression', reprozip.utils.tracer_compression)
+        config.set('tracer', 'keep_chunks', reprozip.utils.tracer_keep_chunks)
+        config.set('tracer', 'chunk_size', reprozip.utils.tracer_chunk_size)
+        config.set('tracer', 'reorder_window', reprozip.utils.tracer_reorder_window)
         
         with open(self.__file, 'wb') as configfile:
             config.write(configfile)
@@ -72,7 +88,7 @@ class Parser:
         Reads MongoDB section in the configuration file, returning its parameters in a tuple.
         """
         
-        config = ConfigParser.RawConfigParser()
+        config = ConfigParser.RawConfigParser({'idle_timeout': reprozip.utils.mongodb_idle_timeout})
         config.read(self.__file)
         
         on = config.getboolean('mongodb', 'on')
@@ -81,6 +97,58 @@ class Parser:
         logpath = config.get('mongodb', 'logpath')
         quiet = config.getboolean('mongodb', 'quiet')
         journaling = config.getboolean('mongodb', 'journaling')
+        idle_timeout = config.getfloat('mongodb', 'idle_timeout')
+        
+        return (on, port, dbpath, logpath, quiet, journaling, idle_timeout)
+        
+        
+    def read_storage_config(self):
+        """
+        Reads storage section in the configuration file, returning its parameters in a tuple.
+        Configuration files created by older versions do not have this section,
+        so default values are used for missing parameters.
+        """
+        
+        config = ConfigParser.RawConfigParser({'backend': reprozip.utils.storage_backend,
+                                               'sqlite_path': reprozip.utils.storage_sqlite_path,
+                                               'in_process': reprozip.utils.storage_in_process,
+                                               'persist': reprozip.utils.storage_persist,
+                                               'indices': reprozip.utils.storage_indices,
+                                               'session_ttl': reprozip.utils.storage_session_ttl})
+        config.read(self.__file)
+        if not config.has_section('storage'):
+            config.add_section('storage')
+        
+        backend = config.get('storage', 'backend').lower()
+        sqlite_path = os.path.expanduser(config.get('storage', 'sqlite_path'))
+        in_process = config.getboolean('storage', 'in_process')
+        persist = config.getboolean('storage', 'persist')
+        indices = [i.strip() for i in config.get('storage', 'indices').split(',') if i.strip()]
+        session_ttl = config.getfloat('storage', 'session_ttl')
+        
+        return (backend, sqlite_path, in_process, persist, indices, session_ttl)
+        
+        
+    def read_tracer_config(self):
+        """
+        Reads tracer section in the configuration file, returning its parameters in a tuple.
+        Configuration files created by older versions do not have this section,
+        so default values are used for missing parameters.
+        """
+        
+        config = ConfigParser.RawConfigParser({'chunk_size': reprozip.utils.tracer_chunk_size,
+                                               'keep_chunks': reprozip.utils.tracer_keep_chunks,
+                                               'compression': reprozip.utils.tracer_compression,
+                                               'backend': reprozip.utils.tracer_backend,
+                                               'reorder_window': reprozip.utils.tracer_reorder_window})
+        config.read(self.__file)
+        if not config.has_section('tracer'):
+            config.add_section('tracer')
+        
+        chunk_size = config.getint('tracer', 'chunk_size')
+        keep_chunks = config.getboolean('tracer', 'keep_chunks')
+        compression = config.get('tracer', 'compression').lower()
+        backend = config.get('tracer', 'backend').lower()
+        reorder_window = config.getint('tracer', 'reorder_window')
         
-        return (on, port, dbpath, logpath, quiet, journaling)
-        
\ No newline at end of file
+        return (chunk_size, keep_chunks, compression, backend, reorder_window)
\ No newline at end of file
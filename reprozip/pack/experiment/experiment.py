@@ -36,6 +36,7 @@ from reprozip.pack.vt_workflow.workflow import VTWorkflow
 from reprozip.pack.vt_workflow.cltools_wrapper import Wrapper
 from reprozip.pack.tree.provenance_tree import Node, ProvenanceTree
 from reprozip.install.utils import guess_sudo
+from reprozip.pack import profiling
 import reprozip.debug
 import reprozip.utils
 import reprozip.install
@@ -46,7 +47,6 @@ import fnmatch
 import platform
 import subprocess
 import time
-import pymongo
 import sys
 import os
 import tarfile
@@ -54,7 +54,7 @@ import tarfile
 class Experiment:
     """
     The class Experiment represents an experiment to be reproducible.
-    Note: information about the experiment is retrieved in a MongoDB collection.
+    Note: information about the experiment is retrieved in the database (see reprozip.pack.storage).
     """
     
     def __init__(self):
@@ -132,11 +132,16 @@ class Experiment:
 
     def set_command_line_info(self, value):
         self.__command_line_info = value
+
+
+    def get_prov_tree(self):
+        return self.__prov_tree
     
     
     command_line_info = property(get_command_line_info, set_command_line_info,
                                  None, None)
     verbose = property(get_verbose, set_verbose, None, None)
+    prov_tree = property(get_prov_tree, None, None, None)
     
     
 #    def verbose_(self, args):
@@ -150,13 +155,18 @@ class Experiment:
 #            pass
     
     
-    def execute(self, working_dir, env):
+    def execute(self, working_dir, env, wrapper=None):
         """
         Method used to execute the experiment. It also records the data for
         the experiment.
+        
+        If wrapper is given, it is a list of arguments that precede the
+        command line (e.g., a tracer that runs the experiment).
         """
             
         args = self.command_line_info.split()
+        if wrapper:
+            args = wrapper + args
 
         print 'Executing the program...\n'
         print '################################################################'
@@ -177,59 +187,37 @@ class Experiment:
             raise Exception
         
     
-    def retrieve_experiment_data(self, db_name, collection_name, port):
+    def retrieve_experiment_data(self, storage):
         """
         Method used to retrieve the information about the experiment.
-        This information is obtained in a MongoDB collection.
+        This information is obtained in the database (a Storage object).
         """
         
-        # connecting to Mongo
-        reprozip.debug.verbose(self.verbose, 'Connecting to MongoDB...')
-        try:
-            conn = pymongo.MongoClient(port=int(port))
-        except:
-            reprozip.debug.error('Could not connect to MongoDB: %s' %sys.exc_info()[1])
-            raise Exception
-    
-        # accessing the database
-        reprozip.debug.verbose(self.verbose, 'Accessing the database...')
-        try:
-            db = conn[db_name]
-        except:
-            reprozip.debug.error('Could not open the database: %s' %sys.exc_info()[1])
-            conn.close()
-            raise Exception
-    
-        # accessing the collection
-        reprozip.debug.verbose(self.verbose, 'Accessing the collection...')
-        try:
-            collection = db[collection_name]
-        except:
-            reprozip.debug.error('Could not access the collection: %s' %sys.exc_info()[1])
-            conn.close()
-            raise Exception
+        # connecting to the database
+        reprozip.debug.verbose(self.verbose, 'Connecting to the database...')
+        storage.connect()
             
-        reprozip.debug.verbose(self.verbose, 'Querying the collection...')
+        reprozip.debug.verbose(self.verbose, 'Querying the database...')
         l_args = self.command_line_info.split()
         for i in range(len(l_args)):
             l_args[i] = '\"' + l_args[i] + '\"'
         n_argument = ' '.join(l_args)
         n_argument = n_argument[:-1]
-        cursor = collection.find({'phases.execve_argv':
-                                  {'$regex': n_argument + '.*' }})
-            
-        # sorting the results
-        cursor = cursor.sort('creation_time', pymongo.DESCENDING)
         
         # getting one record (assuming that the most recent record is the valid one)
         # also, if there was an error with the execution, the record is discarded
-        len_cursor = cursor.count()
-        if (len_cursor == 0):
+        exec_wf = storage.find_main_process(n_argument + '.*')
+        if exec_wf is None:
             print '** No results found **'
-            conn.close()
             raise Exception
+        exec_wf['phases'] = self.__read_phases(exec_wf, storage)
         
-        exec_wf = cursor[0]
+        # when the database can gather the files of the whole tree, the
+        # files written, directories and symbolic links of the child
+        # processes are not retrieved (see __aggregate_files)
+        process_ids = None
+        if storage.can_aggregate():
+            process_ids = [exec_wf['_id']]
             
         # getting information from the main program
         pid = int(exec_wf['pid'])
@@ -254,7 +242,6 @@ class Experiment:
             
         if main_phase_index == None:
             reprozip.debug.error('No phases found. This should not happen...')
-            conn.close()
             raise Exception
         
         execve_pwd = str(exec_wf['phases'][main_phase_index]['execve_pwd'])
@@ -333,7 +320,7 @@ class Experiment:
         # finding child processes
         reprozip.debug.verbose(self.verbose, 'Getting information of child processes...')
         try:
-            height = self.__get_child_processes(0, collection)
+            height = self.__get_child_processes(0, storage, process_ids=process_ids)
         except:
             reprozip.debug.error('Error while getting information of child processes: %s' %sys.exc_info()[1])
             raise Exception
@@ -343,13 +330,14 @@ class Experiment:
         
         # updating height of the tree
         self.__prov_tree.height = height
-                
-        conn.close()
         
         # updating root information
         reprozip.debug.verbose(self.verbose, 'Updating and traversing provenance tree...')
         if self.__prov_tree.height > 0:
-            self.__prov_tree.update_root_information()
+            files = None
+            if process_ids is not None:
+                files = self.__aggregate_files(exec_wf, process_ids, storage)
+            self.__prov_tree.update_root_information(files)
             
 #        for node in self.__prov_tree.nodes:
 #            print self.__prov_tree.nodes[node].execve_argv
@@ -853,6 +841,8 @@ class Experiment:
                     if os.path.exists(rep_file):
                         os.remove(rep_file)
                     shutil.copyfile(original_file, rep_file)
+                    profiling.count('files_copied')
+                    profiling.count('bytes_copied', os.path.getsize(rep_file))
                     
                 st = os.stat(original_file)
                 os.chmod(rep_file, st.st_mode)
@@ -1757,10 +1747,15 @@ class Experiment:
                 answer = raw_input('<warning> The package "%s" already exists. Remove it before creating the new one (Y or N)? ' % package)
             if answer.upper() == 'N':
                 sys.exit(0)
+        def measure(tarinfo):
+            profiling.count('bytes_compressed', tarinfo.size)
+            return tarinfo
+        
         try:
             tar = tarfile.open(package, 'w:gz')
-            tar.add(os.path.basename(self.__rep_dir))
+            tar.add(os.path.basename(self.__rep_dir), filter=measure)
             tar.close()
+            profiling.count('package_bytes', os.path.getsize(package))
         except:
             reprozip.debug.error('Error while packing the files: %s' % sys.exc_info()[1])
             sys.exit(1)
@@ -1938,28 +1933,138 @@ class Experiment:
         print '** Configuration file created in "%s" **' % reprozip.utils.config_path
                         
 
-    def __get_child_processes(self, id, db_collection, depth=1):
+    def __read_phases(self, exec_wf, storage):
+        """
+        Method that returns the phases of a process as stored by earlier
+        versions, with filenames and datetimes. Processes stored in the
+        compact schema (see reprozip.pack.store_data) refer to the path
+        dictionary of their session, and may have overflow documents.
+        """
+        
+        phases = exec_wf['phases']
+        
+        # lists left out by the database (see Storage.find_child_processes)
+        for phase in phases:
+            for key in ('files_read', 'files_written', 'files_renamed', 'directories', 'symlinks', 'io'):
+                phase.setdefault(key, None)
+        
+        if exec_wf.get('schema', 1) < 2:
+            return phases
+        
+        if exec_wf.get('overflow'):
+            for overflow in storage.find_overflow(exec_wf['_id']):
+                entries = phases[overflow['phase']][overflow['key']]
+                if entries is not None:
+                    entries.extend(overflow['entries'])
+        
+        ids = set()
+        for phase in phases:
+            for key in ('files_read', 'files_written', 'directories'):
+                for (path_id, t) in phase[key] or []:
+                    ids.add(path_id)
+            for (t, old, new) in phase['files_renamed'] or []:
+                ids.add(old)
+                ids.add(new)
+            for (symlink, target) in phase['symlinks'] or []:
+                ids.add(symlink)
+                ids.add(target)
+            for counters in phase['io'] or []:
+                ids.add(counters[0])
+        path = storage.find_paths(exec_wf['session_tag'], ids)
+        
+        def timestamp(t):
+            if isinstance(t, list):
+                return [reprozip.utils.encode_datetime(e) for e in t]
+            return reprozip.utils.encode_datetime(t)
+        
+        def entries(l, name):
+            if not l:
+                return None
+            return [{name: path[path_id], 'timestamp': timestamp(t)} for (path_id, t) in l]
+        
+        ret = []
+        for phase in phases:
+            renames = phase['files_renamed']
+            if renames:
+                renames = [dict(timestamp=timestamp(t), old_filename=path[old], new_filename=path[new])
+                           for (t, old, new) in renames]
+            symlinks = phase['symlinks']
+            if symlinks:
+                symlinks = [dict(symlink=path[symlink], target=path[target])
+                            for (symlink, target) in symlinks]
+            io = phase['io']
+            if io:
+                io = [dict(filename=path[path_id], bytes_read=bytes_read, reads=reads,
+                           bytes_written=bytes_written, writes=writes)
+                      for (path_id, bytes_read, reads, bytes_written, writes) in io]
+            ret.append(dict(name=phase['name'],
+                            start_time=timestamp(phase['start_time']),
+                            execve_filename=phase['execve_filename'],
+                            execve_pwd=phase['execve_pwd'],
+                            execve_argv=phase['execve_argv'],
+                            execve_env=phase['execve_env'],
+                            files_read=entries(phase['files_read'], 'filename'),
+                            files_written=entries(phase['files_written'], 'filename'),
+                            files_renamed=renames or None,
+                            directories=entries(phase['directories'], 'dirname'),
+                            symlinks=symlinks or None,
+                            io=io or None))
+        return ret
+        
+    def __aggregate_files(self, exec_wf, process_ids, storage):
+        """
+        Method that returns the files of the given processes, gathered by
+        the database, with the path ids of the compact schema resolved.
+        """
+        
+        files = storage.aggregate_files(process_ids)
+        
+        ids = set()
+        for key in ('files_read', 'files_written', 'directories'):
+            ids.update(f for f in files[key] if isinstance(f, (int, long)))
+        for (symlink, target) in files['symlinks'].iteritems():
+            ids.update(f for f in (symlink, target) if isinstance(f, (int, long)))
+        path = {}
+        if ids:
+            path = storage.find_paths(exec_wf['session_tag'], ids)
+        
+        def name(f):
+            if isinstance(f, (int, long)):
+                return path[f]
+            return f
+        
+        ret = {}
+        for key in ('files_read', 'files_written', 'directories'):
+            ret[key] = set(name(f) for f in files[key] if f is not None)
+        ret['symlinks'] = dict((name(symlink), name(target))
+                               for (symlink, target) in files['symlinks'].iteritems()
+                               if symlink is not None)
+        return ret
+        
+    def __get_child_processes(self, id, storage, depth=1, process_ids=None):
         """
         Recursive method to get all the child processes.
         It returns the depth of the recursion.
+        If process_ids is a list, the ids of the child processes are
+        appended to it, and their lists of files are only partially
+        retrieved (see Storage.find_child_processes).
         """
         
         current_ppid = self.__prov_tree.nodes[id].pid    
-        cursor = db_collection.find({'$and': [
-                                              {'ppid': current_ppid},
-                                              {'creation_time': {'$gte': self.__start_time}}
-                                              ]})
-        
-        # checking if cursor is empty
-        len_cursor = cursor.count()
-        if len_cursor == 0:
+        children = storage.find_child_processes(current_ppid, self.__start_time,
+                                                process_ids is not None)
+        
+        # checking if there are no child processes
+        if not children:
             return (depth - 1)
             
         depths = []
-        for i in range(len_cursor):
-            exec_wf = cursor[i]
+        for exec_wf in children:
             
             c_pid = int(exec_wf['pid'])
+            exec_wf['phases'] = self.__read_phases(exec_wf, storage)
+            if process_ids is not None:
+                process_ids.append(exec_wf['_id'])
             
             # a process may have more than one phase
             # when this happens, it morphs from one executable to another
@@ -2019,8 +2124,8 @@ class Experiment:
             if not main_id:
                 continue
             
-            depths.append(self.__get_child_processes(main_id, db_collection,
-                                                     depth + 1))
+            depths.append(self.__get_child_processes(main_id, storage,
+                                                     depth + 1, process_ids))
         
         if not depths:
             depths.append(0)
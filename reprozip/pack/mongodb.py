@@ -35,14 +35,109 @@
 from reprozip.pack.config_parser import Parser
 from reprozip.install.utils import guess_sudo
 import reprozip.debug
+import reprozip.utils
 import subprocess
+import socket
+import time
 import sys
 import os
 
+from pymongo import MongoClient
+
+# time (in seconds) waited for mongod to accept connections
+START_TIMEOUT = 30
+
+def clients_dir(port):
+    """
+    Returns the directory where the processes of ReproZip that use the
+    mongod instance on port register themselves (see Mongod.run).
+    """
+    
+    return os.path.join(reprozip.utils.log_basedir(), 'mongod-%s' % port)
+
+def active_clients(port):
+    """
+    Returns the number of processes of ReproZip that use the mongod
+    instance on port, forgetting the ones that died without unregistering.
+    """
+    
+    d = clients_dir(port)
+    if not os.path.isdir(d):
+        return 0
+    
+    n = 0
+    for name in os.listdir(d):
+        if not name.isdigit():
+            continue
+        try:
+            os.kill(int(name), 0)
+            n += 1
+        except OSError:
+            os.remove(os.path.join(d, name))
+    return n
+
+def ping(port):
+    """
+    Health check of the mongod instance on port: returns a client connected
+    to it, or None if it does not answer.
+    """
+    
+    # nothing listening: fail early, without waiting for pymongo timeouts
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.settimeout(1)
+    try:
+        try:
+            s.connect(('localhost', int(port)))
+        except socket.error:
+            return None
+    finally:
+        s.close()
+    
+    try:
+        client = MongoClient(port=int(port), connectTimeoutMS=1000)
+        client.admin.command('ping')
+    except:
+        return None
+    return client
+
+def watch_idle(port, idle_timeout):
+    """
+    Shuts down the mongod instance on port once no process of ReproZip has
+    used it for idle_timeout minutes. Runs in a process of its own, started
+    by Mongod.run, which ends with mongod.
+    """
+    
+    idle_timeout = idle_timeout * 60
+    last_used = os.path.join(clients_dir(port), 'last-used')
+    while True:
+        time.sleep(min(idle_timeout, 60))
+        
+        client = ping(port)
+        if client is None:
+            return # stopped by someone else
+        
+        try:
+            idle = time.time() - os.path.getmtime(last_used)
+        except OSError:
+            idle = idle_timeout
+        
+        if active_clients(port) or idle < idle_timeout:
+            client.close()
+            continue
+        
+        try:
+            client.admin.command('shutdown')
+        except:
+            pass # the connection is closed by the shutdown
+        return
+
 class Mongod:
     """
     Class that represents an access to a mongod instance.
-    It handles the execution and end of such instance.
+    It handles the execution and end of such instance: an instance that is
+    already running on the configured port is reused, and an instance
+    started by ReproZip is kept running for idle_timeout minutes after its
+    last use, so that the next packing step does not wait for it.
     """
     
     def __init__(self):
@@ -51,6 +146,8 @@ class Mongod:
         """
         
         self.__mongodb = None
+        self.__client = None
+        self.__registered = False
         
         self.__on = None
         self.__port = None
@@ -58,22 +155,30 @@ class Mongod:
         self.__logpath = None
         self.__quiet = None
         self.__journaling = None
+        self.__idle_timeout = None
         
         parser = Parser()
         t = parser.read_mongodb_config()
-        (self.__on, self.__port, self.__dbpath, self.__logpath, self.__quiet, self.__journaling) = t
+        (self.__on, self.__port, self.__dbpath, self.__logpath, self.__quiet,
+         self.__journaling, self.__idle_timeout) = t
 
     def get_port(self):
         return self.__port
 
     def run(self):
         """
-        Runs a mongod instance.
+        Runs a mongod instance, unless there is one running on the port.
         """
         
         if not self.__on:
             return
         
+        self.__register()
+        
+        self.__client = ping(self.__port)
+        if self.__client is not None:
+            return
+        
         quiet = ' --quiet'
         if not self.__quiet:
             quiet = ''
@@ -95,16 +200,79 @@ class Mongod:
             sys.exit(1)
             
         self.__mongodb.wait()
+        
+        # the instance outlives this process, until it is idle
+        if self.__idle_timeout > 0:
+            try:
+                subprocess.Popen([sys.executable, '-m', 'reprozip.pack.mongodb',
+                                  self.__port, str(self.__idle_timeout)],
+                                 stdin=open(os.devnull),
+                                 stdout=open(os.devnull, 'w'),
+                                 stderr=subprocess.STDOUT,
+                                 close_fds=True,
+                                 preexec_fn=os.setsid)
+            except:
+                reprozip.debug.warning('Could not start the idle timer of mongod: %s' %sys.exc_info()[1])
+                self.__idle_timeout = 0
+    
+    def __register(self):
+        d = clients_dir(self.__port)
+        if not os.path.isdir(d):
+            os.makedirs(d)
+        open(os.path.join(d, str(os.getpid())), 'w').close()
+        self.__registered = True
+    
+    def __unregister(self):
+        if not self.__registered:
+            return
+        d = clients_dir(self.__port)
+        try:
+            os.remove(os.path.join(d, str(os.getpid())))
+        except OSError:
+            pass
+        open(os.path.join(d, 'last-used'), 'w').close()
+        self.__registered = False
+    
+    def wait(self):
+        """
+        Waits for the mongod instance to answer the health check.
+        """
+        
+        for i in range(START_TIMEOUT * 2):
+            if self.__client is None:
+                self.__client = ping(self.__port)
+            if self.__client is not None:
+                return
+            time.sleep(0.5)
+        
+        reprozip.debug.warning('mongod is not answering on port %s' %self.__port)
+    
+    def get_client(self):
+        """
+        Returns the client connected to the mongod instance, which is shared
+        by all the users of the database in this process.
+        """
+        
+        if self.__client is None:
+            self.__client = MongoClient(port=int(self.__port))
+        return self.__client
             
     def stop(self):
         """
-        Tries to stop the mongod instance.
+        Closes the client and, unless the instance is kept running until it
+        is idle, tries to stop the mongod instance.
         """
         
+        if self.__client is not None:
+            self.__client.close()
+            self.__client = None
+        
         if not self.__on:
             return
         
-        if (self.__mongodb == None):
+        self.__unregister()
+        
+        if (self.__mongodb == None) or (self.__idle_timeout > 0):
             pass
         else:
             cmd = guess_sudo() + ' mongod --shutdown --dbpath ' + self.__dbpath
@@ -117,8 +285,10 @@ class Mongod:
                 msg += 'You may want to try stopping it by running "%s"' %cmd
                 reprozip.debug.warning(msg)
                 
-            self.__mongodb = None
+        self.__mongodb = None
     
     port = property(get_port, None, None, None)
-                
-    
\ No newline at end of file
+    client = property(get_client, None, None, None)
+
+if __name__ == '__main__':
+    watch_idle(sys.argv[1], float(sys.argv[2]))
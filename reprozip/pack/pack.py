@@ -33,19 +33,30 @@
 ###############################################################################
 
 from reprozip.pack.experiment.experiment import Experiment
-from reprozip.pack.mongodb import Mongod
+from reprozip.pack.storage import get_storage, AsyncStorage
+from reprozip.pack.config_parser import Parser
+from reprozip.pack.sessions import prune_sessions
 from reprozip.pack.tracer import Tracer
 from reprozip.install.utils import guess_os
+from reprozip.pack import profiling
 import reprozip.debug
 import reprozip.utils
 import inspect
 import pickle
 import argparse
-import time
 import sys
 import os
 
 
+def stop_storage(storage):
+    """
+    Stops the database, if there is one.
+    """
+    
+    if storage is not None:
+        storage.stop()
+
+
 def pack(args):
     
     # tracer information
@@ -73,51 +84,91 @@ def pack(args):
         
         rep_experiment.command_line_info = args['command']
         
-        # initializing mongod instance
-        reprozip.debug.verbose(args['verbose'], 'Initializing MongoDB instance...')
-        mongod = Mongod()
-        mongod.run()
+        # with the in-process path, the provenance of an experiment that is
+        # traced now is built from the processes kept in memory, and the
+        # database (if persist is set) is written in background
+        try:
+            (backend, sqlite_path, in_process, persist, indices, session_ttl) = Parser().read_storage_config()
+        except:
+            reprozip.debug.error('Could not read the configuration file: %s' % sys.exc_info()[1])
+            sys.exit(1)
+        in_process = in_process and args['execute']
+        
+        # initializing the database (and its mongod instance, if any)
+        storage = None
+        if persist or not in_process:
+            reprozip.debug.verbose(args['verbose'], 'Initializing database...')
+            with profiling.stage('database_start'):
+                try:
+                    storage = get_storage()
+                except:
+                    sys.exit(1)
+                storage.start()
+                if in_process:
+                    storage = AsyncStorage(storage)
             
         if args['execute']:
-            main_tracer = Tracer(log_basedir = reprozip.utils.log_basedir(),
-                                 pass_lite   = PASS_LITE)
+            main_tracer = Tracer(log_basedir    = reprozip.utils.log_basedir(),
+                                 pass_lite      = PASS_LITE,
+                                 verbose        = args['verbose'],
+                                 backend        = args['tracer'],
+                                 keep_processes = in_process)
             
             try:
-                reprozip.debug.verbose(args['verbose'], 'Initializing tracer...')
-                main_tracer.run_tracer()
-                
-                rep_experiment.execute(args['wdir'], args['env'])
+                with profiling.stage('trace'):
+                    reprozip.debug.verbose(args['verbose'], 'Initializing tracer...')
+                    main_tracer.run_tracer(storage=storage)
+                    
+                    rep_experiment.execute(args['wdir'],
+                                           main_tracer.get_experiment_env(args['env'],
+                                                                          args['command']),
+                                           main_tracer.get_experiment_wrapper())
+                    
+                    reprozip.debug.verbose(args['verbose'], 'Stopping tracer...')
+                    #main_tracer.check_tracer()
+                    main_tracer.stop_tracer()
                 
-                reprozip.debug.verbose(args['verbose'], 'Stopping tracer...')
-                #main_tracer.check_tracer()
-                main_tracer.stop_tracer()
-                
-                reprozip.debug.verbose(args['verbose'], 'Storing provenance in MongoDB...')
-                main_tracer.store_process_data(port=mongod.port)
+                with profiling.stage('ingest'):
+                    reprozip.debug.verbose(args['verbose'], 'Storing provenance in the database...')
+                    main_tracer.store_process_data(storage)
             except:
                 main_tracer.stop_tracer()
-                mongod.stop()
+                stop_storage(storage)
                 sys.exit(1)
+            
+            # removing the sessions that expired
+            if session_ttl > 0:
+                try:
+                    for session_tag in prune_sessions(storage, session_ttl):
+                        reprozip.debug.verbose(args['verbose'], 'Removed expired session %s' %session_tag)
+                except:
+                    reprozip.debug.warning('Could not remove expired sessions: %s' %sys.exc_info()[1])
         else:
-            # give mongod some time to begin
-            time.sleep(3)
+            storage.wait()
             
         # retrieving data
         try:
             reprozip.debug.verbose(args['verbose'], 'Starting retrieval of experiment data...')
-            rep_experiment.retrieve_experiment_data(db_name         = reprozip.utils.mongodb_database,
-                                                    collection_name = reprozip.utils.mongodb_collection,
-                                                    port            = mongod.port)
+            with profiling.stage('retrieve'):
+                if in_process:
+                    rep_experiment.retrieve_experiment_data(main_tracer.get_processes())
+                else:
+                    rep_experiment.retrieve_experiment_data(storage)
         except:
-            mongod.stop()
+            stop_storage(storage)
             sys.exit(1)
         
-        # stopping mongod instance
-        reprozip.debug.verbose(args['verbose'], 'Stopping MongoDB instance...')
-        mongod.stop()
+        # stopping the database (and its mongod instance, if any); in-process,
+        # the database is still being written while the experiment is
+        # configured
+        if not in_process:
+            reprozip.debug.verbose(args['verbose'], 'Stopping database...')
+            with profiling.stage('database_stop'):
+                stop_storage(storage)
         
         # configuring
-        rep_experiment.configure()
+        with profiling.stage('configure'):
+            rep_experiment.configure()
         
         # pickling object structures
         try:
@@ -128,6 +179,14 @@ def pack(args):
             reprozip.debug.error('Could not serialize object structures: %s' % sys.exc_info()[1])
             sys.exit(1)
         
+        if in_process:
+            reprozip.debug.verbose(args['verbose'], 'Waiting for the database...')
+            try:
+                with profiling.stage('database_stop'):
+                    stop_storage(storage)
+            except:
+                sys.exit(1)
+        
     # generation mode
     else:
         # de-serializing object structures
@@ -142,10 +201,13 @@ def pack(args):
         rep_experiment.verbose = args['verbose']
         
         # processing configuration file
-        rep_experiment.process_config_file()
+        with profiling.stage('process_config_file'):
+            rep_experiment.process_config_file()
     
         # generating VisTrails workflow
-        rep_experiment.generate_reproducible_experiment(args['name'])
+        with profiling.stage('generate_reproducible_experiment'):
+            rep_experiment.generate_reproducible_experiment(args['name'])
         
         # packing everything in a zip file
-        rep_experiment.pack()
+        with profiling.stage('pack'):
+            rep_experiment.pack()
@@ -0,0 +1,1265 @@
+/*
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+*/
+
+/*
+ * LD_PRELOAD shim that records the system calls of an experiment in the
+ * same format as pass-lite.stp, without root privileges or SystemTap.
+ *
+ * Intercepted calls: open/openat/creat/fopen, execve (and the exec*
+ * family), fork/vfork, rename/renameat, readlink/readlinkat (SYMLINK
+ * records), chdir/fchdir, close/dup/dup2/dup3 and exit.
+ *
+ * Only the processes of the experiment load the shim, so there is no
+ * overhead for the rest of the system. Each process buffers its records
+ * and appends them to the log (REPROZIP_PRELOAD_LOG) with a single write
+ * when the buffer is full, before fork/execve, and at exit.
+ *
+ * Build:
+ *   cc -shared -fPIC -O2 -o libpasslite.so pass-lite-preload.c -ldl
+ *
+ * Limitations: calls made inside libc (e.g., the execve of posix_spawn)
+ * and statically-linked or setuid programs are not seen. Processes that
+ * are executed without a preceding execve record write their own EXECVE
+ * record when the shim is loaded.
+ */
+
+#define _GNU_SOURCE
+#include <dlfcn.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <limits.h>
+#include <stdarg.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <sys/prctl.h>
+#include <sys/resource.h>
+#include <sys/stat.h>
+#include <sys/time.h>
+#include <sys/types.h>
+
+/* path of the log file */
+#define LOG_ENV "REPROZIP_PRELOAD_LOG"
+/* argv of the experiment, for the first process */
+#define ARGV_ENV "REPROZIP_PRELOAD_ARGV"
+/* pid of a process whose EXECVE record was written before execve */
+#define EXECVE_ENV "REPROZIP_PRELOAD_EXECVE"
+/* prefix of the variables above, which are not recorded */
+#define ENV_PREFIX "REPROZIP_PRELOAD_"
+
+#define BUF_SIZE (64 * 1024)
+/* the log is moved to a high fd, out of the way of the experiment */
+#define LOG_FD_MIN 900
+
+/* double-pipe delimiter and environment separators of pass-lite.stp */
+#define SEP_ENV "&&=&&"
+#define SEP_ENVS "&_&&_&"
+
+extern char **environ;
+
+static char buf[BUF_SIZE];
+static size_t buf_len = 0;
+static volatile int buf_lock = 0;
+
+static int log_fd = -1;
+static dev_t log_dev;
+static ino_t log_ino;
+static char log_path[PATH_MAX];
+
+static char comm[17];
+static char shim_path[PATH_MAX];
+static int exited = 0;
+
+/* set while the shim itself is running, so that it is not traced */
+static __thread int in_shim = 0;
+
+/* real functions */
+#define REAL(name) real_##name
+#define RESOLVE(name) \
+    if (!REAL(name)) REAL(name) = dlsym(RTLD_NEXT, #name)
+
+static int (*REAL(open))(const char *, int, ...);
+static int (*REAL(open64))(const char *, int, ...);
+static int (*REAL(openat))(int, const char *, int, ...);
+static int (*REAL(openat64))(int, const char *, int, ...);
+static int (*REAL(__open_2))(const char *, int);
+static int (*REAL(__open64_2))(const char *, int);
+static int (*REAL(__openat_2))(int, const char *, int);
+static int (*REAL(__openat64_2))(int, const char *, int);
+static int (*REAL(creat))(const char *, mode_t);
+static int (*REAL(creat64))(const char *, mode_t);
+static FILE *(*REAL(fopen))(const char *, const char *);
+static FILE *(*REAL(fopen64))(const char *, const char *);
+static FILE *(*REAL(freopen))(const char *, const char *, FILE *);
+static FILE *(*REAL(freopen64))(const char *, const char *, FILE *);
+static int (*REAL(execve))(const char *, char *const [], char *const []);
+static int (*REAL(execv))(const char *, char *const []);
+static int (*REAL(execvp))(const char *, char *const []);
+static int (*REAL(execvpe))(const char *, char *const [], char *const []);
+static pid_t (*REAL(fork))(void);
+static int (*REAL(rename))(const char *, const char *);
+static int (*REAL(renameat))(int, const char *, int, const char *);
+static int (*REAL(renameat2))(int, const char *, int, const char *, unsigned int);
+static ssize_t (*REAL(readlink))(const char *, char *, size_t);
+static ssize_t (*REAL(readlinkat))(int, const char *, char *, size_t);
+static int (*REAL(chdir))(const char *);
+static int (*REAL(fchdir))(int);
+static int (*REAL(close))(int);
+static int (*REAL(dup))(int);
+static int (*REAL(dup2))(int, int);
+static int (*REAL(dup3))(int, int, int);
+static void (*REAL(_exit))(int) __attribute__((noreturn));
+static void (*REAL(_Exit))(int) __attribute__((noreturn));
+
+
+/***************************************************************************
+ * records
+ ***************************************************************************/
+
+/* a record being built; records that fit in the stack buffer never touch
+   the heap */
+struct record {
+    char *data;
+    size_t len;
+    size_t cap;
+    char stack[2 * PATH_MAX + 256];
+};
+
+static void rec_init(struct record *r)
+{
+    r->data = r->stack;
+    r->len = 0;
+    r->cap = sizeof(r->stack);
+}
+
+static void rec_free(struct record *r)
+{
+    if (r->data != r->stack)
+        free(r->data);
+}
+
+static int rec_reserve(struct record *r, size_t extra)
+{
+    char *data;
+    size_t cap;
+
+    if (r->len + extra < r->cap)
+        return 1;
+    cap = r->cap;
+    while (r->len + extra >= cap)
+        cap *= 2;
+    if (r->data == r->stack) {
+        data = malloc(cap);
+        if (data)
+            memcpy(data, r->stack, r->len);
+    } else {
+        data = realloc(r->data, cap);
+    }
+    if (!data)
+        return 0;
+    r->data = data;
+    r->cap = cap;
+    return 1;
+}
+
+static void rec_append(struct record *r, const char *s, size_t n)
+{
+    if (!rec_reserve(r, n + 1))
+        return;
+    memcpy(r->data + r->len, s, n);
+    r->len += n;
+    r->data[r->len] = '\0';
+}
+
+static void rec_puts(struct record *r, const char *s)
+{
+    rec_append(r, s, strlen(s));
+}
+
+static void rec_printf(struct record *r, const char *fmt, ...)
+{
+    va_list ap;
+    int n;
+
+    va_start(ap, fmt);
+    n = vsnprintf(r->data + r->len, r->cap - r->len, fmt, ap);
+    va_end(ap);
+    if (n < 0)
+        return;
+    if ((size_t)n >= r->cap - r->len) {
+        if (!rec_reserve(r, n + 1))
+            return;
+        va_start(ap, fmt);
+        vsnprintf(r->data + r->len, r->cap - r->len, fmt, ap);
+        va_end(ap);
+    }
+    r->len += n;
+}
+
+/* same header as print_header() in pass-lite.stp */
+static void rec_header(struct record *r)
+{
+    struct timeval tv;
+
+    gettimeofday(&tv, NULL);
+    rec_printf(r, "%lld||%d||%d||%d||%s||",
+               (long long)tv.tv_sec * 1000 + tv.tv_usec / 1000,
+               (int)getpid(), (int)getppid(), (int)getuid(), comm);
+}
+
+
+/***************************************************************************
+ * log
+ ***************************************************************************/
+
+static void lock(void)
+{
+    while (__sync_lock_test_and_set(&buf_lock, 1))
+        ;
+}
+
+static void unlock(void)
+{
+    __sync_lock_release(&buf_lock);
+}
+
+static void open_log(void)
+{
+    struct stat st;
+    int fd;
+
+    RESOLVE(open);
+    fd = REAL(open)(log_path, O_WRONLY | O_APPEND | O_CREAT | O_CLOEXEC, 0644);
+    if (fd < 0)
+        return;
+    log_fd = fcntl(fd, F_DUPFD_CLOEXEC, LOG_FD_MIN);
+    RESOLVE(close);
+    REAL(close)(fd);
+    if (log_fd >= 0 && fstat(log_fd, &st) == 0) {
+        log_dev = st.st_dev;
+        log_ino = st.st_ino;
+    }
+}
+
+/* the experiment may have closed (and reused) the fd of the log */
+static int check_log(void)
+{
+    struct stat st;
+
+    if (log_fd >= 0 && fstat(log_fd, &st) == 0 &&
+        st.st_dev == log_dev && st.st_ino == log_ino)
+        return 1;
+    open_log();
+    return log_fd >= 0;
+}
+
+static void write_all(const char *data, size_t len)
+{
+    ssize_t n;
+
+    while (len > 0) {
+        n = write(log_fd, data, len);
+        if (n < 0) {
+            if (errno == EINTR)
+                continue;
+            return;
+        }
+        data += n;
+        len -= n;
+    }
+}
+
+/* must be called with the lock held */
+static void flush_locked(void)
+{
+    int saved_errno = errno;
+
+    if (buf_len > 0 && check_log())
+        write_all(buf, buf_len);
+    buf_len = 0;
+    errno = saved_errno;
+}
+
+static void flush(void)
+{
+    lock();
+    flush_locked();
+    unlock();
+}
+
+/* records are committed as a whole, so that lines of a record are never
+   interleaved with records of other threads */
+static void rec_commit(struct record *r)
+{
+    int saved_errno = errno;
+
+    lock();
+    if (buf_len + r->len > BUF_SIZE)
+        flush_locked();
+    if (r->len > BUF_SIZE) {
+        if (check_log())
+            write_all(r->data, r->len);
+    } else {
+        memcpy(buf + buf_len, r->data, r->len);
+        buf_len += r->len;
+    }
+    unlock();
+    rec_free(r);
+    errno = saved_errno;
+}
+
+static int tracing(void)
+{
+    return log_fd >= 0 && !in_shim;
+}
+
+
+/***************************************************************************
+ * helpers
+ ***************************************************************************/
+
+static int fd_path(int fd, char *out)
+{
+    char link[64];
+    ssize_t n;
+
+    RESOLVE(readlink);
+    snprintf(link, sizeof(link), "/proc/self/fd/%d", fd);
+    n = REAL(readlink)(link, out, PATH_MAX - 1);
+    if (n < 0)
+        return 0;
+    out[n] = '\0';
+    return 1;
+}
+
+/* absolute path of path, relative to dirfd (not normalized) */
+static int abs_path(int dirfd, const char *path, char *out)
+{
+    char dir[PATH_MAX];
+
+    if (path[0] == '/') {
+        snprintf(out, PATH_MAX, "%s", path);
+        return 1;
+    }
+    if (dirfd == AT_FDCWD) {
+        if (!getcwd(dir, sizeof(dir)))
+            return 0;
+    } else if (!fd_path(dirfd, dir)) {
+        return 0;
+    }
+    return snprintf(out, PATH_MAX, "%s/%s", dir, path) < PATH_MAX;
+}
+
+static const char *open_mode(int flags)
+{
+    switch (flags & O_ACCMODE) {
+    case O_RDWR:
+        return "READWRITE";
+    case O_WRONLY:
+        return "WRITE";
+    default:
+        return "READ";
+    }
+}
+
+static int fopen_flags(const char *mode)
+{
+    if (strchr(mode, '+'))
+        return O_RDWR;
+    if (mode[0] == 'r')
+        return O_RDONLY;
+    return O_WRONLY;
+}
+
+/* OPEN_ABSPATH, which always precedes OPEN_*, and OPEN_* / OPEN_AT_* */
+static void record_open(int dirfd, const char *path, int flags, int fd)
+{
+    struct record r;
+    char abspath[PATH_MAX];
+    char dir[PATH_MAX];
+
+    if (!tracing() || fd < 0 || !path)
+        return;
+    in_shim = 1;
+    if (fd_path(fd, abspath) && abspath[0] == '/') {
+        rec_init(&r);
+        rec_header(&r);
+        rec_printf(&r, "OPEN_ABSPATH||%s\n", abspath);
+        rec_header(&r);
+        if (dirfd == AT_FDCWD || path[0] == '/' || !fd_path(dirfd, dir))
+            rec_printf(&r, "OPEN_%s||%s||%d\n", open_mode(flags), path, fd);
+        else
+            rec_printf(&r, "OPEN_AT_%s||%s||%s||%d\n", open_mode(flags), path, dir, fd);
+        rec_commit(&r);
+    }
+    in_shim = 0;
+}
+
+static int is_shim_variable(const char *var)
+{
+    return strncmp(var, ENV_PREFIX, strlen(ENV_PREFIX)) == 0;
+}
+
+/* environment in the format of pass-lite.stp, without the variables of
+   the shim */
+static void rec_env(struct record *r, char *const envp[])
+{
+    const char *eq, *value;
+    char *preload, *tok, *save;
+    int first;
+
+    for (; envp && *envp; envp++) {
+        eq = strchr(*envp, '=');
+        if (!eq || is_shim_variable(*envp))
+            continue;
+        value = eq + 1;
+        if (strncmp(*envp, "LD_PRELOAD=", 11) == 0) {
+            /* keep whatever was preloaded besides the shim */
+            preload = strdup(value);
+            if (!preload)
+                continue;
+            first = 1;
+            for (tok = strtok_r(preload, ": ", &save); tok; tok = strtok_r(NULL, ": ", &save)) {
+                if (strcmp(tok, shim_path) == 0)
+                    continue;
+                if (first)
+                    rec_puts(r, "LD_PRELOAD" SEP_ENV);
+                else
+                    rec_puts(r, ":");
+                rec_puts(r, tok);
+                first = 0;
+            }
+            if (!first)
+                rec_puts(r, SEP_ENVS);
+            free(preload);
+            continue;
+        }
+        rec_append(r, *envp, eq - *envp);
+        rec_puts(r, SEP_ENV);
+        rec_puts(r, value);
+        rec_puts(r, SEP_ENVS);
+    }
+}
+
+/* argv in the format of pass-lite.stp: "arg0" "arg1" ... */
+static void rec_argv(struct record *r, char *const argv[])
+{
+    int i;
+
+    for (i = 0; argv && argv[i]; i++) {
+        rec_puts(r, i ? " \"" : "\"");
+        rec_puts(r, argv[i]);
+        rec_puts(r, "\"");
+    }
+}
+
+static void record_execve(const char *filename, char *const argv[], char *const envp[])
+{
+    struct record r;
+    char pwd[PATH_MAX];
+
+    if (!getcwd(pwd, sizeof(pwd)))
+        pwd[0] = '\0';
+    rec_init(&r);
+    rec_header(&r);
+    rec_printf(&r, "EXECVE||%s||%s||", pwd, filename);
+    rec_env(&r, envp);
+    rec_puts(&r, "||");
+    rec_argv(&r, argv);
+    rec_puts(&r, "\n");
+    rec_commit(&r);
+}
+
+static void record_simple(const char *fmt, ...)
+{
+    struct record r;
+    char line[2 * PATH_MAX + 64];
+    va_list ap;
+
+    va_start(ap, fmt);
+    vsnprintf(line, sizeof(line), fmt, ap);
+    va_end(ap);
+
+    rec_init(&r);
+    rec_header(&r);
+    rec_puts(&r, line);
+    rec_commit(&r);
+}
+
+/* EXECVE record of a process whose execve was not seen, built from /proc */
+static void record_current_image(void)
+{
+    struct record r;
+    char pwd[PATH_MAX];
+    char exe[PATH_MAX];
+    char cmdline[16 * 1024];
+    const char *root_argv;
+    ssize_t n, i;
+    int fd;
+
+    if (!getcwd(pwd, sizeof(pwd)))
+        pwd[0] = '\0';
+    n = REAL(readlink)("/proc/self/exe", exe, sizeof(exe) - 1);
+    exe[n < 0 ? 0 : n] = '\0';
+
+    rec_init(&r);
+    rec_header(&r);
+    rec_printf(&r, "EXECVE||%s||%s||", pwd, exe);
+    rec_env(&r, environ);
+    rec_puts(&r, "||");
+
+    root_argv = getenv(ARGV_ENV);
+    if (root_argv) {
+        /* the experiment itself: use its command line rather than the
+           one of the interpreter, for scripts */
+        rec_puts(&r, root_argv);
+        unsetenv(ARGV_ENV);
+    } else {
+        RESOLVE(open);
+        RESOLVE(close);
+        fd = REAL(open)("/proc/self/cmdline", O_RDONLY | O_CLOEXEC);
+        n = fd < 0 ? 0 : read(fd, cmdline, sizeof(cmdline) - 1);
+        if (fd >= 0)
+            REAL(close)(fd);
+        for (i = 0; i < n; ) {
+            rec_puts(&r, i ? " \"" : "\"");
+            rec_puts(&r, cmdline + i);
+            rec_puts(&r, "\"");
+            i += strlen(cmdline + i) + 1;
+        }
+    }
+    rec_puts(&r, "\n");
+    rec_commit(&r);
+}
+
+/* value of the line starting with name in a file of /proc, or -1 */
+static long long io_counter(const char *io, const char *name)
+{
+    size_t len = strlen(name);
+    const char *line;
+
+    for (line = io; line; line = strchr(line, '\n')) {
+        if (*line == '\n')
+            line++;
+        if (strncmp(line, name, len) == 0)
+            return strtoll(line + len, NULL, 10);
+    }
+    return -1;
+}
+
+static long long tv_ms(struct timeval tv)
+{
+    return (long long)tv.tv_sec * 1000 + tv.tv_usec / 1000;
+}
+
+static void record_exit(int status)
+{
+    struct rusage ru;
+    char io[1024];
+    ssize_t n = 0;
+    int fd;
+
+    if (exited || log_fd < 0)
+        return;
+    exited = 1;
+    in_shim = 1;
+
+    /* resource usage of the process, as in pass-lite.stp; the io file of
+       the process would count the children it waited for */
+    if (getrusage(RUSAGE_SELF, &ru) != 0) {
+        record_simple("EXIT_GROUP||%d\n", status);
+        flush();
+        return;
+    }
+    RESOLVE(open);
+    RESOLVE(close);
+    snprintf(io, sizeof(io), "/proc/self/task/%d/io", (int)getpid());
+    fd = REAL(open)(io, O_RDONLY | O_CLOEXEC);
+    if (fd >= 0) {
+        n = read(fd, io, sizeof(io) - 1);
+        REAL(close)(fd);
+    }
+    io[n > 0 ? n : 0] = '\0';
+    record_simple("EXIT_GROUP||%d||%lld||%lld||%ld||%ld||%ld||%lld||%lld\n", status,
+                  tv_ms(ru.ru_utime), tv_ms(ru.ru_stime), ru.ru_maxrss,
+                  ru.ru_nvcsw, ru.ru_nivcsw,
+                  io_counter(io, "rchar:"), io_counter(io, "wchar:"));
+    flush();
+}
+
+/* called by exit(), with the exit status, after the handlers of the
+   experiment (on_exit handlers run in reverse order of registration) */
+static void exit_handler(int status, void *arg)
+{
+    (void)arg;
+    record_exit(status);
+}
+
+
+/***************************************************************************
+ * initialization
+ ***************************************************************************/
+
+__attribute__((constructor))
+static void passlite_init(void)
+{
+    const char *log = getenv(LOG_ENV);
+    const char *seen;
+    Dl_info info;
+
+    if (!log)
+        return;
+    in_shim = 1;
+
+    snprintf(log_path, sizeof(log_path), "%s", log);
+    if (dladdr((void *)passlite_init, &info) && info.dli_fname)
+        snprintf(shim_path, sizeof(shim_path), "%s", info.dli_fname);
+    prctl(PR_GET_NAME, comm, 0, 0, 0);
+    RESOLVE(readlink);
+
+    open_log();
+    if (log_fd < 0) {
+        in_shim = 0;
+        return;
+    }
+    on_exit(exit_handler, NULL);
+
+    seen = getenv(EXECVE_ENV);
+    if (seen && atoi(seen) == (int)getpid())
+        record_simple("EXECVE_RETURN||0\n");
+    else
+        record_current_image();
+    unsetenv(EXECVE_ENV);
+
+    in_shim = 0;
+}
+
+__attribute__((destructor))
+static void passlite_fini(void)
+{
+    if (log_fd >= 0)
+        flush();
+}
+
+
+/***************************************************************************
+ * open
+ ***************************************************************************/
+
+#ifdef O_TMPFILE
+#define NEEDS_MODE(flags) (((flags) & O_CREAT) || (((flags) & O_TMPFILE) == O_TMPFILE))
+#else
+#define NEEDS_MODE(flags) ((flags) & O_CREAT)
+#endif
+
+#define GET_MODE(flags, mode)              \
+    do {                                   \
+        va_list ap;                        \
+        mode = 0;                          \
+        if (NEEDS_MODE(flags)) {           \
+            va_start(ap, flags);           \
+            mode = va_arg(ap, int);        \
+            va_end(ap);                    \
+        }                                  \
+    } while (0)
+
+int open(const char *path, int flags, ...)
+{
+    mode_t mode;
+    int fd;
+
+    GET_MODE(flags, mode);
+    RESOLVE(open);
+    fd = REAL(open)(path, flags, mode);
+    record_open(AT_FDCWD, path, flags, fd);
+    return fd;
+}
+
+int open64(const char *path, int flags, ...)
+{
+    mode_t mode;
+    int fd;
+
+    GET_MODE(flags, mode);
+    RESOLVE(open64);
+    fd = REAL(open64)(path, flags, mode);
+    record_open(AT_FDCWD, path, flags, fd);
+    return fd;
+}
+
+int openat(int dirfd, const char *path, int flags, ...)
+{
+    mode_t mode;
+    int fd;
+
+    GET_MODE(flags, mode);
+    RESOLVE(openat);
+    fd = REAL(openat)(dirfd, path, flags, mode);
+    record_open(dirfd, path, flags, fd);
+    return fd;
+}
+
+int openat64(int dirfd, const char *path, int flags, ...)
+{
+    mode_t mode;
+    int fd;
+
+    GET_MODE(flags, mode);
+    RESOLVE(openat64);
+    fd = REAL(openat64)(dirfd, path, flags, mode);
+    record_open(dirfd, path, flags, fd);
+    return fd;
+}
+
+/* fortified variants (_FORTIFY_SOURCE) */
+int __open_2(const char *path, int flags)
+{
+    int fd;
+
+    RESOLVE(__open_2);
+    fd = REAL(__open_2)(path, flags);
+    record_open(AT_FDCWD, path, flags, fd);
+    return fd;
+}
+
+int __open64_2(const char *path, int flags)
+{
+    int fd;
+
+    RESOLVE(__open64_2);
+    fd = REAL(__open64_2)(path, flags);
+    record_open(AT_FDCWD, path, flags, fd);
+    return fd;
+}
+
+int __openat_2(int dirfd, const char *path, int flags)
+{
+    int fd;
+
+    RESOLVE(__openat_2);
+    fd = REAL(__openat_2)(dirfd, path, flags);
+    record_open(dirfd, path, flags, fd);
+    return fd;
+}
+
+int __openat64_2(int dirfd, const char *path, int flags)
+{
+    int fd;
+
+    RESOLVE(__openat64_2);
+    fd = REAL(__openat64_2)(dirfd, path, flags);
+    record_open(dirfd, path, flags, fd);
+    return fd;
+}
+
+int creat(const char *path, mode_t mode)
+{
+    int fd;
+
+    RESOLVE(creat);
+    fd = REAL(creat)(path, mode);
+    record_open(AT_FDCWD, path, O_WRONLY, fd);
+    return fd;
+}
+
+int creat64(const char *path, mode_t mode)
+{
+    int fd;
+
+    RESOLVE(creat64);
+    fd = REAL(creat64)(path, mode);
+    record_open(AT_FDCWD, path, O_WRONLY, fd);
+    return fd;
+}
+
+/* stdio opens files through internal calls, which are not interposed */
+FILE *fopen(const char *path, const char *mode)
+{
+    FILE *f;
+
+    RESOLVE(fopen);
+    f = REAL(fopen)(path, mode);
+    if (f)
+        record_open(AT_FDCWD, path, fopen_flags(mode), fileno(f));
+    return f;
+}
+
+FILE *fopen64(const char *path, const char *mode)
+{
+    FILE *f;
+
+    RESOLVE(fopen64);
+    f = REAL(fopen64)(path, mode);
+    if (f)
+        record_open(AT_FDCWD, path, fopen_flags(mode), fileno(f));
+    return f;
+}
+
+FILE *freopen(const char *path, const char *mode, FILE *stream)
+{
+    FILE *f;
+
+    RESOLVE(freopen);
+    f = REAL(freopen)(path, mode, stream);
+    if (f && path)
+        record_open(AT_FDCWD, path, fopen_flags(mode), fileno(f));
+    return f;
+}
+
+FILE *freopen64(const char *path, const char *mode, FILE *stream)
+{
+    FILE *f;
+
+    RESOLVE(freopen64);
+    f = REAL(freopen64)(path, mode, stream);
+    if (f && path)
+        record_open(AT_FDCWD, path, fopen_flags(mode), fileno(f));
+    return f;
+}
+
+
+/***************************************************************************
+ * execve
+ ***************************************************************************/
+
+/* copy of envp with EXECVE_ENV set to the current pid, so that the new
+   image does not write a second EXECVE record */
+static char **marked_env(char *const envp[])
+{
+    static char marker[64];
+    char **env;
+    size_t n = 0, i, j = 0;
+
+    while (envp && envp[n])
+        n++;
+    env = malloc((n + 2) * sizeof(char *));
+    if (!env)
+        return NULL;
+    for (i = 0; i < n; i++)
+        if (strncmp(envp[i], EXECVE_ENV "=", strlen(EXECVE_ENV) + 1) != 0)
+            env[j++] = envp[i];
+    snprintf(marker, sizeof(marker), EXECVE_ENV "=%d", (int)getpid());
+    env[j++] = marker;
+    env[j] = NULL;
+    return env;
+}
+
+static void before_execve(const char *filename, char *const argv[], char *const envp[])
+{
+    in_shim = 1;
+    record_execve(filename, argv, envp);
+    flush();
+    in_shim = 0;
+}
+
+static void after_execve(void)
+{
+    int saved_errno = errno;
+
+    in_shim = 1;
+    record_simple("EXECVE_RETURN||%d\n", -saved_errno);
+    in_shim = 0;
+    errno = saved_errno;
+}
+
+int execve(const char *filename, char *const argv[], char *const envp[])
+{
+    char **env;
+    int ret;
+
+    RESOLVE(execve);
+    if (!tracing())
+        return REAL(execve)(filename, argv, envp);
+
+    before_execve(filename, argv, envp);
+    env = marked_env(envp);
+    ret = REAL(execve)(filename, argv, env ? env : envp);
+    free(env);
+    after_execve();
+    return ret;
+}
+
+int execvpe(const char *file, char *const argv[], char *const envp[])
+{
+    char **env;
+    int ret;
+
+    RESOLVE(execvpe);
+    if (!tracing())
+        return REAL(execvpe)(file, argv, envp);
+
+    before_execve(file, argv, envp);
+    env = marked_env(envp);
+    ret = REAL(execvpe)(file, argv, env ? env : envp);
+    free(env);
+    after_execve();
+    return ret;
+}
+
+/* variants that use environ */
+static int exec_environ(const char *file, char *const argv[], int search)
+{
+    char marker[32];
+    int ret;
+
+    RESOLVE(execv);
+    RESOLVE(execvp);
+    if (!tracing())
+        return search ? REAL(execvp)(file, argv) : REAL(execv)(file, argv);
+
+    before_execve(file, argv, environ);
+    snprintf(marker, sizeof(marker), "%d", (int)getpid());
+    setenv(EXECVE_ENV, marker, 1);
+    ret = search ? REAL(execvp)(file, argv) : REAL(execv)(file, argv);
+    unsetenv(EXECVE_ENV);
+    after_execve();
+    return ret;
+}
+
+int execv(const char *path, char *const argv[])
+{
+    return exec_environ(path, argv, 0);
+}
+
+int execvp(const char *file, char *const argv[])
+{
+    return exec_environ(file, argv, 1);
+}
+
+/* execl* take the arguments as varargs */
+#define COLLECT_ARGS(first, argv, ap)                          \
+    do {                                                       \
+        size_t n = 1;                                          \
+        va_start(ap, first);                                   \
+        while (va_arg(ap, char *))                             \
+            n++;                                               \
+        va_end(ap);                                            \
+        argv = alloca((n + 1) * sizeof(char *));               \
+        argv[0] = (char *)first;                               \
+        va_start(ap, first);                                   \
+        for (n = 1; (argv[n] = va_arg(ap, char *)); n++)       \
+            ;                                                  \
+    } while (0)
+
+int execl(const char *path, const char *arg, ...)
+{
+    char **argv;
+    va_list ap;
+
+    COLLECT_ARGS(arg, argv, ap);
+    va_end(ap);
+    return execv(path, argv);
+}
+
+int execlp(const char *file, const char *arg, ...)
+{
+    char **argv;
+    va_list ap;
+
+    COLLECT_ARGS(arg, argv, ap);
+    va_end(ap);
+    return execvp(file, argv);
+}
+
+int execle(const char *path, const char *arg, ...)
+{
+    char **argv;
+    char **envp;
+    va_list ap;
+
+    COLLECT_ARGS(arg, argv, ap);
+    envp = va_arg(ap, char **);
+    va_end(ap);
+    return execve(path, argv, envp);
+}
+
+
+/***************************************************************************
+ * fork
+ ***************************************************************************/
+
+pid_t fork(void)
+{
+    struct record r;
+    struct timeval tv;
+    pid_t parent_ppid;
+    pid_t pid;
+
+    RESOLVE(fork);
+    if (!tracing())
+        return REAL(fork)();
+
+    /* records of the parent must precede the ones of the child */
+    flush();
+    parent_ppid = getppid();
+    pid = REAL(fork)();
+    if (pid == 0) {
+        buf_len = 0;
+        buf_lock = 0;
+        exited = 0;
+        /* the child writes the FORK record on behalf of its parent, so
+           that it precedes the records of the child in the log */
+        in_shim = 1;
+        gettimeofday(&tv, NULL);
+        rec_init(&r);
+        rec_printf(&r, "%lld||%d||%d||%d||%s||FORK||%d\n",
+                   (long long)tv.tv_sec * 1000 + tv.tv_usec / 1000,
+                   (int)getppid(), (int)parent_ppid, (int)getuid(), comm, (int)getpid());
+        rec_commit(&r);
+        in_shim = 0;
+    }
+    return pid;
+}
+
+/* the child of vfork would run in the memory of the parent */
+pid_t vfork(void)
+{
+    return fork();
+}
+
+
+/***************************************************************************
+ * rename, readlink, chdir
+ ***************************************************************************/
+
+static void record_rename(int olddirfd, const char *oldpath, int newdirfd, const char *newpath)
+{
+    char oldabs[PATH_MAX];
+    char newabs[PATH_MAX];
+
+    if (!tracing())
+        return;
+    in_shim = 1;
+    if (abs_path(olddirfd, oldpath, oldabs) && abs_path(newdirfd, newpath, newabs))
+        record_simple("RENAME||%s||%s\n", oldabs, newabs);
+    in_shim = 0;
+}
+
+int rename(const char *oldpath, const char *newpath)
+{
+    int ret;
+
+    RESOLVE(rename);
+    ret = REAL(rename)(oldpath, newpath);
+    if (ret == 0)
+        record_rename(AT_FDCWD, oldpath, AT_FDCWD, newpath);
+    return ret;
+}
+
+int renameat(int olddirfd, const char *oldpath, int newdirfd, const char *newpath)
+{
+    int ret;
+
+    RESOLVE(renameat);
+    ret = REAL(renameat)(olddirfd, oldpath, newdirfd, newpath);
+    if (ret == 0)
+        record_rename(olddirfd, oldpath, newdirfd, newpath);
+    return ret;
+}
+
+/* renameat2 is only exported since glibc 2.28, but the symbol must not
+   break the build on older systems: it is resolved lazily and the call
+   fails with ENOSYS if the C library does not provide it */
+int renameat2(int olddirfd, const char *oldpath, int newdirfd, const char *newpath,
+              unsigned int flags)
+{
+    int ret;
+
+    RESOLVE(renameat2);
+    if (!REAL(renameat2)) {
+        errno = ENOSYS;
+        return -1;
+    }
+    ret = REAL(renameat2)(olddirfd, oldpath, newdirfd, newpath, flags);
+    if (ret == 0)
+        record_rename(olddirfd, oldpath, newdirfd, newpath);
+    return ret;
+}
+
+static void record_readlink(int dirfd, const char *path, const char *target, ssize_t len)
+{
+    char pwd[PATH_MAX];
+    char dir[PATH_MAX];
+    char t[PATH_MAX];
+
+    if (!tracing() || len <= 0)
+        return;
+    in_shim = 1;
+    snprintf(t, sizeof(t), "%.*s", (int)len, target);
+    if (dirfd == AT_FDCWD || path[0] == '/') {
+        if (getcwd(pwd, sizeof(pwd)))
+            record_simple("SYMLINK||%s||%s||%s\n", path, t, pwd);
+    } else if (fd_path(dirfd, dir)) {
+        record_simple("SYMLINK_AT||%s||%s||%s\n", path, dir, t);
+    }
+    in_shim = 0;
+}
+
+ssize_t readlink(const char *path, char *target, size_t size)
+{
+    ssize_t ret;
+
+    RESOLVE(readlink);
+    ret = REAL(readlink)(path, target, size);
+    record_readlink(AT_FDCWD, path, target, ret);
+    return ret;
+}
+
+ssize_t readlinkat(int dirfd, const char *path, char *target, size_t size)
+{
+    ssize_t ret;
+
+    RESOLVE(readlinkat);
+    ret = REAL(readlinkat)(dirfd, path, target, size);
+    record_readlink(dirfd, path, target, ret);
+    return ret;
+}
+
+/* the working directory is needed to resolve relative paths */
+int chdir(const char *path)
+{
+    int ret;
+
+    RESOLVE(chdir);
+    ret = REAL(chdir)(path);
+    if (ret == 0 && tracing()) {
+        in_shim = 1;
+        record_simple("CHDIR||%s\n", path);
+        in_shim = 0;
+    }
+    return ret;
+}
+
+int fchdir(int fd)
+{
+    char dir[PATH_MAX];
+    int ret;
+
+    RESOLVE(fchdir);
+    ret = REAL(fchdir)(fd);
+    if (ret == 0 && tracing()) {
+        in_shim = 1;
+        if (fd_path(fd, dir))
+            record_simple("CHDIR||%s\n", dir);
+        in_shim = 0;
+    }
+    return ret;
+}
+
+
+/***************************************************************************
+ * close, dup
+ ***************************************************************************/
+
+/* the parser maps fds to the files opened with them, so fds that are
+   closed or duplicated must be reported as well */
+int close(int fd)
+{
+    int ret;
+
+    RESOLVE(close);
+    ret = REAL(close)(fd);
+    if (ret == 0 && fd != log_fd && tracing()) {
+        in_shim = 1;
+        record_simple("CLOSE||%d\n", fd);
+        in_shim = 0;
+    }
+    return ret;
+}
+
+int dup(int oldfd)
+{
+    int ret;
+
+    RESOLVE(dup);
+    ret = REAL(dup)(oldfd);
+    if (ret >= 0 && tracing()) {
+        in_shim = 1;
+        record_simple("DUP||%d||%d\n", oldfd, ret);
+        in_shim = 0;
+    }
+    return ret;
+}
+
+int dup2(int oldfd, int newfd)
+{
+    int ret;
+
+    RESOLVE(dup2);
+    ret = REAL(dup2)(oldfd, newfd);
+    if (ret >= 0 && tracing()) {
+        in_shim = 1;
+        record_simple("DUP2||%d||%d||%d\n", oldfd, newfd, ret);
+        in_shim = 0;
+    }
+    return ret;
+}
+
+int dup3(int oldfd, int newfd, int flags)
+{
+    int ret;
+
+    RESOLVE(dup3);
+    ret = REAL(dup3)(oldfd, newfd, flags);
+    if (ret >= 0 && tracing()) {
+        in_shim = 1;
+        record_simple("DUP2||%d||%d||%d\n", oldfd, newfd, ret);
+        in_shim = 0;
+    }
+    return ret;
+}
+
+
+/***************************************************************************
+ * exit
+ ***************************************************************************/
+
+/* exit() is handled by exit_handler() */
+
+void _exit(int status)
+{
+    RESOLVE(_exit);
+    record_exit(status);
+    REAL(_exit)(status);
+}
+
+void _Exit(int status)
+{
+    RESOLVE(_Exit);
+    record_exit(status);
+    REAL(_Exit)(status);
+}
@@ -0,0 +1,95 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+import reprozip.debug
+import reprozip.utils
+import inspect
+import os
+
+# source and name of the shared object of the shim
+SHIM_SOURCE = 'pass-lite-preload.c'
+SHIM_LIBRARY = 'libpasslite.so'
+
+# variables read by the shim
+LOG_ENV = 'REPROZIP_PRELOAD_LOG'
+ARGV_ENV = 'REPROZIP_PRELOAD_ARGV'
+
+def shim_source():
+    """
+    Returns the path of the C source of the shim.
+    """
+    
+    current_file = os.path.abspath(inspect.getfile(inspect.currentframe()))
+    return os.path.join(os.path.dirname(current_file), SHIM_SOURCE)
+
+def build_shim(log_basedir):
+    """
+    Compiles the shim into log_basedir, returning the path of the shared
+    object. The shim is only rebuilt if its source is newer than the
+    shared object.
+    """
+    
+    library = os.path.join(log_basedir, SHIM_LIBRARY)
+    (success, msg) = reprozip.utils.compile_c(shim_source(), library,
+                                              ['-shared', '-fPIC', '-O2'], ['-ldl'])
+    if not success:
+        reprozip.debug.error('Could not build the LD_PRELOAD tracer: \"%s\"' %msg)
+        raise Exception
+    
+    return library
+
+def shim_env(library, log_file, command_line, env=None):
+    """
+    Returns a copy of env (or of the current environment) in which the
+    experiment is executed with the shim preloaded.
+    
+    -> library is the path of the shared object of the shim
+    -> log_file is the file where the records are written
+    -> command_line is the command line of the experiment, used for the
+       EXECVE record of the first process
+    """
+    
+    if env is None:
+        env = os.environ
+    env = dict(env)
+    
+    preload = env.get('LD_PRELOAD')
+    if preload:
+        env['LD_PRELOAD'] = '%s %s' % (library, preload)
+    else:
+        env['LD_PRELOAD'] = library
+    env[LOG_ENV] = log_file
+    env[ARGV_ENV] = ' '.join(['"%s"' % arg for arg in command_line.split()])
+    
+    return env
@@ -0,0 +1,201 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+import reprozip.debug
+import contextlib
+import threading
+import resource
+import cProfile
+import time
+import json
+import sys
+import os
+
+# profiler of the running command (--profile), or None
+_profiler = None
+
+class Profiler:
+    """
+    Records the wall time, CPU time, peak memory and counters (events
+    parsed, documents written, ...) of the stages of a command, and writes
+    them as a JSON report. With cprofile, each stage is also run under
+    cProfile, and its statistics are dumped next to the report, in
+    <report>.<stage>.prof.
+    """
+    
+    def __init__(self, path, cprofile=False):
+        self.path = path
+        self.cprofile = cprofile
+        self.started = time.time()
+        self.stages = []
+        self.current = None
+        
+        # counters are also updated by the threads that index the trace
+        self.lock = threading.Lock()
+
+
+    def usage(self):
+        """
+        Method that returns the resources used so far, by the process and
+        by its children (the tracer and the experiment).
+        """
+        times = os.times()
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        children_maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if sys.platform == 'darwin':
+            # bytes instead of kB
+            maxrss /= 1024
+            children_maxrss /= 1024
+        return dict(wall=time.time(), user=times[0], system=times[1],
+                    children_user=times[2], children_system=times[3],
+                    maxrss=maxrss, children_maxrss=children_maxrss)
+
+
+    def start_stage(self, name):
+        profile = None
+        if self.cprofile:
+            profile = cProfile.Profile()
+        self.current = dict(name=name, counts={}, failed=False)
+        self.stages.append(self.current)
+        self.current['usage'] = self.usage()
+        if profile is not None:
+            self.current['profile'] = profile
+            profile.enable()
+
+
+    def end_stage(self, failed=False):
+        stage = self.current
+        if stage is None:
+            return
+        profile = stage.pop('profile', None)
+        if profile is not None:
+            profile.disable()
+        
+        start = stage.pop('usage')
+        end = self.usage()
+        stage['wall_time'] = end['wall'] - start['wall']
+        stage['cpu_user'] = end['user'] - start['user']
+        stage['cpu_system'] = end['system'] - start['system']
+        stage['children_cpu_user'] = end['children_user'] - start['children_user']
+        stage['children_cpu_system'] = end['children_system'] - start['children_system']
+        stage['maxrss_kb'] = end['maxrss']
+        stage['maxrss_increase_kb'] = end['maxrss'] - start['maxrss']
+        stage['children_maxrss_kb'] = end['children_maxrss']
+        stage['failed'] = failed
+        
+        if profile is not None:
+            stage['cprofile'] = '%s.%s.prof' % (self.path, stage['name'])
+            try:
+                profile.dump_stats(stage['cprofile'])
+            except:
+                reprozip.debug.warning('Could not write %s: %s' % (stage['cprofile'], sys.exc_info()[1]))
+        self.current = None
+
+
+    def count(self, name, n):
+        self.lock.acquire()
+        try:
+            if self.current is not None:
+                counts = self.current['counts']
+                counts[name] = counts.get(name, 0) + n
+        finally:
+            self.lock.release()
+
+
+    def save(self):
+        """
+        Method that writes the JSON report.
+        """
+        if self.current is not None:
+            self.end_stage(failed=True)
+        totals = {}
+        for stage in self.stages:
+            for (name, n) in stage['counts'].iteritems():
+                totals[name] = totals.get(name, 0) + n
+        report = dict(argv=sys.argv,
+                      started=self.started,
+                      wall_time=time.time() - self.started,
+                      stages=self.stages,
+                      counts=totals)
+        try:
+            f = open(self.path, 'w')
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.close()
+        except:
+            reprozip.debug.error('Could not write the profile %s: %s' % (self.path, sys.exc_info()[1]))
+
+
+def start(path, cprofile=False):
+    """
+    Starts profiling the stages of the command, to be reported in path.
+    """
+    
+    global _profiler
+    _profiler = Profiler(path, cprofile)
+
+def stop():
+    """
+    Writes the report of the profiled stages, if any.
+    """
+    
+    global _profiler
+    if _profiler is not None:
+        _profiler.save()
+        print '** Profile written to %s **' % _profiler.path
+        _profiler = None
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Profiles the block of a with statement as a stage, when profiling.
+    """
+    
+    if _profiler is None:
+        yield
+        return
+    _profiler.start_stage(name)
+    try:
+        yield
+    except BaseException:
+        _profiler.end_stage(failed=True)
+        raise
+    _profiler.end_stage()
+
+def count(name, n=1):
+    """
+    Adds n to a counter of the current stage, when profiling.
+    """
+    
+    if _profiler is not None:
+        _profiler.count(name, n)
@@ -0,0 +1,986 @@
+/*
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+*/
+
+/*
+ * Supervisor that runs an experiment under ptrace and records its system
+ * calls in the same format as pass-lite.stp, without root privileges or
+ * SystemTap. Only the processes of the experiment are traced.
+ *
+ * A seccomp filter, inherited by all the processes of the experiment,
+ * stops them only on the system calls that pass-lite.stp records, so
+ * read/write/mmap, fstat and all other system calls run at full speed.
+ * Forks, clones, execs and exits are followed with ptrace events. Records
+ * that do not need the result of the system call (stat, access, close)
+ * are written at its entry, so the thread only stops once.
+ *
+ * Usage:
+ *   pass-lite-ptrace -o <log> -- <command> [<args> ...]
+ *
+ * The exit status of the supervisor is the one of the command.
+ *
+ * Build:
+ *   cc -O2 -o pass-lite-ptrace pass-lite-ptrace.c
+ *
+ * Limitations: x86-64 only (32-bit system calls are not traced); setuid
+ * programs run without their privileges, as with any ptrace'd process.
+ */
+
+#define _GNU_SOURCE
+#include <errno.h>
+#include <fcntl.h>
+#include <limits.h>
+#include <signal.h>
+#include <stddef.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <linux/audit.h>
+#include <linux/filter.h>
+#include <linux/seccomp.h>
+#include <sys/prctl.h>
+#include <sys/ptrace.h>
+#include <sys/syscall.h>
+#include <sys/time.h>
+#include <sys/types.h>
+#include <sys/uio.h>
+#include <sys/user.h>
+#include <sys/wait.h>
+
+#if !defined(__x86_64__)
+#error "pass-lite-ptrace only supports x86-64"
+#endif
+
+#ifndef PTRACE_EVENT_STOP
+#define PTRACE_EVENT_STOP 128
+#endif
+#ifndef SYS_renameat2
+#define SYS_renameat2 316
+#endif
+#ifndef SYS_statx
+#define SYS_statx 332
+#endif
+#ifndef SYS_clone3
+#define SYS_clone3 435
+#endif
+#ifndef SYS_faccessat2
+#define SYS_faccessat2 439
+#endif
+#ifndef CLONE_THREAD
+#define CLONE_THREAD 0x00010000
+#endif
+#ifndef AT_EMPTY_PATH
+#define AT_EMPTY_PATH 0x1000
+#endif
+
+/* the system calls recorded by pass-lite.stp (plus the newer variants
+   that glibc uses instead of them); everything else is never stopped.
+   newfstatat and statx are handled separately by the filter, since they
+   are only stopped when they are not an fstat (AT_EMPTY_PATH) */
+static const int traced_syscalls[] = {
+    SYS_open, SYS_openat, SYS_creat,
+    SYS_stat, SYS_lstat,
+    SYS_access, SYS_faccessat, SYS_faccessat2,
+    SYS_truncate,
+    SYS_chdir, SYS_fchdir,
+    SYS_execve,
+    SYS_rename, SYS_renameat, SYS_renameat2,
+    SYS_readlink, SYS_readlinkat,
+    SYS_close, SYS_dup, SYS_dup2, SYS_dup3, SYS_pipe, SYS_pipe2,
+};
+
+#define N_TRACED (sizeof(traced_syscalls) / sizeof(traced_syscalls[0]))
+
+/* size of the buffer of the log */
+#define LOG_BUFFER (1 << 20)
+
+static FILE *out;
+static uid_t uid;
+
+
+/***************************************************************************
+ * traced processes
+ ***************************************************************************/
+
+/* state of a thread; records use the pid of its thread group, as
+   pid() in SystemTap does */
+/* resource usage of a process, as in the EXIT_GROUP records of
+   pass-lite.stp: utime and stime (ms), maxrss (kB), nvcsw, nivcsw, rchar
+   and wchar */
+#define N_USAGE 7
+
+struct task {
+    pid_t tid;
+    pid_t pid;
+    pid_t ppid;
+    char comm[17];
+    /* the thread is expected to start with a SIGSTOP */
+    int starting;
+    /* the thread is stopped at the entry of a system call */
+    int in_syscall;
+    long nr;
+    unsigned long long args[6];
+    /* absolute paths computed at the entry of rename */
+    char *old_path;
+    char *new_path;
+    /* resource usage of the process, read from /proc when its leader
+       stops at its exit (-1 if unknown) */
+    int has_usage;
+    long long usage[N_USAGE];
+    struct task *next;
+};
+
+#define TASK_BUCKETS 4096
+
+static struct task *tasks[TASK_BUCKETS];
+static int n_tasks = 0;
+
+static struct task *find_task(pid_t tid)
+{
+    struct task *t;
+
+    for (t = tasks[tid % TASK_BUCKETS]; t; t = t->next)
+        if (t->tid == tid)
+            return t;
+    return NULL;
+}
+
+static void read_comm(struct task *t)
+{
+    char path[64];
+    ssize_t n;
+    int fd;
+
+    snprintf(path, sizeof(path), "/proc/%d/comm", (int)t->tid);
+    t->comm[0] = '\0';
+    fd = open(path, O_RDONLY | O_CLOEXEC);
+    if (fd < 0)
+        return;
+    n = read(fd, t->comm, sizeof(t->comm) - 1);
+    close(fd);
+    if (n <= 0)
+        n = 0;
+    else if (t->comm[n - 1] == '\n')
+        n--;
+    t->comm[n] = '\0';
+}
+
+static struct task *add_task(pid_t tid, pid_t pid, pid_t ppid)
+{
+    struct task *t = calloc(1, sizeof(*t));
+
+    if (!t) {
+        perror("pass-lite-ptrace");
+        exit(1);
+    }
+    t->tid = tid;
+    t->pid = pid;
+    t->ppid = ppid;
+    t->next = tasks[tid % TASK_BUCKETS];
+    tasks[tid % TASK_BUCKETS] = t;
+    n_tasks++;
+    return t;
+}
+
+static void remove_task(struct task *t)
+{
+    struct task **p;
+
+    for (p = &tasks[t->tid % TASK_BUCKETS]; *p; p = &(*p)->next) {
+        if (*p == t) {
+            *p = t->next;
+            break;
+        }
+    }
+    free(t->old_path);
+    free(t->new_path);
+    free(t);
+    n_tasks--;
+}
+
+
+/***************************************************************************
+ * helpers
+ ***************************************************************************/
+
+/* reads a NUL-terminated string from the memory of a thread; returns 0 on
+   error */
+static int read_string(pid_t tid, unsigned long long addr, char *buf, size_t size)
+{
+    struct iovec local, remote;
+    size_t done = 0;
+    size_t chunk;
+    ssize_t n;
+    char *nul;
+
+    if (!addr)
+        return 0;
+    while (done < size - 1) {
+        /* never read across a page boundary: the next page may be
+           unmapped */
+        chunk = 4096 - ((addr + done) & 4095);
+        if (chunk > size - 1 - done)
+            chunk = size - 1 - done;
+        local.iov_base = buf + done;
+        local.iov_len = chunk;
+        remote.iov_base = (void *)(uintptr_t)(addr + done);
+        remote.iov_len = chunk;
+        n = process_vm_readv(tid, &local, 1, &remote, 1, 0);
+        if (n <= 0)
+            return 0;
+        nul = memchr(buf + done, '\0', n);
+        if (nul)
+            return 1;
+        done += n;
+    }
+    buf[size - 1] = '\0';
+    return 1;
+}
+
+static int read_memory(pid_t tid, unsigned long long addr, void *buf, size_t size)
+{
+    struct iovec local, remote;
+
+    local.iov_base = buf;
+    local.iov_len = size;
+    remote.iov_base = (void *)(uintptr_t)addr;
+    remote.iov_len = size;
+    return process_vm_readv(tid, &local, 1, &remote, 1, 0) == (ssize_t)size;
+}
+
+/* reads a link from /proc/<tid>/...; returns 0 on error */
+static int proc_link(pid_t tid, const char *name, char *buf)
+{
+    char path[64];
+    ssize_t n;
+
+    snprintf(path, sizeof(path), "/proc/%d/%s", (int)tid, name);
+    n = readlink(path, buf, PATH_MAX - 1);
+    if (n < 0)
+        return 0;
+    buf[n] = '\0';
+    return 1;
+}
+
+/* reads /proc/<tid>/...; returns 0 on error */
+static int proc_read(pid_t tid, const char *name, char *buf, size_t size)
+{
+    char path[64];
+    ssize_t n;
+    int fd;
+
+    snprintf(path, sizeof(path), "/proc/%d/%s", (int)tid, name);
+    fd = open(path, O_RDONLY | O_CLOEXEC);
+    if (fd < 0)
+        return 0;
+    n = read(fd, buf, size - 1);
+    close(fd);
+    if (n <= 0)
+        return 0;
+    buf[n] = '\0';
+    return 1;
+}
+
+/* value of the line starting with name in a file of /proc, or -1 */
+static long long proc_field(const char *buf, const char *name)
+{
+    size_t len = strlen(name);
+    const char *line;
+
+    for (line = buf; line; line = strchr(line, '\n')) {
+        if (*line == '\n')
+            line++;
+        if (strncmp(line, name, len) == 0)
+            return strtoll(line + len, NULL, 10);
+    }
+    return -1;
+}
+
+static void read_usage(struct task *t)
+{
+    char buf[4096];
+    char name[32];
+    unsigned long long utime, stime;
+    long ticks = sysconf(_SC_CLK_TCK);
+    char *p;
+    int i;
+
+    t->has_usage = 1;
+    for (i = 0; i < N_USAGE; i++)
+        t->usage[i] = -1;
+
+    /* utime and stime (in clock ticks) follow the 11 fields after the
+       command name, which may contain spaces */
+    if (proc_read(t->pid, "stat", buf, sizeof(buf)) && ticks > 0 &&
+        (p = strrchr(buf, ')')) != NULL &&
+        sscanf(p + 1, " %*c %*d %*d %*d %*d %*d %*u %*u %*u %*u %*u %llu %llu",
+               &utime, &stime) == 2) {
+        t->usage[0] = (long long)(utime * 1000 / ticks);
+        t->usage[1] = (long long)(stime * 1000 / ticks);
+    }
+    if (proc_read(t->pid, "status", buf, sizeof(buf))) {
+        t->usage[2] = proc_field(buf, "VmHWM:");
+        t->usage[3] = proc_field(buf, "voluntary_ctxt_switches:");
+        t->usage[4] = proc_field(buf, "nonvoluntary_ctxt_switches:");
+    }
+    /* the io file of the process would count the children it waited for */
+    snprintf(name, sizeof(name), "task/%d/io", (int)t->pid);
+    if (proc_read(t->pid, name, buf, sizeof(buf))) {
+        t->usage[5] = proc_field(buf, "rchar:");
+        t->usage[6] = proc_field(buf, "wchar:");
+    }
+}
+
+static int fd_path(pid_t tid, long fd, char *buf)
+{
+    char name[32];
+
+    snprintf(name, sizeof(name), "fd/%ld", fd);
+    return proc_link(tid, name, buf) && buf[0] == '/';
+}
+
+/* absolute (but not resolved) path of a path relative to dirfd */
+static char *abs_path(pid_t tid, long dirfd, const char *path)
+{
+    char dir[PATH_MAX];
+    char *ret;
+
+    if (path[0] == '/')
+        return strdup(path);
+    if ((int)dirfd == AT_FDCWD) {
+        if (!proc_link(tid, "cwd", dir))
+            return NULL;
+    } else if (!fd_path(tid, dirfd, dir)) {
+        return NULL;
+    }
+    if (asprintf(&ret, "%s/%s", dir, path) < 0)
+        return NULL;
+    return ret;
+}
+
+/* same header as print_header() in pass-lite.stp */
+static void header(struct task *t)
+{
+    struct timeval tv;
+
+    gettimeofday(&tv, NULL);
+    fprintf(out, "%lld||%d||%d||%d||%s||",
+            (long long)tv.tv_sec * 1000 + tv.tv_usec / 1000,
+            (int)t->pid, (int)t->ppid, (int)uid, t->comm);
+}
+
+
+/***************************************************************************
+ * system calls
+ ***************************************************************************/
+
+/* strings of argv / envp, as in the EXECVE record of pass-lite.stp */
+static void print_string_array(pid_t tid, unsigned long long addr, int env)
+{
+    char value[PATH_MAX * 4];
+    unsigned long long ptr;
+    char *eq;
+    int i;
+
+    for (i = 0; addr; i++) {
+        if (!read_memory(tid, addr + i * sizeof(ptr), &ptr, sizeof(ptr)) || !ptr)
+            break;
+        if (!read_string(tid, ptr, value, sizeof(value)))
+            break;
+        if (env) {
+            eq = strchr(value, '=');
+            if (!eq)
+                continue;
+            *eq = '\0';
+            fprintf(out, "%s&&=&&%s&_&&_&", value, eq + 1);
+        } else {
+            fprintf(out, i ? " \"%s\"" : "\"%s\"", value);
+        }
+    }
+}
+
+static void print_open(struct task *t, const char *path, long dirfd, long flags, long fd)
+{
+    char abspath[PATH_MAX];
+    char dir[PATH_MAX];
+    const char *mode;
+    int at = (int)dirfd != AT_FDCWD;
+
+    /* pipes, sockets, ... */
+    if (!fd_path(t->tid, fd, abspath))
+        return;
+    if (at && !fd_path(t->tid, dirfd, dir))
+        return;
+
+    switch (flags & O_ACCMODE) {
+    case O_RDWR:
+        mode = "READWRITE";
+        break;
+    case O_WRONLY:
+        mode = "WRITE";
+        break;
+    default:
+        mode = "READ";
+    }
+
+    header(t);
+    fprintf(out, "OPEN_ABSPATH||%s\n", abspath);
+    header(t);
+    if (at)
+        fprintf(out, "OPEN_AT_%s||%s||%s||%ld\n", mode, path, dir, fd);
+    else
+        fprintf(out, "OPEN_%s||%s||%ld\n", mode, path, fd);
+}
+
+static void print_path(struct task *t, const char *name, const char *path, long dirfd)
+{
+    char dir[PATH_MAX];
+
+    if ((int)dirfd == AT_FDCWD || path[0] == '/') {
+        header(t);
+        fprintf(out, "%s||%s\n", name, path);
+    } else if (fd_path(t->tid, dirfd, dir)) {
+        header(t);
+        fprintf(out, "%s_AT||%s||%s\n", name, path, dir);
+    }
+}
+
+/* records of system calls whose path is checked by the parser (which
+   ignores paths that do not exist) are written at the entry, so that the
+   thread does not have to stop again at the exit */
+static int print_path_at_entry(struct task *t, const char *name, int path_arg, long dirfd)
+{
+    char path[PATH_MAX];
+
+    if (!read_string(t->tid, t->args[path_arg], path, sizeof(path)))
+        return 0;
+    if ((int)dirfd != AT_FDCWD && path[0] != '/')
+        return 1;
+    if (path[0]) {
+        header(t);
+        fprintf(out, "%s||%s\n", name, path);
+    }
+    return 0;
+}
+
+/* called at the entry of a system call: only the arguments that may be
+   gone at its exit are read here. Returns whether the thread must stop
+   again at the exit of the system call */
+static int syscall_entry(struct task *t)
+{
+    char path[PATH_MAX];
+    char cwd[PATH_MAX];
+
+    switch (t->nr) {
+    case SYS_stat:
+    case SYS_lstat:
+        return print_path_at_entry(t, "STAT", 0, AT_FDCWD);
+    case SYS_newfstatat:
+    case SYS_statx:
+        return print_path_at_entry(t, "STAT", 1, t->args[0]);
+    case SYS_access:
+        return print_path_at_entry(t, "ACCESS", 0, AT_FDCWD);
+    case SYS_faccessat:
+    case SYS_faccessat2:
+        return print_path_at_entry(t, "ACCESS", 1, t->args[0]);
+    case SYS_truncate:
+        return print_path_at_entry(t, "TRUNCATE", 0, AT_FDCWD);
+    case SYS_close:
+        /* the parser ignores CLOSE records of fds that are not open */
+        header(t);
+        fprintf(out, "CLOSE||%d\n", (int)t->args[0]);
+        return 0;
+    case SYS_execve:
+        if (!read_string(t->tid, t->args[0], path, sizeof(path)))
+            break;
+        if (!proc_link(t->tid, "cwd", cwd))
+            cwd[0] = '\0';
+        header(t);
+        fprintf(out, "EXECVE||%s||%s||", cwd, path);
+        print_string_array(t->tid, t->args[2], 1);
+        fprintf(out, "||");
+        print_string_array(t->tid, t->args[1], 0);
+        fprintf(out, "\n");
+        break;
+    case SYS_rename:
+        if (read_string(t->tid, t->args[0], path, sizeof(path)))
+            t->old_path = abs_path(t->tid, AT_FDCWD, path);
+        if (read_string(t->tid, t->args[1], path, sizeof(path)))
+            t->new_path = abs_path(t->tid, AT_FDCWD, path);
+        break;
+    case SYS_renameat:
+    case SYS_renameat2:
+        if (read_string(t->tid, t->args[1], path, sizeof(path)))
+            t->old_path = abs_path(t->tid, t->args[0], path);
+        if (read_string(t->tid, t->args[3], path, sizeof(path)))
+            t->new_path = abs_path(t->tid, t->args[2], path);
+        break;
+    }
+    return 1;
+}
+
+/* called at the exit of a system call, with its return value */
+static void syscall_exit(struct task *t, long ret)
+{
+    char path[PATH_MAX];
+    char target[PATH_MAX];
+    int fds[2];
+
+    switch (t->nr) {
+    case SYS_execve:
+        /* on success, the name of the process has changed */
+        if (ret == 0)
+            read_comm(t);
+        header(t);
+        fprintf(out, "EXECVE_RETURN||%ld\n", ret);
+        break;
+    case SYS_rename:
+    case SYS_renameat:
+    case SYS_renameat2:
+        if (ret == 0 && t->old_path && t->new_path) {
+            header(t);
+            fprintf(out, "RENAME||%s||%s\n", t->old_path, t->new_path);
+        }
+        free(t->old_path);
+        free(t->new_path);
+        t->old_path = t->new_path = NULL;
+        break;
+    }
+
+    if (ret < 0)
+        return;
+
+    switch (t->nr) {
+    case SYS_open:
+        if (read_string(t->tid, t->args[0], path, sizeof(path)))
+            print_open(t, path, AT_FDCWD, t->args[1], ret);
+        break;
+    case SYS_openat:
+        if (read_string(t->tid, t->args[1], path, sizeof(path)))
+            print_open(t, path, t->args[0], t->args[2], ret);
+        break;
+    case SYS_creat:
+        if (read_string(t->tid, t->args[0], path, sizeof(path)))
+            print_open(t, path, AT_FDCWD, O_WRONLY, ret);
+        break;
+    case SYS_newfstatat:
+    case SYS_statx:
+        /* only relative paths with a dirfd get here */
+        if (read_string(t->tid, t->args[1], path, sizeof(path)))
+            print_path(t, "STAT", path, t->args[0]);
+        break;
+    case SYS_faccessat:
+    case SYS_faccessat2:
+        if (read_string(t->tid, t->args[1], path, sizeof(path)))
+            print_path(t, "ACCESS", path, t->args[0]);
+        break;
+    case SYS_chdir:
+        if (read_string(t->tid, t->args[0], path, sizeof(path))) {
+            header(t);
+            fprintf(out, "CHDIR||%s\n", path);
+        }
+        break;
+    case SYS_fchdir:
+        if (proc_link(t->tid, "cwd", path)) {
+            header(t);
+            fprintf(out, "CHDIR||%s\n", path);
+        }
+        break;
+    case SYS_readlink:
+    case SYS_readlinkat:
+        if (ret == 0 || (size_t)ret >= sizeof(target))
+            break;
+        {
+            int at = t->nr == SYS_readlinkat;
+            unsigned long long buf = t->args[at ? 2 : 1];
+
+            if (!read_string(t->tid, t->args[at ? 1 : 0], path, sizeof(path)) ||
+                !read_memory(t->tid, buf, target, ret))
+                break;
+            target[ret] = '\0';
+            if (!at || (int)t->args[0] == AT_FDCWD) {
+                char cwd[PATH_MAX];
+
+                if (!proc_link(t->tid, "cwd", cwd))
+                    break;
+                header(t);
+                fprintf(out, "SYMLINK||%s||%s||%s\n", path, target, cwd);
+            } else {
+                char dir[PATH_MAX];
+
+                if (!fd_path(t->tid, t->args[0], dir))
+                    break;
+                header(t);
+                fprintf(out, "SYMLINK_AT||%s||%s||%s\n", path, dir, target);
+            }
+        }
+        break;
+    case SYS_dup:
+        header(t);
+        fprintf(out, "DUP||%d||%ld\n", (int)t->args[0], ret);
+        break;
+    case SYS_dup2:
+    case SYS_dup3:
+        header(t);
+        fprintf(out, "DUP2||%d||%d||%ld\n", (int)t->args[0], (int)t->args[1], ret);
+        break;
+    case SYS_pipe:
+    case SYS_pipe2:
+        if (read_memory(t->tid, t->args[0], fds, sizeof(fds))) {
+            header(t);
+            fprintf(out, "PIPE||%d||%d\n", fds[0], fds[1]);
+        }
+        break;
+    }
+}
+
+
+/***************************************************************************
+ * events
+ ***************************************************************************/
+
+static void resume(pid_t tid, int request, int sig)
+{
+    /* the thread may have been killed in the meantime */
+    ptrace(request, tid, NULL, (void *)(long)sig);
+}
+
+/* a new thread or process was created by t */
+static void new_task(struct task *t, int event)
+{
+    struct user_regs_struct regs;
+    unsigned long long flags = 0;
+    unsigned long msg;
+    struct task *c;
+    pid_t tid;
+
+    if (ptrace(PTRACE_GETEVENTMSG, t->tid, NULL, &msg) < 0)
+        return;
+    tid = (pid_t)msg;
+
+    if (event == PTRACE_EVENT_CLONE &&
+        ptrace(PTRACE_GETREGS, t->tid, NULL, &regs) == 0) {
+        if (regs.orig_rax == SYS_clone3)
+            read_memory(t->tid, regs.rdi, &flags, sizeof(flags));
+        else
+            flags = regs.rdi;
+    }
+
+    /* the thread may already have reported its initial stop */
+    c = find_task(tid);
+    if (!c) {
+        c = add_task(tid, tid, t->pid);
+        c->starting = 1;
+    }
+    if (flags & CLONE_THREAD) {
+        c->pid = t->pid;
+        c->ppid = t->ppid;
+    } else {
+        c->pid = tid;
+        c->ppid = t->pid;
+        header(t);
+        fprintf(out, "FORK||%d\n", (int)tid);
+    }
+    memcpy(c->comm, t->comm, sizeof(c->comm));
+
+    if (!c->starting)
+        resume(tid, PTRACE_CONT, 0);
+}
+
+static void handle_stop(struct task *t, int status)
+{
+    struct user_regs_struct regs;
+    int sig = WSTOPSIG(status);
+    int event = status >> 16;
+    unsigned long msg;
+    struct task *old;
+
+    if (sig == (SIGTRAP | 0x80)) {
+        /* syscall-exit-stop, requested at the seccomp stop of the entry */
+        if (ptrace(PTRACE_GETREGS, t->tid, NULL, &regs) < 0)
+            return;
+        if (t->in_syscall && (long)regs.rax == -ENOSYS && regs.orig_rax == (unsigned long long)t->nr) {
+            /* kernels before 4.8 stop at the entry after the seccomp stop */
+            resume(t->tid, PTRACE_SYSCALL, 0);
+            return;
+        }
+        if (t->in_syscall) {
+            t->in_syscall = 0;
+            syscall_exit(t, (long)regs.rax);
+        }
+        resume(t->tid, PTRACE_CONT, 0);
+        return;
+    }
+
+    if (sig == SIGTRAP && event) {
+        switch (event) {
+        case PTRACE_EVENT_SECCOMP:
+            if (ptrace(PTRACE_GETREGS, t->tid, NULL, &regs) < 0)
+                return;
+            t->in_syscall = 1;
+            t->nr = regs.orig_rax;
+            t->args[0] = regs.rdi;
+            t->args[1] = regs.rsi;
+            t->args[2] = regs.rdx;
+            t->args[3] = regs.r10;
+            t->args[4] = regs.r8;
+            t->args[5] = regs.r9;
+            if (syscall_entry(t)) {
+                /* stop again at the exit, to get the return value */
+                resume(t->tid, PTRACE_SYSCALL, 0);
+            } else {
+                t->in_syscall = 0;
+                resume(t->tid, PTRACE_CONT, 0);
+            }
+            return;
+        case PTRACE_EVENT_FORK:
+        case PTRACE_EVENT_VFORK:
+        case PTRACE_EVENT_CLONE:
+            new_task(t, event);
+            break;
+        case PTRACE_EVENT_EXIT:
+            /* the process can still be read from /proc */
+            if (t->tid == t->pid)
+                read_usage(t);
+            break;
+        case PTRACE_EVENT_EXEC:
+            /* a thread other than the leader called execve: it takes
+               over the pid of the leader */
+            if (ptrace(PTRACE_GETEVENTMSG, t->tid, NULL, &msg) == 0 &&
+                (pid_t)msg != t->tid && (old = find_task((pid_t)msg)) != NULL) {
+                t->in_syscall = old->in_syscall;
+                t->nr = old->nr;
+                remove_task(old);
+            }
+            read_comm(t);
+            break;
+        }
+        /* an exec stops again at the exit of execve */
+        resume(t->tid, t->in_syscall ? PTRACE_SYSCALL : PTRACE_CONT, 0);
+        return;
+    }
+
+    if (t->starting && sig == SIGSTOP) {
+        t->starting = 0;
+        /* the FORK record of the parent has not been written yet: the
+           thread is resumed by new_task() */
+        if (!t->ppid)
+            return;
+        resume(t->tid, PTRACE_CONT, 0);
+        return;
+    }
+
+    /* signal-delivery-stop: deliver the signal */
+    resume(t->tid, t->in_syscall ? PTRACE_SYSCALL : PTRACE_CONT, sig);
+}
+
+static void handle_exit(struct task *t, int status)
+{
+    int code, i;
+
+    /* the leader of a thread group is reported last, so this is the
+       exit of the whole process */
+    if (t->tid == t->pid) {
+        code = WIFEXITED(status) ? WEXITSTATUS(status) : 128 + WTERMSIG(status);
+        header(t);
+        fprintf(out, "EXIT_GROUP||%d", code);
+        if (t->has_usage)
+            for (i = 0; i < N_USAGE; i++)
+                fprintf(out, "||%lld", t->usage[i]);
+        fprintf(out, "\n");
+    }
+    remove_task(t);
+}
+
+
+/***************************************************************************
+ * main
+ ***************************************************************************/
+
+/* offset of the low 32 bits of an argument in seccomp_data */
+#define ARG_LOW(n) offsetof(struct seccomp_data, args[n])
+
+static int install_filter(void)
+{
+    struct sock_filter filter[N_TRACED + 16];
+    struct sock_fprog prog;
+    size_t allow, i, n = 0;
+
+    /* layout: architecture and number checks, RET ALLOW, RET TRACE, then
+       the checks of the flags of newfstatat and statx */
+    allow = N_TRACED + 5;
+
+    filter[n++] = (struct sock_filter)BPF_STMT(BPF_LD | BPF_W | BPF_ABS,
+                                               offsetof(struct seccomp_data, arch));
+    filter[n++] = (struct sock_filter)BPF_JUMP(BPF_JMP | BPF_JEQ | BPF_K,
+                                               AUDIT_ARCH_X86_64, 0, allow - 2);
+    filter[n++] = (struct sock_filter)BPF_STMT(BPF_LD | BPF_W | BPF_ABS,
+                                               offsetof(struct seccomp_data, nr));
+    filter[n++] = (struct sock_filter)BPF_JUMP(BPF_JMP | BPF_JEQ | BPF_K,
+                                               SYS_newfstatat, allow + 2 - 4, 0);
+    filter[n++] = (struct sock_filter)BPF_JUMP(BPF_JMP | BPF_JEQ | BPF_K,
+                                               SYS_statx, allow + 6 - 5, 0);
+    for (i = 0; i < N_TRACED; i++, n++)
+        filter[n] = (struct sock_filter)BPF_JUMP(BPF_JMP | BPF_JEQ | BPF_K,
+                                                 traced_syscalls[i], allow + 1 - n - 1, 0);
+    filter[n++] = (struct sock_filter)BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_ALLOW);
+    filter[n++] = (struct sock_filter)BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_TRACE);
+
+    /* newfstatat(dirfd, path, buf, flags) */
+    filter[n++] = (struct sock_filter)BPF_STMT(BPF_LD | BPF_W | BPF_ABS, ARG_LOW(3));
+    filter[n++] = (struct sock_filter)BPF_JUMP(BPF_JMP | BPF_JSET | BPF_K, AT_EMPTY_PATH, 0, 1);
+    filter[n++] = (struct sock_filter)BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_ALLOW);
+    filter[n++] = (struct sock_filter)BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_TRACE);
+
+    /* statx(dirfd, path, flags, mask, buf) */
+    filter[n++] = (struct sock_filter)BPF_STMT(BPF_LD | BPF_W | BPF_ABS, ARG_LOW(2));
+    filter[n++] = (struct sock_filter)BPF_JUMP(BPF_JMP | BPF_JSET | BPF_K, AT_EMPTY_PATH, 0, 1);
+    filter[n++] = (struct sock_filter)BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_ALLOW);
+    filter[n++] = (struct sock_filter)BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_TRACE);
+
+    prog.len = n;
+    prog.filter = filter;
+    if (prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0) < 0)
+        return -1;
+    return prctl(PR_SET_SECCOMP, SECCOMP_MODE_FILTER, &prog);
+}
+
+static void usage(void)
+{
+    fprintf(stderr, "usage: pass-lite-ptrace -o <log> -- <command> [<args> ...]\n");
+    exit(2);
+}
+
+int main(int argc, char *argv[])
+{
+    const char *log = NULL;
+    int exit_code = 0;
+    struct task *t;
+    pid_t child;
+    pid_t tid;
+    int status;
+    int opt;
+
+    while ((opt = getopt(argc, argv, "+o:")) != -1) {
+        switch (opt) {
+        case 'o':
+            log = optarg;
+            break;
+        default:
+            usage();
+        }
+    }
+    if (!log || optind >= argc)
+        usage();
+
+    out = fopen(log, "a");
+    if (!out) {
+        perror(log);
+        return 1;
+    }
+    setvbuf(out, NULL, _IOFBF, LOG_BUFFER);
+    uid = getuid();
+
+    child = fork();
+    if (child < 0) {
+        perror("fork");
+        return 1;
+    }
+    if (child == 0) {
+        fclose(out);
+        if (ptrace(PTRACE_TRACEME, 0, NULL, NULL) < 0) {
+            perror("ptrace");
+            _exit(127);
+        }
+        raise(SIGSTOP);
+        if (install_filter() < 0) {
+            perror("seccomp");
+            _exit(127);
+        }
+        execvp(argv[optind], argv + optind);
+        perror(argv[optind]);
+        _exit(127);
+    }
+
+    /* the signals of the terminal go to the experiment */
+    signal(SIGINT, SIG_IGN);
+    signal(SIGQUIT, SIG_IGN);
+
+    if (waitpid(child, &status, 0) < 0 || !WIFSTOPPED(status)) {
+        fprintf(stderr, "pass-lite-ptrace: could not trace %s\n", argv[optind]);
+        return 1;
+    }
+    if (ptrace(PTRACE_SETOPTIONS, child, NULL,
+               (void *)(long)(PTRACE_O_TRACESECCOMP | PTRACE_O_TRACESYSGOOD |
+                              PTRACE_O_TRACEFORK | PTRACE_O_TRACEVFORK |
+                              PTRACE_O_TRACECLONE | PTRACE_O_TRACEEXEC |
+                              PTRACE_O_TRACEEXIT | PTRACE_O_EXITKILL)) < 0) {
+        perror("ptrace");
+        kill(child, SIGKILL);
+        return 1;
+    }
+    t = add_task(child, child, getpid());
+    read_comm(t);
+    resume(child, PTRACE_CONT, 0);
+
+    while (n_tasks > 0) {
+        tid = waitpid(-1, &status, __WALL);
+        if (tid < 0) {
+            if (errno == EINTR)
+                continue;
+            break;
+        }
+        t = find_task(tid);
+        if (!t) {
+            /* a new thread that stopped before the event of its parent */
+            if (!WIFSTOPPED(status))
+                continue;
+            t = add_task(tid, tid, 0);
+            t->starting = 1;
+        }
+        if (WIFEXITED(status) || WIFSIGNALED(status)) {
+            if (tid == child)
+                exit_code = WIFEXITED(status) ? WEXITSTATUS(status) : 128 + WTERMSIG(status);
+            handle_exit(t, status);
+        } else if (WIFSTOPPED(status)) {
+            handle_stop(t, status);
+        }
+    }
+
+    fclose(out);
+    return exit_code;
+}
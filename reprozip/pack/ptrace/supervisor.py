@@ -0,0 +1,73 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+import reprozip.debug
+import reprozip.utils
+import inspect
+import os
+
+# source and name of the executable of the supervisor
+SUPERVISOR_SOURCE = 'pass-lite-ptrace.c'
+SUPERVISOR_BINARY = 'pass-lite-ptrace'
+
+def supervisor_source():
+    """
+    Returns the path of the C source of the supervisor.
+    """
+    
+    current_file = os.path.abspath(inspect.getfile(inspect.currentframe()))
+    return os.path.join(os.path.dirname(current_file), SUPERVISOR_SOURCE)
+
+def build_supervisor(log_basedir):
+    """
+    Compiles the supervisor into log_basedir, returning the path of the
+    executable. The supervisor is only rebuilt if its source is newer than
+    the executable.
+    """
+    
+    binary = os.path.join(log_basedir, SUPERVISOR_BINARY)
+    (success, msg) = reprozip.utils.compile_c(supervisor_source(), binary, ['-O2'])
+    if not success:
+        reprozip.debug.error('Could not build the ptrace tracer: \"%s\"' %msg)
+        raise Exception
+    
+    return binary
+
+def supervisor_command(binary, log_file):
+    """
+    Returns the arguments that must precede the command line of the
+    experiment to run it under the supervisor.
+    """
+    
+    return [binary, '-o', log_file, '--']
@@ -0,0 +1,313 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+from reprozip.pack.storage import get_storage
+import reprozip.debug
+import reprozip.utils
+import itertools
+import argparse
+import sys
+import os
+
+def default_session():
+    """
+    Returns the tag of the session of the last tracing (the one of the
+    current-session link), or None.
+    """
+    
+    link = os.path.join(reprozip.utils.log_basedir(), 'current-session')
+    if os.path.islink(link):
+        return os.readlink(link)
+    return None
+
+def page(iterator, skip=0, limit=None):
+    """
+    Returns an iterator over the limit items of iterator that follow the
+    first skip ones.
+    """
+    
+    if limit is None:
+        return itertools.islice(iterator, skip, None)
+    return itertools.islice(iterator, skip, skip + limit)
+
+def file_entries(storage, doc, key):
+    """
+    Returns the set of files of key ('files_read', 'files_written' or
+    'directories') in the phases of a process: path ids for processes in
+    the compact schema, and paths otherwise.
+    """
+    
+    compact = doc.get('schema', 1) >= 2
+    name = 'filename'
+    if key == 'directories':
+        name = 'dirname'
+    
+    entries = set()
+    for phase in doc['phases']:
+        for entry in phase.get(key) or []:
+            if compact:
+                entries.add(entry[0])
+            else:
+                entries.add(entry[name])
+    if doc.get('overflow'):
+        for overflow in storage.find_overflow(doc['_id']):
+            if overflow['key'] == key:
+                entries.update(entry[0] for entry in overflow['entries'])
+    return entries
+
+def process_files(storage, doc, key):
+    """
+    Returns the sorted list of the files of key ('files_read',
+    'files_written' or 'directories') in the phases of a process.
+    """
+    
+    entries = file_entries(storage, doc, key)
+    if doc.get('schema', 1) >= 2:
+        entries = storage.find_paths(doc['session_tag'], entries).values()
+    return sorted(entries)
+
+def io_entries(storage, doc):
+    """
+    Returns an iterator over the I/O counters of the files of a process:
+    (file, bytes read, reads, bytes written, writes), where file is a path
+    id for processes in the compact schema, and a path otherwise.
+    """
+    
+    for phase in doc['phases']:
+        for entry in phase.get('io') or []:
+            if isinstance(entry, dict):
+                yield (entry['filename'], entry['bytes_read'], entry['reads'],
+                       entry['bytes_written'], entry['writes'])
+            else:
+                yield tuple(entry)
+    if doc.get('overflow'):
+        for overflow in storage.find_overflow(doc['_id']):
+            if overflow['key'] == 'io':
+                for entry in overflow['entries']:
+                    yield tuple(entry)
+
+def hottest_files(storage, session_tag, skip=0, limit=None):
+    """
+    Returns the list of the files of a session with the most bytes read
+    and written by its processes, as dicts with filename, bytes_read,
+    reads, bytes_written, writes and processes; skip and limit select a
+    page of them. Pipes are left out.
+    """
+    
+    files = {}
+    compact = False
+    for doc in storage.find_processes(session_tag):
+        compact = doc.get('schema', 1) >= 2
+        seen = set()
+        for entry in io_entries(storage, doc):
+            counters = files.get(entry[0])
+            if counters is None:
+                counters = files[entry[0]] = [0, 0, 0, 0, 0]
+            for i in xrange(4):
+                counters[i] += entry[i + 1]
+            if entry[0] not in seen:
+                seen.add(entry[0])
+                counters[4] += 1
+    
+    if compact:
+        path = storage.find_paths(session_tag, files.keys())
+        files = dict((path[f], counters) for (f, counters) in files.iteritems())
+    
+    ranked = sorted(((f, counters) for (f, counters) in files.iteritems() if not f.startswith('PIPE')),
+                    key=lambda item: item[1][0] + item[1][2], reverse=True)
+    ret = []
+    for (f, (bytes_read, reads, bytes_written, writes, processes)) in page(iter(ranked), skip, limit):
+        ret.append(dict(filename=f, bytes_read=bytes_read, reads=reads,
+                        bytes_written=bytes_written, writes=writes, processes=processes))
+    return ret
+
+def processes_with_file(storage, session_tag, path, key, skip=0, limit=None):
+    """
+    Returns an iterator over the processes of a session whose key
+    ('files_read' or 'files_written') has path, from the first created.
+    The path index is used if it was built; otherwise, the processes are
+    scanned.
+    """
+    
+    path = os.path.abspath(path)
+    path_id = storage.find_path_id(session_tag, path)
+    if path_id is not None:
+        processes = storage.find_path_processes(session_tag, path_id, key, skip, limit)
+        if processes is not None:
+            return processes
+    else:
+        # in the compact schema, every path of the session is in its
+        # dictionary
+        for doc in storage.find_processes(session_tag, limit=1):
+            if doc.get('schema', 1) >= 2:
+                return iter([])
+    
+    def scan():
+        for doc in storage.find_processes(session_tag):
+            entries = file_entries(storage, doc, key)
+            if path_id in entries or path in entries:
+                yield doc
+    
+    return page(scan(), skip, limit)
+
+def readers(storage, session_tag, path, skip=0, limit=None):
+    """
+    Returns an iterator over the processes of a session that read path.
+    """
+    
+    return processes_with_file(storage, session_tag, path, 'files_read', skip, limit)
+
+def writers(storage, session_tag, path, skip=0, limit=None):
+    """
+    Returns an iterator over the processes of a session that wrote path.
+    """
+    
+    return processes_with_file(storage, session_tag, path, 'files_written', skip, limit)
+
+def descendants(storage, session_tag, pid, skip=0, limit=None):
+    """
+    Returns an iterator over the processes of a session that ran under
+    the processes with the given pid, level by level.
+    """
+    
+    def walk():
+        seen = set()
+        parents = list(storage.find_processes(session_tag, pid=pid))
+        while parents:
+            children = []
+            for parent in parents:
+                for doc in storage.find_processes(session_tag, ppid=parent['pid']):
+                    # pids are reused: the children of a process were created
+                    # after it
+                    if doc['_id'] in seen or (parent['creation_time'] is not None and
+                                              doc['creation_time'] is not None and
+                                              doc['creation_time'] < parent['creation_time']):
+                        continue
+                    seen.add(doc['_id'])
+                    children.append(doc)
+                    yield doc
+            parents = children
+    
+    return page(walk(), skip, limit)
+
+def describe(doc):
+    """
+    Returns a line describing a process: pid, ppid, creation time and the
+    command line of its last phase.
+    """
+    
+    argv = None
+    for phase in doc['phases']:
+        if phase['execve_argv'] is not None:
+            argv = phase['execve_argv']
+    return '%s\t%s\t%s\t%s' %(doc['pid'], doc['ppid'], doc['creation_time'], argv)
+
+def query(argv=None):
+    """
+    Answers queries over the processes of a tracing session stored in the
+    database: 'reprozip query ...'.
+    """
+    
+    # options of every query
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--session', '-s',
+                         help='the session to query - by default, the last one traced')
+    options.add_argument('--offset', type=int, default=0,
+                         help='number of results to skip')
+    options.add_argument('--limit', type=int,
+                         help='maximum number of results')
+    
+    parser = argparse.ArgumentParser(prog        = 'reprozip query',
+                                     description = 'queries the provenance of a tracing session')
+    subparsers = parser.add_subparsers(dest='action')
+    for (action, action_help) in (('readers', 'lists the processes that read a file'),
+                                  ('writers', 'lists the processes that wrote a file')):
+        subparsers.add_parser(action, help=action_help, parents=[options]).add_argument('path')
+    for (action, action_help) in (('reads', 'lists the files read by the processes with a pid'),
+                                  ('writes', 'lists the files written by the processes with a pid'),
+                                  ('programs', 'lists the processes that ran under the processes with a pid')):
+        subparsers.add_parser(action, help=action_help, parents=[options]).add_argument('pid', type=int)
+    subparsers.add_parser('hottest', help='lists the files with the most bytes read and written',
+                          parents=[options])
+    args = parser.parse_args(argv)
+    
+    session_tag = args.session or default_session()
+    if session_tag is None:
+        reprozip.debug.error('No session was traced; use --session.')
+        sys.exit(1)
+    
+    try:
+        storage = get_storage()
+    except:
+        sys.exit(1)
+    
+    storage.start()
+    storage.wait()
+    
+    try:
+        storage.connect()
+        
+        if args.action in ('readers', 'writers'):
+            if args.action == 'readers':
+                processes = readers(storage, session_tag, args.path, args.offset, args.limit)
+            else:
+                processes = writers(storage, session_tag, args.path, args.offset, args.limit)
+            for doc in processes:
+                print describe(doc)
+        
+        elif args.action in ('reads', 'writes'):
+            key = 'files_read'
+            if args.action == 'writes':
+                key = 'files_written'
+            files = set()
+            for doc in storage.find_processes(session_tag, pid=args.pid):
+                files.update(process_files(storage, doc, key))
+            for filename in page(iter(sorted(files)), args.offset, args.limit):
+                print filename
+        
+        elif args.action == 'programs':
+            for doc in descendants(storage, session_tag, args.pid, args.offset, args.limit):
+                print describe(doc)
+        
+        elif args.action == 'hottest':
+            for f in hottest_files(storage, session_tag, args.offset, args.limit):
+                print '%d\t%d\t%d\t%d\t%d\t%s' %(f['bytes_read'], f['reads'],
+                                                    f['bytes_written'], f['writes'],
+                                                    f['processes'], f['filename'])
+    except:
+        reprozip.debug.error(sys.exc_info()[1])
+        storage.stop()
+        sys.exit(1)
+    
+    storage.stop()
@@ -0,0 +1,221 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+from reprozip.pack.storage import get_storage
+from reprozip.pack.config_parser import Parser
+import reprozip.debug
+import reprozip.utils
+import datetime
+import argparse
+import shutil
+import time
+import sys
+import re
+import os
+
+# tracing sessions are named after the user and their start time (in ms)
+SESSION_NAME_RE = re.compile(r'^.+-\d+$')
+
+def session_dir(session_tag):
+    """
+    Returns the log directory of a session.
+    """
+    
+    return os.path.join(reprozip.utils.log_basedir(), session_tag)
+
+def list_session_dirs():
+    """
+    Returns the names of the log directories of the sessions.
+    """
+    
+    base_dir = reprozip.utils.log_basedir()
+    if not os.path.isdir(base_dir):
+        return []
+    return sorted(name for name in os.listdir(base_dir)
+                  if SESSION_NAME_RE.match(name) and
+                  os.path.isdir(os.path.join(base_dir, name)) and
+                  not os.path.islink(os.path.join(base_dir, name)))
+
+def remove_session_dir(session_tag):
+    """
+    Removes the log directory of a session, and the current-session or
+    previous-session links to it.
+    """
+    
+    base_dir = reprozip.utils.log_basedir()
+    for link in ('current-session', 'previous-session'):
+        path = os.path.join(base_dir, link)
+        if os.path.islink(path) and os.readlink(path) == session_tag:
+            os.remove(path)
+    
+    path = session_dir(session_tag)
+    if not os.path.isdir(path):
+        return
+    try:
+        shutil.rmtree(path)
+    except OSError:
+        # trace files of SystemTap may belong to root
+        msg = 'Could not remove %s: %s. ' %(path, sys.exc_info()[1])
+        msg += 'You may want to try removing it with reprozip-clean-stap.'
+        reprozip.debug.warning(msg)
+
+def delete_sessions(storage, session_tags):
+    """
+    Removes sessions from the database (a Storage object), with their log
+    directories.
+    """
+    
+    for session_tag in session_tags:
+        storage.delete_session(session_tag)
+        remove_session_dir(session_tag)
+
+def prune_sessions(storage, ttl):
+    """
+    Removes the sessions that were not updated for ttl days, and the log
+    directories older than that (sessions that were not stored in the
+    database, for instance). The current session is never removed.
+    Returns the list of removed sessions.
+    """
+    
+    cutoff = time.time() - ttl * 24 * 3600
+    
+    current = None
+    link = os.path.join(reprozip.utils.log_basedir(), 'current-session')
+    if os.path.islink(link):
+        current = os.readlink(link)
+    
+    expired = set()
+    if storage is not None:
+        limit = datetime.datetime.fromtimestamp(cutoff)
+        for doc in storage.list_sessions():
+            last_updated_time = doc.get('last_updated_time')
+            if last_updated_time is not None and last_updated_time < limit:
+                expired.add(doc['_id'])
+    
+    for name in list_session_dirs():
+        if os.path.getmtime(session_dir(name)) < cutoff:
+            expired.add(name)
+    
+    expired.discard(current)
+    expired = sorted(expired)
+    
+    for session_tag in expired:
+        if storage is not None:
+            storage.delete_session(session_tag)
+        remove_session_dir(session_tag)
+    
+    return expired
+
+def compact_sessions(storage):
+    """
+    Removes the data of the sessions that have no status document (sessions
+    whose packing was interrupted, or whose status expired), and gives the
+    space back. Returns the list of removed sessions.
+    """
+    
+    tags = set(doc['_id'] for doc in storage.list_sessions())
+    orphans = sorted(tag for tag in storage.find_session_tags()
+                     if tag is not None and tag not in tags)
+    for session_tag in orphans:
+        storage.delete_session(session_tag)
+    
+    storage.compact()
+    return orphans
+
+def sessions():
+    """
+    Lists and removes the tracing sessions kept in the database and in
+    the log directory.
+    """
+    
+    parser = argparse.ArgumentParser(prog        = 'reprozip-sessions',
+                                     description = 'manages the tracing sessions of ReproZip')
+    subparsers = parser.add_subparsers(dest='action')
+    subparsers.add_parser('list', help='lists the sessions')
+    delete_parser = subparsers.add_parser('delete', help='removes sessions and their log directories')
+    delete_parser.add_argument('session_tags', nargs='+', metavar='session')
+    subparsers.add_parser('compact', help='removes the data of incomplete sessions and gives the space back')
+    prune_parser = subparsers.add_parser('prune', help='removes the sessions older than a number of days')
+    prune_parser.add_argument('--days', type=float,
+                              help='by default, the session_ttl of the configuration file')
+    args = parser.parse_args()
+    
+    ttl = None
+    if args.action == 'prune':
+        ttl = args.days
+        if ttl is None:
+            ttl = Parser().read_storage_config()[5]
+        if ttl <= 0:
+            reprozip.debug.error('No session_ttl in the configuration file; use --days.')
+            sys.exit(1)
+    
+    try:
+        storage = get_storage()
+    except:
+        sys.exit(1)
+    
+    storage.start()
+    storage.wait()
+    
+    try:
+        storage.connect()
+        
+        if args.action == 'list':
+            dirs = set(list_session_dirs())
+            for doc in storage.list_sessions():
+                session_tag = doc['_id']
+                print '%s  %s  %d processes%s' % (session_tag,
+                                                   doc.get('last_updated_time'),
+                                                   storage.count_processes(session_tag),
+                                                   '' if session_tag in dirs else '  (no log directory)')
+                dirs.discard(session_tag)
+            for name in sorted(dirs):
+                print '%s  (log directory only)' % name
+        
+        elif args.action == 'delete':
+            delete_sessions(storage, args.session_tags)
+        
+        elif args.action == 'compact':
+            for session_tag in compact_sessions(storage):
+                reprozip.debug.success('Removed incomplete session %s' %session_tag)
+        
+        elif args.action == 'prune':
+            for session_tag in prune_sessions(storage, ttl):
+                reprozip.debug.success('Removed session %s' %session_tag)
+    except:
+        reprozip.debug.error(sys.exc_info()[1])
+        storage.stop()
+        sys.exit(1)
+    
+    storage.stop()
@@ -0,0 +1,209 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+from reprozip.pack.storage.storage import Storage
+import reprozip.debug
+import threading
+import Queue
+import sys
+
+# maximum number of writes waiting for the database; the parser blocks
+# beyond that, so that documents do not pile up in memory
+QUEUE_SIZE = 4096
+
+class AsyncStorage(Storage):
+    """
+    Storage that hands the writes to another Storage in a background thread,
+    so that parsing the trace does not wait for the database. Queries wait
+    for the writes handed so far.
+    """
+    
+    def __init__(self, storage):
+        """
+        Init method.
+        
+        -> storage is the Storage object where the documents are written
+        """
+        
+        self.__storage = storage
+        self.__queue = Queue.Queue(QUEUE_SIZE)
+        self.__thread = None
+        self.__error = None
+        
+    def get_storage(self):
+        return self.__storage
+    
+    def __run(self):
+        while True:
+            (method, args) = self.__queue.get()
+            try:
+                if method is None:
+                    return
+                # once a write fails, the following ones are discarded
+                if self.__error is None:
+                    getattr(self.__storage, method)(*args)
+            except:
+                self.__error = sys.exc_info()[1]
+            finally:
+                self.__queue.task_done()
+        
+    def __check_error(self):
+        if self.__error is not None:
+            reprozip.debug.error('Could not write to the database: %s' %self.__error)
+            raise Exception
+        
+    def __put(self, method, *args):
+        self.__check_error()
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__run)
+            self.__thread.daemon = True
+            self.__thread.start()
+        self.__queue.put((method, args))
+        
+    def sync(self):
+        """
+        Waits for the writes handed so far.
+        """
+        
+        if self.__thread is not None:
+            self.__queue.join()
+        self.__check_error()
+        
+    def start(self):
+        self.__storage.start()
+        
+    def wait(self):
+        self.__storage.wait()
+        
+    def stop(self):
+        if self.__thread is not None:
+            self.__queue.put((None, ()))
+            self.__thread.join()
+            self.__thread = None
+        self.__storage.stop()
+        self.__check_error()
+        
+    def connect(self):
+        self.__put('connect')
+        
+    def open_session(self, session_tag):
+        self.__put('open_session', session_tag)
+        
+    def save_process(self, doc):
+        self.__put('save_process', doc)
+        
+    def remove_process(self, id):
+        self.__put('remove_process', id)
+        
+    def remove_overflow(self, process_id):
+        self.__put('remove_overflow', process_id)
+        
+    def save_overflow(self, doc):
+        self.__put('save_overflow', doc)
+        
+    def save_paths(self, session_tag, paths):
+        self.__put('save_paths', session_tag, paths)
+        
+    def save_session_status(self, doc):
+        self.__put('save_session_status', doc)
+        
+    def flush(self):
+        self.__put('flush')
+        
+    def build_indices(self, session_tag=None):
+        self.__put('build_indices', session_tag)
+        
+    def find_main_process(self, argv_regex):
+        self.sync()
+        return self.__storage.find_main_process(argv_regex)
+    
+    def find_child_processes(self, ppid, start_time, light=False):
+        self.sync()
+        return self.__storage.find_child_processes(ppid, start_time, light)
+    
+    def can_aggregate(self):
+        return self.__storage.can_aggregate()
+    
+    def aggregate_files(self, process_ids):
+        self.sync()
+        return self.__storage.aggregate_files(process_ids)
+    
+    def find_processes(self, session_tag, pid=None, ppid=None, skip=0, limit=None):
+        self.sync()
+        return self.__storage.find_processes(session_tag, pid, ppid, skip, limit)
+    
+    def find_processes_in_window(self, session_tag, start=None, end=None):
+        self.sync()
+        return self.__storage.find_processes_in_window(session_tag, start, end)
+    
+    def find_path_id(self, session_tag, path):
+        self.sync()
+        return self.__storage.find_path_id(session_tag, path)
+    
+    def find_path_processes(self, session_tag, path_id, key, skip=0, limit=None):
+        self.sync()
+        return self.__storage.find_path_processes(session_tag, path_id, key, skip, limit)
+    
+    def find_overflow(self, process_id):
+        self.sync()
+        return self.__storage.find_overflow(process_id)
+    
+    def find_paths(self, session_tag, ids):
+        self.sync()
+        return self.__storage.find_paths(session_tag, ids)
+    
+    def list_sessions(self):
+        self.sync()
+        return self.__storage.list_sessions()
+    
+    def find_session_tags(self):
+        self.sync()
+        return self.__storage.find_session_tags()
+    
+    def count_processes(self, session_tag):
+        self.sync()
+        return self.__storage.count_processes(session_tag)
+    
+    def delete_session(self, session_tag):
+        self.__put('delete_session', session_tag)
+    
+    def compact(self):
+        self.sync()
+        self.__storage.compact()
+    
+    def drop(self):
+        self.sync()
+        self.__storage.drop()
+    
+    storage = property(get_storage, None, None, None)
@@ -0,0 +1,377 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+from reprozip.pack.storage.storage import Storage, SCHEMA_VERSION, SCHEMA_ID, LIGHT_KEYS
+from reprozip.pack.storage.storage import PATH_INDEX, path_refs
+from reprozip.pack.mongodb import Mongod
+import reprozip.utils
+import reprozip.debug
+import sys
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+# number of entries of the path index inserted at once
+PATH_INDEX_BATCH = 10000
+
+# keys of the indices that can be selected in the configuration file
+# (besides the path index)
+INDEX_KEYS = {'ppid': [('ppid', ASCENDING), ('creation_time', ASCENDING)],
+              # for time range searches too
+              'creation_time': [('creation_time', ASCENDING), ('exit_time', ASCENDING)],
+              'pid': [('pid', ASCENDING)],
+              'exited': [('exited', ASCENDING)],
+              'most_recent_event_timestamp': [('most_recent_event_timestamp', ASCENDING)],
+              'phases.name': [('phases.name', ASCENDING)],
+              'phases.start_time': [('phases.start_time', ASCENDING)],
+              'phases.files_read.timestamp': [('phases.files_read.timestamp', ASCENDING)],
+              'phases.files_written.timestamp': [('phases.files_written.timestamp', ASCENDING)],
+              'phases.files_renamed.timestamp': [('phases.files_renamed.timestamp', ASCENDING)]}
+
+class MongoStorage(Storage):
+    """
+    Storage in MongoDB, in a mongod instance started by ReproZip (unless the
+    configuration file says otherwise). All the users of the storage share
+    the client of that instance (see Mongod.client).
+    """
+    
+    def __init__(self, indices):
+        """
+        Init method.
+        
+        -> indices is the list of names of the indices to build (see
+           reprozip.pack.storage.storage.INDICES)
+        """
+        
+        self.__mongod = Mongod()
+        self.__conn = None
+        self.__proc_col = None
+        self.__session_status_col = None
+        self.__path_col = None
+        self.__overflow_col = None
+        self.__path_index_col = None
+        self.__indices = set(indices)
+        self.__schema = None
+        
+    def get_port(self):
+        return self.__mongod.port
+    
+    def start(self):
+        self.__mongod.run()
+        
+    def wait(self):
+        self.__mongod.wait()
+        
+    def stop(self):
+        self.__conn = None
+        self.__mongod.stop()
+        
+    def connect(self):
+        if self.__conn is not None:
+            return
+        
+        try:
+            self.__conn = self.__mongod.client
+            db = self.__conn[reprozip.utils.mongodb_database]
+        except:
+            reprozip.debug.error('Could not connect to MongoDB: %s' %sys.exc_info()[1])
+            raise Exception
+        
+        self.__proc_col = db[reprozip.utils.mongodb_collection]
+        self.__session_status_col = db[reprozip.utils.mongodb_session_collection]
+        self.__path_col = db[reprozip.utils.mongodb_path_collection]
+        self.__overflow_col = db[reprozip.utils.mongodb_overflow_collection]
+        self.__path_index_col = db[reprozip.utils.mongodb_path_index_collection]
+        
+    def __get_schema(self):
+        """
+        Method that returns the schema document of the database, setting
+        up the database if it was not set up yet.
+        """
+        
+        if self.__schema is not None:
+            return self.__schema
+        
+        schema = self.__session_status_col.find_one({'_id': SCHEMA_ID})
+        if schema is None or schema['version'] < SCHEMA_VERSION:
+            if schema is None and self.__proc_col.find_one() is not None:
+                # version 0 created every index at each session: they are
+                # rebuilt (if selected) after the next session
+                self.__proc_col.drop_indexes()
+                schema = None
+            self.__proc_col.ensure_index('session_tag')
+            self.__path_col.ensure_index([('session_tag', ASCENDING), ('path_id', ASCENDING)])
+            self.__overflow_col.ensure_index('process_id')
+            self.__overflow_col.ensure_index('session_tag')
+            
+            if schema is None:
+                schema = {'_id': SCHEMA_ID, 'indices': []}
+            schema['version'] = SCHEMA_VERSION
+            self.__session_status_col.save(schema)
+        
+        self.__schema = schema
+        return schema
+        
+    def open_session(self, session_tag):
+        self.__get_schema()
+        self.delete_session(session_tag)
+        
+    def build_indices(self, session_tag=None):
+        schema = self.__get_schema()
+        built = set(schema['indices'])
+        if built == self.__indices:
+            if session_tag is not None and PATH_INDEX in built:
+                self.__index_paths([session_tag])
+            return
+        
+        for name in built - self.__indices:
+            if name == PATH_INDEX:
+                self.__path_index_col.drop()
+                keys = [('session_tag', ASCENDING), ('path', ASCENDING)]
+                col = self.__path_col
+            else:
+                keys = INDEX_KEYS[name]
+                col = self.__proc_col
+            try:
+                col.drop_index(keys)
+            except OperationFailure:
+                pass # removed by hand
+        for name in self.__indices - built:
+            if name == PATH_INDEX:
+                self.__path_index_col.ensure_index([('session_tag', ASCENDING),
+                                                    ('path_id', ASCENDING),
+                                                    ('key', ASCENDING)])
+                self.__path_col.ensure_index([('session_tag', ASCENDING), ('path', ASCENDING)])
+                self.__index_paths(self.__proc_col.distinct('session_tag'))
+            else:
+                self.__proc_col.ensure_index(INDEX_KEYS[name])
+        
+        schema['indices'] = sorted(self.__indices)
+        self.__session_status_col.save(schema)
+        
+    def __index_paths(self, session_tags):
+        """
+        Method that adds the paths read and written by the processes of the
+        given sessions to the path index.
+        """
+        
+        for session_tag in session_tags:
+            self.__path_index_col.remove({'session_tag': session_tag})
+            entries = set()
+            for col in (self.__proc_col, self.__overflow_col):
+                for doc in col.find({'session_tag': session_tag}):
+                    process_id = doc.get('process_id', doc['_id'])
+                    entries.update((path_id, key, process_id) for (path_id, key) in path_refs(doc))
+            entries = [{'session_tag': session_tag, 'path_id': path_id,
+                        'key': key, 'process_id': process_id}
+                       for (path_id, key, process_id) in entries]
+            for start in xrange(0, len(entries), PATH_INDEX_BATCH):
+                self.__path_index_col.insert(entries[start:start + PATH_INDEX_BATCH])
+        
+    def save_process(self, doc):
+        self.__proc_col.save(doc) # does an insert (if not-exist) or update (if exists)
+        
+    def remove_process(self, id):
+        self.__proc_col.remove({'_id': id})
+        
+    def remove_overflow(self, process_id):
+        self.__overflow_col.remove({'process_id': process_id})
+        
+    def save_overflow(self, doc):
+        self.__overflow_col.save(doc)
+        
+    def save_paths(self, session_tag, paths):
+        if paths:
+            self.__path_col.insert([{'session_tag': session_tag, 'path_id': i, 'path': path}
+                                    for (i, path) in paths])
+        
+    def save_session_status(self, doc):
+        self.__session_status_col.save(doc)
+        
+    def find_main_process(self, argv_regex):
+        cursor = self.__proc_col.find({'phases.execve_argv':
+                                       {'$regex': argv_regex}})
+        cursor = cursor.sort('creation_time', DESCENDING).limit(1)
+        for doc in cursor:
+            return doc
+        return None
+    
+    def find_child_processes(self, ppid, start_time, light=False):
+        fields = None
+        if light:
+            fields = dict(('phases.%s' % key, 0) for key in LIGHT_KEYS)
+        cursor = self.__proc_col.find({'$and': [
+                                                {'ppid': ppid},
+                                                {'creation_time': {'$gte': start_time}}
+                                                ]}, fields)
+        return list(cursor)
+    
+    def can_aggregate(self):
+        # $isArray and $arrayElemAt
+        return tuple(self.__conn.server_info()['versionArray'][:2]) >= (3, 2)
+    
+    def __aggregate(self, col, pipeline):
+        result = col.aggregate(pipeline)
+        if isinstance(result, dict):
+            result = result['result'] # pymongo 2 returns the command response
+        return result
+    
+    def aggregate_files(self, process_ids):
+        ids = list(process_ids)
+        
+        def field(name, i):
+            # entries of the compact schema are lists, and dicts otherwise
+            return {'$cond': [{'$isArray': '$entries'},
+                              {'$arrayElemAt': ['$entries', i]},
+                              '$entries.' + name]}
+        
+        ret = {}
+        for (key, name) in (('files_read', 'filename'),
+                            ('files_written', 'filename'),
+                            ('directories', 'dirname')):
+            values = set()
+            for doc in self.__aggregate(self.__proc_col,
+                                        [{'$match': {'_id': {'$in': ids}}},
+                                         {'$unwind': '$phases'},
+                                         {'$project': {'entries': '$phases.' + key}},
+                                         {'$unwind': '$entries'},
+                                         {'$group': {'_id': field(name, 0)}}]):
+                values.add(doc['_id'])
+            for doc in self.__aggregate(self.__overflow_col,
+                                        [{'$match': {'process_id': {'$in': ids}, 'key': key}},
+                                         {'$unwind': '$entries'},
+                                         {'$group': {'_id': {'$arrayElemAt': ['$entries', 0]}}}]):
+                values.add(doc['_id'])
+            ret[key] = values
+        
+        ret['symlinks'] = {}
+        for doc in self.__aggregate(self.__proc_col,
+                                    [{'$match': {'_id': {'$in': ids}}},
+                                     {'$unwind': '$phases'},
+                                     {'$project': {'entries': '$phases.symlinks'}},
+                                     {'$unwind': '$entries'},
+                                     {'$group': {'_id': {'symlink': field('symlink', 0),
+                                                         'target': field('target', 1)}}}]):
+            ret['symlinks'][doc['_id']['symlink']] = doc['_id']['target']
+        
+        return ret
+    
+    def find_processes(self, session_tag, pid=None, ppid=None, skip=0, limit=None):
+        spec = {'session_tag': session_tag}
+        if pid is not None:
+            spec['pid'] = pid
+        if ppid is not None:
+            spec['ppid'] = ppid
+        cursor = self.__proc_col.find(spec).sort('creation_time', ASCENDING).skip(skip)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return cursor
+    
+    def find_processes_in_window(self, session_tag, start=None, end=None):
+        spec = {'session_tag': session_tag}
+        if end is not None:
+            spec['creation_time'] = {'$lte': reprozip.utils.encode_datetime(end)}
+        if start is not None:
+            # ms in the compact schema, and datetimes before
+            spec['$or'] = [{'most_recent_event_timestamp': {'$gte': start}},
+                           {'most_recent_event_timestamp': {'$gte': reprozip.utils.encode_datetime(start)}}]
+        return self.__proc_col.find(spec).sort('creation_time', ASCENDING)
+    
+    def find_path_id(self, session_tag, path):
+        doc = self.__path_col.find_one({'session_tag': session_tag, 'path': path})
+        if doc is None:
+            return None
+        return doc['path_id']
+    
+    def find_path_processes(self, session_tag, path_id, key, skip=0, limit=None):
+        if PATH_INDEX not in self.__get_schema()['indices']:
+            return None
+        ids = [doc['process_id'] for doc in self.__path_index_col.find({'session_tag': session_tag,
+                                                                         'path_id': path_id,
+                                                                         'key': key},
+                                                                        {'process_id': 1})]
+        cursor = self.__proc_col.find({'_id': {'$in': ids}}).sort('creation_time', ASCENDING).skip(skip)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return cursor
+    
+    def find_overflow(self, process_id):
+        return list(self.__overflow_col.find({'process_id': process_id}))
+    
+    def find_paths(self, session_tag, ids):
+        cursor = self.__path_col.find({'session_tag': session_tag,
+                                       'path_id': {'$in': list(ids)}})
+        return dict((doc['path_id'], doc['path']) for doc in cursor)
+    
+    def list_sessions(self):
+        cursor = self.__session_status_col.find({'_id': {'$ne': SCHEMA_ID}})
+        return list(cursor.sort('last_updated_time', ASCENDING))
+    
+    def find_session_tags(self):
+        tags = set()
+        for col in (self.__proc_col, self.__overflow_col, self.__path_col):
+            tags.update(col.distinct('session_tag'))
+        return tags
+    
+    def count_processes(self, session_tag):
+        return self.__proc_col.find({'session_tag': session_tag}).count()
+    
+    def delete_session(self, session_tag):
+        self.__proc_col.remove({"session_tag": session_tag})
+        self.__overflow_col.remove({"session_tag": session_tag})
+        self.__path_col.remove({"session_tag": session_tag})
+        self.__path_index_col.remove({"session_tag": session_tag})
+        self.__session_status_col.remove({"_id": session_tag})
+    
+    def compact(self):
+        db = self.__conn[reprozip.utils.mongodb_database]
+        for name in (reprozip.utils.mongodb_collection,
+                     reprozip.utils.mongodb_overflow_collection,
+                     reprozip.utils.mongodb_path_collection,
+                     reprozip.utils.mongodb_path_index_collection):
+            try:
+                db.command('compact', name)
+            except OperationFailure:
+                reprozip.debug.warning('Could not compact %s: %s' %(name, sys.exc_info()[1]))
+    
+    def drop(self):
+        db = self.__conn[reprozip.utils.mongodb_database]
+        db.drop_collection(reprozip.utils.mongodb_collection)
+        db.drop_collection(reprozip.utils.mongodb_session_collection)
+        db.drop_collection(reprozip.utils.mongodb_path_collection)
+        db.drop_collection(reprozip.utils.mongodb_overflow_collection)
+        db.drop_collection(reprozip.utils.mongodb_path_index_collection)
+        self.__schema = None
+    
+    port = property(get_port, None, None, None)
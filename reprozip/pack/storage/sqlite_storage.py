@@ -0,0 +1,533 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+from reprozip.pack.storage.storage import Storage, SCHEMA_VERSION, SCHEMA_ID, LIGHT_KEYS
+from reprozip.pack.storage.storage import PATH_INDEX, path_refs
+import reprozip.utils
+import reprozip.debug
+import datetime
+import sqlite3
+import json
+import sys
+import re
+import os
+
+# datetimes are stored as text in this format, which sorts as they do
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# columns of the indices that can be selected in the configuration file;
+# the other fields are only in the JSON documents, which are not indexed
+INDEX_COLUMNS = {'ppid': '(ppid, creation_time)',
+                 'creation_time': '(creation_time)',
+                 'pid': '(pid)'}
+
+def encode_value(o):
+    """
+    Encodes the values JSON does not handle (datetimes).
+    """
+    
+    if isinstance(o, datetime.datetime):
+        return {'$date': o.strftime(DATETIME_FORMAT)}
+    raise TypeError(repr(o))
+
+def decode_object(d):
+    """
+    Decodes the values encoded by encode_value().
+    """
+    
+    if len(d) == 1 and '$date' in d:
+        return datetime.datetime.strptime(d['$date'], DATETIME_FORMAT)
+    return d
+
+def encode_doc(doc):
+    return json.dumps(doc, default=encode_value, separators=(',', ':'))
+
+def decode_doc(text):
+    return json.loads(text, object_hook=decode_object)
+
+class SQLiteStorage(Storage):
+    """
+    Storage in an embedded SQLite database: there is no server to start,
+    which saves the startup of mongod for single-node use.
+    
+    The processes are stored as JSON documents, next to the columns used
+    by the queries of ReproZip (ppid, session and creation time, and the
+    command lines of the phases). Saved processes are buffered and
+    written in a single transaction by flush().
+    """
+    
+    def __init__(self, path, indices):
+        """
+        Init method.
+        
+        -> path is the database file
+        -> indices is the list of names of the indices to build (see
+           reprozip.pack.storage.storage.INDICES); the ones that are not
+           in INDEX_COLUMNS, or the path index, are ignored
+        """
+        
+        self.__path = path
+        self.__conn = None
+        self.__indices = set(i for i in indices if i in INDEX_COLUMNS or i == PATH_INDEX)
+        self.__schema = None
+        
+        # unique id -> row of the processes saved since the last flush(),
+        # and unique ids of the processes removed since then
+        self.__pending = {}
+        self.__removed = set()
+        
+        # the same, for overflow documents: rows saved, and process ids
+        # whose overflow documents were removed
+        self.__pending_overflow = []
+        self.__removed_overflow = set()
+        
+        # compiled REGEXP patterns
+        self.__patterns = {}
+        
+        # whether the JSON1 extension is available (see can_aggregate)
+        self.__json = None
+        
+    def get_path(self):
+        return self.__path
+    
+    def __regexp(self, pattern, value):
+        if value is None:
+            return False
+        r = self.__patterns.get(pattern)
+        if r is None:
+            r = re.compile(pattern)
+            self.__patterns[pattern] = r
+        return r.search(value) is not None
+        
+    def connect(self):
+        if self.__conn is not None:
+            return
+        
+        try:
+            d = os.path.dirname(self.__path)
+            if d and not os.path.exists(d):
+                os.makedirs(d)
+            
+            # the connection is shared with the thread that stores trace
+            # chunks while the experiment runs (see ChunkConsumer), which
+            # is serialized with the rest of the parsing by Provenance
+            self.__conn = sqlite3.connect(self.__path, check_same_thread=False)
+            self.__conn.isolation_level = None # explicit transactions
+            self.__conn.execute('PRAGMA journal_mode=WAL')
+            self.__conn.execute('PRAGMA synchronous=NORMAL')
+            self.__conn.create_function('REGEXP', 2, self.__regexp)
+            
+            self.__conn.execute('CREATE TABLE IF NOT EXISTS %s ('
+                                '_id TEXT PRIMARY KEY, '
+                                'session_tag TEXT, '
+                                'pid INTEGER, '
+                                'ppid INTEGER, '
+                                'creation_time TEXT, '
+                                'execve_argv TEXT, '
+                                'doc TEXT)' % reprozip.utils.mongodb_collection)
+            self.__conn.execute('CREATE TABLE IF NOT EXISTS %s ('
+                                '_id TEXT PRIMARY KEY, '
+                                'doc TEXT)' % reprozip.utils.mongodb_session_collection)
+            self.__conn.execute('CREATE TABLE IF NOT EXISTS %s ('
+                                'session_tag TEXT, '
+                                'path_id INTEGER, '
+                                'path TEXT, '
+                                'PRIMARY KEY (session_tag, path_id))' % reprozip.utils.mongodb_path_collection)
+            self.__conn.execute('CREATE TABLE IF NOT EXISTS %s ('
+                                '_id TEXT PRIMARY KEY, '
+                                'process_id TEXT, '
+                                'session_tag TEXT, '
+                                'doc TEXT)' % reprozip.utils.mongodb_overflow_collection)
+            self.__conn.execute('CREATE TABLE IF NOT EXISTS %s ('
+                                'session_tag TEXT, '
+                                'path_id INTEGER, '
+                                'key TEXT, '
+                                'process_id TEXT)' % reprozip.utils.mongodb_path_index_collection)
+        except:
+            reprozip.debug.error('Could not open the SQLite database %s: %s' %(self.__path, sys.exc_info()[1]))
+            raise Exception
+        
+    def stop(self):
+        if self.__conn is not None:
+            self.flush()
+            self.__conn.close()
+            self.__conn = None
+        
+    def __get_schema(self):
+        """
+        Method that returns the schema document of the database, setting
+        up the database if it was not set up yet.
+        """
+        
+        if self.__schema is not None:
+            return self.__schema
+        
+        col = reprozip.utils.mongodb_collection
+        schema = None
+        for (doc,) in self.__conn.execute('SELECT doc FROM %s WHERE _id = ?' % reprozip.utils.mongodb_session_collection,
+                                          (SCHEMA_ID,)):
+            schema = decode_doc(doc)
+        
+        if schema is None or schema['version'] < SCHEMA_VERSION:
+            if schema is None:
+                # version 0 created the indices on ppid and creation_time
+                # at each session, with the same names
+                built = [name for (name,) in self.__conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+                schema = {'_id': SCHEMA_ID,
+                          'indices': sorted(i for i in INDEX_COLUMNS if '%s_%s' % (col, i) in built)}
+            self.__conn.execute('CREATE INDEX IF NOT EXISTS %s_session_tag ON %s (session_tag)' % (col, col))
+            overflow = reprozip.utils.mongodb_overflow_collection
+            self.__conn.execute('CREATE INDEX IF NOT EXISTS %s_process_id ON %s (process_id)' % (overflow, overflow))
+            self.__conn.execute('CREATE INDEX IF NOT EXISTS %s_session_tag ON %s (session_tag)' % (overflow, overflow))
+            schema['version'] = SCHEMA_VERSION
+            self.save_session_status(schema)
+        
+        self.__schema = schema
+        return schema
+        
+    def open_session(self, session_tag):
+        self.__get_schema()
+        self.delete_session(session_tag)
+        
+    def delete_session(self, session_tag):
+        self.flush()
+        self.__conn.execute('BEGIN')
+        self.__conn.execute('DELETE FROM %s WHERE session_tag = ?' % reprozip.utils.mongodb_collection,
+                            (session_tag,))
+        self.__conn.execute('DELETE FROM %s WHERE session_tag = ?' % reprozip.utils.mongodb_overflow_collection,
+                            (session_tag,))
+        self.__conn.execute('DELETE FROM %s WHERE session_tag = ?' % reprozip.utils.mongodb_path_collection,
+                            (session_tag,))
+        self.__conn.execute('DELETE FROM %s WHERE session_tag = ?' % reprozip.utils.mongodb_path_index_collection,
+                            (session_tag,))
+        self.__conn.execute('DELETE FROM %s WHERE _id = ?' % reprozip.utils.mongodb_session_collection,
+                            (session_tag,))
+        self.__conn.execute('COMMIT')
+        
+    def build_indices(self, session_tag=None):
+        schema = self.__get_schema()
+        built = set(schema['indices'])
+        if built == self.__indices:
+            if session_tag is not None and PATH_INDEX in built:
+                self.__index_paths([session_tag])
+            return
+        
+        col = reprozip.utils.mongodb_collection
+        path_col = reprozip.utils.mongodb_path_collection
+        index_col = reprozip.utils.mongodb_path_index_collection
+        for name in built - self.__indices:
+            if name == PATH_INDEX:
+                self.__conn.execute('DELETE FROM %s' % index_col)
+                self.__conn.execute('DROP INDEX IF EXISTS %s_entry' % index_col)
+                self.__conn.execute('DROP INDEX IF EXISTS %s_path' % path_col)
+            else:
+                self.__conn.execute('DROP INDEX IF EXISTS %s_%s' % (col, name))
+        for name in self.__indices - built:
+            if name == PATH_INDEX:
+                self.__conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS %s_entry ON %s (session_tag, path_id, key, process_id)'
+                                    % (index_col, index_col))
+                self.__conn.execute('CREATE INDEX IF NOT EXISTS %s_path ON %s (session_tag, path)' % (path_col, path_col))
+                self.__index_paths([tag for (tag,) in self.__conn.execute('SELECT DISTINCT session_tag FROM %s' % col)])
+            else:
+                self.__conn.execute('CREATE INDEX IF NOT EXISTS %s_%s ON %s %s' % (col, name, col, INDEX_COLUMNS[name]))
+        
+        schema['indices'] = sorted(self.__indices)
+        self.save_session_status(schema)
+        
+    def __index_paths(self, session_tags):
+        """
+        Method that adds the paths read and written by the processes of the
+        given sessions to the path index.
+        """
+        
+        self.flush()
+        index_col = reprozip.utils.mongodb_path_index_collection
+        self.__conn.execute('BEGIN')
+        try:
+            for session_tag in session_tags:
+                self.__conn.execute('DELETE FROM %s WHERE session_tag = ?' % index_col, (session_tag,))
+                rows = []
+                for name in (reprozip.utils.mongodb_collection,
+                             reprozip.utils.mongodb_overflow_collection):
+                    for (id, doc) in self.__conn.execute('SELECT _id, doc FROM %s WHERE session_tag = ?' % name,
+                                                         (session_tag,)):
+                        doc = decode_doc(doc)
+                        process_id = doc.get('process_id', id)
+                        rows.extend((session_tag, path_id, key, process_id) for (path_id, key) in path_refs(doc))
+                self.__conn.executemany('INSERT OR IGNORE INTO %s VALUES (?, ?, ?, ?)' % index_col, rows)
+            self.__conn.execute('COMMIT')
+        except:
+            self.__conn.execute('ROLLBACK')
+            reprozip.debug.error('Could not build the path index: %s' %sys.exc_info()[1])
+            raise Exception
+        
+    def save_process(self, doc):
+        creation_time = doc['creation_time']
+        if creation_time is not None:
+            creation_time = creation_time.strftime(DATETIME_FORMAT)
+        argv = [p['execve_argv'] for p in doc['phases'] if p['execve_argv'] is not None]
+        self.__pending[doc['_id']] = (doc['_id'], doc.get('session_tag'), doc['pid'],
+                                      doc['ppid'], creation_time, '\n'.join(argv),
+                                      encode_doc(doc))
+        
+    def remove_process(self, id):
+        self.__pending.pop(id, None)
+        self.__removed.add(id)
+        
+    def remove_overflow(self, process_id):
+        self.__pending_overflow = [row for row in self.__pending_overflow if row[1] != process_id]
+        self.__removed_overflow.add(process_id)
+        
+    def save_overflow(self, doc):
+        self.__pending_overflow.append((doc['_id'], doc['process_id'], doc.get('session_tag'),
+                                        encode_doc(doc)))
+        
+    def save_paths(self, session_tag, paths):
+        self.__conn.execute('BEGIN')
+        self.__conn.executemany('INSERT OR REPLACE INTO %s VALUES (?, ?, ?)' % reprozip.utils.mongodb_path_collection,
+                                [(session_tag, i, path) for (i, path) in paths])
+        self.__conn.execute('COMMIT')
+        
+    def save_session_status(self, doc):
+        self.__conn.execute('INSERT OR REPLACE INTO %s VALUES (?, ?)' % reprozip.utils.mongodb_session_collection,
+                            (doc['_id'], encode_doc(doc)))
+        
+    def flush(self):
+        if not (self.__pending or self.__removed or
+                self.__pending_overflow or self.__removed_overflow):
+            return
+        
+        col = reprozip.utils.mongodb_collection
+        overflow = reprozip.utils.mongodb_overflow_collection
+        self.__conn.execute('BEGIN')
+        try:
+            self.__conn.executemany('DELETE FROM %s WHERE _id = ?' % col,
+                                    [(id,) for id in self.__removed if id not in self.__pending])
+            self.__conn.executemany('INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?, ?, ?, ?)' % col,
+                                    self.__pending.itervalues())
+            self.__conn.executemany('DELETE FROM %s WHERE process_id = ?' % overflow,
+                                    [(id,) for id in self.__removed_overflow])
+            self.__conn.executemany('INSERT OR REPLACE INTO %s VALUES (?, ?, ?, ?)' % overflow,
+                                    self.__pending_overflow)
+            self.__conn.execute('COMMIT')
+        except:
+            self.__conn.execute('ROLLBACK')
+            reprozip.debug.error('Could not write to the SQLite database: %s' %sys.exc_info()[1])
+            raise Exception
+        
+        self.__pending = {}
+        self.__removed = set()
+        self.__pending_overflow = []
+        self.__removed_overflow = set()
+        
+    def find_main_process(self, argv_regex):
+        self.flush()
+        cursor = self.__conn.execute('SELECT doc FROM %s WHERE execve_argv REGEXP ? '
+                                     'ORDER BY creation_time DESC LIMIT 1' % reprozip.utils.mongodb_collection,
+                                     (argv_regex,))
+        for (doc,) in cursor:
+            return decode_doc(doc)
+        return None
+    
+    def find_child_processes(self, ppid, start_time, light=False):
+        self.flush()
+        doc = 'doc'
+        if light and self.can_aggregate():
+            # the lists are removed before the documents are decoded
+            doc = ("json_set(doc, '$.phases', (SELECT json_group_array(json(json_remove(ph.value, %s))) "
+                   "FROM json_each(doc, '$.phases') ph))" % ', '.join("'$.%s'" % key for key in LIGHT_KEYS))
+        cursor = self.__conn.execute('SELECT %s FROM %s WHERE ppid = ? AND creation_time >= ?' % (doc, reprozip.utils.mongodb_collection),
+                                     (ppid, start_time.strftime(DATETIME_FORMAT)))
+        return [decode_doc(doc) for (doc,) in cursor]
+    
+    def can_aggregate(self):
+        # JSON1 extension
+        if self.__json is None:
+            try:
+                self.__conn.execute("SELECT json('[]')")
+                self.__json = True
+            except sqlite3.OperationalError:
+                self.__json = False
+        return self.__json
+    
+    def aggregate_files(self, process_ids):
+        self.flush()
+        ids = list(process_ids)
+        col = reprozip.utils.mongodb_collection
+        overflow = reprozip.utils.mongodb_overflow_collection
+        
+        def field(name, i):
+            # entries of the compact schema are lists, and dicts otherwise
+            return ("CASE json_type(e.value) WHEN 'array' THEN json_extract(e.value, '$[%d]') "
+                    "ELSE json_extract(e.value, '$.%s') END" % (i, name))
+        
+        ret = dict(files_read=set(), files_written=set(), directories=set(), symlinks={})
+        # SQLite limits the number of parameters of a statement
+        for start in xrange(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            for (key, name) in (('files_read', 'filename'),
+                                ('files_written', 'filename'),
+                                ('directories', 'dirname')):
+                cursor = self.__conn.execute("SELECT DISTINCT %s FROM %s p, json_each(p.doc, '$.phases') ph, "
+                                             "json_each(ph.value, '$.%s') e "
+                                             "WHERE p._id IN (%s) AND json_type(ph.value, '$.%s') = 'array'"
+                                             % (field(name, 0), col, key, marks, key), chunk)
+                ret[key].update(value for (value,) in cursor)
+                cursor = self.__conn.execute("SELECT DISTINCT json_extract(e.value, '$[0]') FROM %s o, json_each(o.doc, '$.entries') e "
+                                             "WHERE o.process_id IN (%s) AND json_extract(o.doc, '$.key') = ?"
+                                             % (overflow, marks), chunk + [key])
+                ret[key].update(value for (value,) in cursor)
+            
+            cursor = self.__conn.execute("SELECT DISTINCT %s, %s FROM %s p, json_each(p.doc, '$.phases') ph, "
+                                         "json_each(ph.value, '$.symlinks') e "
+                                         "WHERE p._id IN (%s) AND json_type(ph.value, '$.symlinks') = 'array'"
+                                         % (field('symlink', 0), field('target', 1), col, marks), chunk)
+            ret['symlinks'].update(cursor)
+        
+        return ret
+    
+    def find_processes(self, session_tag, pid=None, ppid=None, skip=0, limit=None):
+        self.flush()
+        conditions = ['session_tag = ?']
+        args = [session_tag]
+        if pid is not None:
+            conditions.append('pid = ?')
+            args.append(pid)
+        if ppid is not None:
+            conditions.append('ppid = ?')
+            args.append(ppid)
+        if limit is None:
+            limit = -1
+        cursor = self.__conn.execute('SELECT doc FROM %s WHERE %s ORDER BY creation_time LIMIT ? OFFSET ?'
+                                     % (reprozip.utils.mongodb_collection, ' AND '.join(conditions)),
+                                     args + [limit, skip])
+        return (decode_doc(doc) for (doc,) in cursor)
+    
+    def find_processes_in_window(self, session_tag, start=None, end=None):
+        self.flush()
+        conditions = ['session_tag = ?']
+        args = [session_tag]
+        if end is not None:
+            conditions.append('creation_time <= ?')
+            args.append(reprozip.utils.encode_datetime(end).strftime(DATETIME_FORMAT))
+        cursor = self.__conn.execute('SELECT doc FROM %s WHERE %s ORDER BY creation_time'
+                                     % (reprozip.utils.mongodb_collection, ' AND '.join(conditions)),
+                                     args)
+        
+        # the most recent event is only in the document
+        for (doc,) in cursor:
+            doc = decode_doc(doc)
+            if start is None or reprozip.utils.decode_datetime(doc['most_recent_event_timestamp']) >= start:
+                yield doc
+    
+    def find_path_id(self, session_tag, path):
+        cursor = self.__conn.execute('SELECT path_id FROM %s WHERE session_tag = ? AND path = ?'
+                                     % reprozip.utils.mongodb_path_collection, (session_tag, path))
+        for (path_id,) in cursor:
+            return path_id
+        return None
+    
+    def find_path_processes(self, session_tag, path_id, key, skip=0, limit=None):
+        if PATH_INDEX not in self.__get_schema()['indices']:
+            return None
+        self.flush()
+        if limit is None:
+            limit = -1
+        cursor = self.__conn.execute('SELECT p.doc FROM %s i JOIN %s p ON p._id = i.process_id '
+                                     'WHERE i.session_tag = ? AND i.path_id = ? AND i.key = ? '
+                                     'ORDER BY p.creation_time LIMIT ? OFFSET ?'
+                                     % (reprozip.utils.mongodb_path_index_collection, reprozip.utils.mongodb_collection),
+                                     (session_tag, path_id, key, limit, skip))
+        return (decode_doc(doc) for (doc,) in cursor)
+    
+    def find_overflow(self, process_id):
+        self.flush()
+        cursor = self.__conn.execute('SELECT doc FROM %s WHERE process_id = ?' % reprozip.utils.mongodb_overflow_collection,
+                                     (process_id,))
+        return [decode_doc(doc) for (doc,) in cursor]
+    
+    def find_paths(self, session_tag, ids):
+        ids = list(ids)
+        paths = {}
+        # SQLite limits the number of parameters of a statement
+        for start in xrange(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor = self.__conn.execute('SELECT path_id, path FROM %s WHERE session_tag = ? AND path_id IN (%s)'
+                                         % (reprozip.utils.mongodb_path_collection, ','.join('?' * len(chunk))),
+                                         [session_tag] + chunk)
+            paths.update(cursor)
+        return paths
+    
+    def list_sessions(self):
+        sessions = []
+        for (doc,) in self.__conn.execute('SELECT doc FROM %s WHERE _id != ?' % reprozip.utils.mongodb_session_collection,
+                                          (SCHEMA_ID,)):
+            sessions.append(decode_doc(doc))
+        sessions.sort(key=lambda doc: doc.get('last_updated_time'))
+        return sessions
+    
+    def find_session_tags(self):
+        self.flush()
+        tags = set()
+        for name in (reprozip.utils.mongodb_collection,
+                     reprozip.utils.mongodb_overflow_collection,
+                     reprozip.utils.mongodb_path_collection):
+            tags.update(tag for (tag,) in self.__conn.execute('SELECT DISTINCT session_tag FROM %s' % name))
+        return tags
+    
+    def count_processes(self, session_tag):
+        self.flush()
+        cursor = self.__conn.execute('SELECT COUNT(*) FROM %s WHERE session_tag = ?' % reprozip.utils.mongodb_collection,
+                                     (session_tag,))
+        return cursor.fetchone()[0]
+    
+    def compact(self):
+        self.flush()
+        self.__conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.__conn.execute('VACUUM')
+    
+    def drop(self):
+        self.__pending = {}
+        self.__removed = set()
+        self.__pending_overflow = []
+        self.__removed_overflow = set()
+        self.__conn.execute('DROP TABLE IF EXISTS %s' % reprozip.utils.mongodb_collection)
+        self.__conn.execute('DROP TABLE IF EXISTS %s' % reprozip.utils.mongodb_session_collection)
+        self.__conn.execute('DROP TABLE IF EXISTS %s' % reprozip.utils.mongodb_path_collection)
+        self.__conn.execute('DROP TABLE IF EXISTS %s' % reprozip.utils.mongodb_overflow_collection)
+        self.__conn.execute('DROP TABLE IF EXISTS %s' % reprozip.utils.mongodb_path_index_collection)
+        self.__schema = None
+    
+    path = property(get_path, None, None, None)
@@ -0,0 +1,360 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+from reprozip.pack.config_parser import Parser
+import reprozip.debug
+
+# version of the layout of the database, recorded in the session status
+# collection under SCHEMA_ID; databases written before it was recorded
+# are version 0, and had every index created at each session; version 2
+# added the path dictionary and the overflow documents of the compact
+# process schema (see reprozip.pack.store_data)
+SCHEMA_VERSION = 2
+SCHEMA_ID = '__schema__'
+
+# lists of the phases that find_child_processes(light=True) may leave out,
+# since aggregate_files() gathers them for the whole tree
+LIGHT_KEYS = ('files_written', 'directories', 'symlinks', 'files_renamed')
+
+# index from the paths of the sessions in the compact schema to the
+# processes that read or wrote them (see reprozip.pack.query)
+PATH_INDEX = 'paths'
+PATH_INDEX_KEYS = ('files_read', 'files_written')
+
+# indices of the processes that can be selected in the configuration file;
+# Experiment.retrieve_experiment_data only needs 'ppid' (child processes)
+# and 'creation_time' (most recent main process). The index on session_tag
+# is always built, since sessions are removed by tag.
+INDICES = [PATH_INDEX,
+           'ppid',
+           'creation_time',
+           'pid',
+           'exited',
+           'most_recent_event_timestamp',
+           'phases.name',
+           'phases.start_time',
+           'phases.files_read.timestamp',
+           'phases.files_written.timestamp',
+           'phases.files_renamed.timestamp']
+
+def path_refs(doc):
+    """
+    Returns the set of (path id, key) pairs of the paths read or written by
+    a process in the compact schema, or by one of its overflow documents.
+    Processes stored by earlier versions have no path ids.
+    """
+    
+    refs = set()
+    if 'process_id' in doc:
+        # overflow document
+        if doc['key'] in PATH_INDEX_KEYS:
+            refs.update((entry[0], doc['key']) for entry in doc['entries'])
+        return refs
+    
+    if doc.get('schema', 1) < 2:
+        return refs
+    for phase in doc['phases']:
+        for key in PATH_INDEX_KEYS:
+            refs.update((entry[0], key) for entry in phase.get(key) or [])
+    return refs
+
+class Storage:
+    """
+    Class that represents the database where the provenance of the
+    experiments is stored: the processes of each tracing session (as
+    serialized by Process.serialize()) and the status of the sessions.
+    
+    Sub-classes implement it on top of a MongoDB server (MongoStorage) or
+    of an embedded SQLite database (SQLiteStorage).
+    """
+    
+    def start(self):
+        """
+        Starts the database server, if there is one.
+        """
+        
+        pass
+    
+    def wait(self):
+        """
+        Waits for the database server to accept connections.
+        """
+        
+        pass
+    
+    def stop(self):
+        """
+        Closes the connection and stops the database server, if there is one.
+        """
+        
+        pass
+    
+    def connect(self):
+        """
+        Connects to the database; connecting twice has no effect.
+        """
+        
+        raise NotImplementedError
+    
+    def open_session(self, session_tag):
+        """
+        Removes the data of a previous session with the same tag (processes,
+        overflow documents and paths); the first session of a database also
+        sets up its schema.
+        """
+        
+        raise NotImplementedError
+    
+    def save_process(self, doc):
+        """
+        Inserts or replaces the serialized process doc, whose '_id' is the
+        unique id of the process.
+        """
+        
+        raise NotImplementedError
+    
+    def remove_process(self, id):
+        """
+        Removes the process with the given unique id.
+        """
+        
+        raise NotImplementedError
+    
+    def remove_overflow(self, process_id):
+        """
+        Removes the overflow documents of a process.
+        """
+        
+        raise NotImplementedError
+    
+    def save_overflow(self, doc):
+        """
+        Inserts an overflow document of a process (see
+        reprozip.pack.store_data.split_overflow).
+        """
+        
+        raise NotImplementedError
+    
+    def save_paths(self, session_tag, paths):
+        """
+        Inserts the (path id, path) pairs in the path dictionary of a
+        session.
+        """
+        
+        raise NotImplementedError
+    
+    def save_session_status(self, doc):
+        """
+        Inserts or replaces the status of a session, whose '_id' is the
+        session tag.
+        """
+        
+        raise NotImplementedError
+    
+    def flush(self):
+        """
+        Makes the documents saved so far durable; backends may buffer them
+        until then.
+        """
+        
+        pass
+    
+    def build_indices(self, session_tag=None):
+        """
+        Builds the secondary indices selected in the configuration file
+        that are missing, and removes the ones no longer selected. Called
+        once the processes of a session are stored, so that the bulk
+        load does not maintain them. The paths of session_tag are added
+        to the path index, if selected; when it is first selected, the
+        paths of every session are.
+        """
+        
+        pass
+    
+    def find_main_process(self, argv_regex):
+        """
+        Returns the most recent process with a phase whose execve_argv
+        matches argv_regex, or None.
+        """
+        
+        raise NotImplementedError
+    
+    def find_child_processes(self, ppid, start_time, light=False):
+        """
+        Returns the list of processes whose parent is ppid and that were
+        created at start_time or later. If light is True, the database may
+        leave out the files written, directories, symbolic links and renames
+        of the phases (see aggregate_files).
+        """
+        
+        raise NotImplementedError
+    
+    def can_aggregate(self):
+        """
+        Returns whether the database can compute aggregate_files().
+        """
+        
+        return False
+    
+    def aggregate_files(self, process_ids):
+        """
+        Returns the union of the files of the phases of the given processes,
+        computed by the database, as a dict: 'files_read', 'files_written'
+        and 'directories' are sets, and 'symlinks' maps symbolic links to
+        targets. Processes in the compact schema give path ids instead of
+        paths (see find_paths).
+        """
+        
+        raise NotImplementedError
+    
+    def find_processes(self, session_tag, pid=None, ppid=None, skip=0, limit=None):
+        """
+        Returns an iterator over the processes of a session, from the first
+        created; only the ones with the given pid or ppid, if any. skip and
+        limit select a page of them.
+        """
+        
+        raise NotImplementedError
+    
+    def find_processes_in_window(self, session_tag, start=None, end=None):
+        """
+        Returns an iterator over the processes of a session that ran
+        between start and end (ms since the epoch, or None): the ones
+        created before end whose most recent event is after start, from
+        the first created.
+        """
+        
+        raise NotImplementedError
+    
+    def find_path_id(self, session_tag, path):
+        """
+        Returns the id of a path in the path dictionary of a session, or
+        None.
+        """
+        
+        raise NotImplementedError
+    
+    def find_path_processes(self, session_tag, path_id, key, skip=0, limit=None):
+        """
+        Returns an iterator over the processes of a session whose key
+        ('files_read' or 'files_written') has the given path id, from the
+        first created, with skip and limit as in find_processes. Returns
+        None if the path index is not built.
+        """
+        
+        return None
+    
+    def find_overflow(self, process_id):
+        """
+        Returns the list of overflow documents of a process.
+        """
+        
+        raise NotImplementedError
+    
+    def find_paths(self, session_tag, ids):
+        """
+        Returns a dict mapping the given path ids of a session to paths.
+        """
+        
+        raise NotImplementedError
+    
+    def list_sessions(self):
+        """
+        Returns the status documents of the sessions, from the least
+        recently updated.
+        """
+        
+        raise NotImplementedError
+    
+    def find_session_tags(self):
+        """
+        Returns the set of session tags that have processes, overflow
+        documents or paths, whether they have a status document or not.
+        """
+        
+        raise NotImplementedError
+    
+    def count_processes(self, session_tag):
+        """
+        Returns the number of processes of a session.
+        """
+        
+        raise NotImplementedError
+    
+    def delete_session(self, session_tag):
+        """
+        Removes the processes, overflow documents, paths (and their index)
+        and status of a session.
+        """
+        
+        raise NotImplementedError
+    
+    def compact(self):
+        """
+        Gives the space of the removed documents back.
+        """
+        
+        pass
+    
+    def drop(self):
+        """
+        Removes all the data stored by ReproZip.
+        """
+        
+        raise NotImplementedError
+
+def get_storage():
+    """
+    Returns the Storage selected in the configuration file.
+    """
+    
+    parser = Parser()
+    (backend, sqlite_path, in_process, persist, indices, session_ttl) = parser.read_storage_config()
+    
+    if 'all' in indices:
+        indices = INDICES
+    for name in indices:
+        if name not in INDICES:
+            reprozip.debug.error('Unknown index: %s' %name)
+            raise Exception
+    
+    if backend == 'mongodb':
+        from reprozip.pack.storage.mongodb_storage import MongoStorage
+        return MongoStorage(indices)
+    elif backend == 'sqlite':
+        from reprozip.pack.storage.sqlite_storage import SQLiteStorage
+        return SQLiteStorage(sqlite_path, indices)
+    else:
+        reprozip.debug.error('Unknown storage backend: %s' %backend)
+        raise Exception
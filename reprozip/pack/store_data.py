@@ -11,50 +11,540 @@
 ##
 ###############################################################################
 
-# This code stores process information in a centralized MongoDB database
+# This code stores process information in a centralized database
+# (MongoDB or SQLite, see reprozip.pack.storage)
 
 '''
-Collections within MongoDB reprozip_db:
+Collections within MongoDB reprozip_db (tables in SQLite):
 
 reprozip_db.process_trace
-  - contains the cleaned output from pass-lite.out.*
+  - contains the cleaned output from pass-lite.out.* (the tracer rotates its
+    output, so the log is split into chunks pass-lite.out.0, pass-lite.out.1,
+    ..., which may be gzip-compressed: pass-lite.out.0.gz, ...)
   - _id is a concatenation of creation timestamp and PID
   - most_recent_event_timestamp is the most recent time that this
     process entry was updated
+  - processes are stored in the compact schema (schema: 2, see
+    Process.serialize_compact): filenames are ids of the path dictionary
+    of the session, and timestamps (but creation_time) are ms since the
+    epoch. Processes stored by earlier versions (without schema) have
+    filenames and datetimes instead.
+  - overflow: number of overflow documents of the process
+  - io: in the phases, bytes and number of the reads and writes of each
+    file, when the tracer counts them
+  - rusage: resource usage reported by the tracer when the process exited
+    (see RUSAGE_FIELDS in reprozip.pack.system_tap.parse_stap_out), or None
+
+reprozip_db.path_dictionary
+  - session_tag, path_id: id of a path in the processes of that session
+  - path:                 the path
+
+reprozip_db.process_overflow
+  - entries of the phases that have more than PHASE_ENTRIES_LIMIT files
+    read, files written, directories or I/O counters
+  - _id:        process id, followed by the index of the overflow document
+  - process_id: _id of the process
+  - phase, key: index of the phase, and list (e.g., files_read) continued
+  - entries:    the entries
 
 reprozip_db.session_status
   - _id:               unique session tag
   - last_updated_time: timestamp of last update to this session
+  - stats:             telemetry of the tracer (see TraceStats)
+  - rusage:            resource usage of the session (see ResourceUsage)
+  - hottest_files:     files with the most bytes read and written (see FileIO)
 '''
 
 import os
 import sys
 import datetime
+import threading
+import zlib
+import re
+import heapq
+import itertools
 
-from reprozip.pack.system_tap import Process, parse_raw_pass_lite_line
+from reprozip.pack.system_tap import Process, PathTable, StatCache, parse_raw_pass_lite_line
 from reprozip.utils import *
+from reprozip.pack import profiling
 import reprozip.debug
 
-from pymongo import MongoClient, ASCENDING
+# size of the blocks read from compressed trace chunks
+READ_BLOCK_SIZE = 1 << 16
+
+# maximum number of entries of a list of a phase kept in the document of its
+# process; the rest goes to overflow documents, which keeps the documents of
+# file-heavy processes well below the 16 MB limit of MongoDB
+PHASE_ENTRIES_LIMIT = 20000
+
+
+def read_chunk_lines(path):
+    """
+    Generator that yields the lines of a trace chunk, without line endings.
+    Chunks ending in '.gz' are decompressed as a stream, one block at a time.
+    """
+    
+    if not path.endswith('.gz'):
+        f = open(path)
+        try:
+            for line in f:
+                yield line.rstrip()
+        finally:
+            f.close()
+        return
+    
+    f = open(path, 'rb')
+    try:
+        # 16 + MAX_WBITS: expect a gzip header and trailer
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        pending = ''
+        while True:
+            block = f.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            data = pending + d.decompress(block)
+            # concatenated gzip members
+            while d.unused_data:
+                unused = d.unused_data
+                d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                data += d.decompress(unused)
+            lines = data.split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line.rstrip()
+        pending += d.flush()
+        if pending:
+            yield pending.rstrip()
+    finally:
+        f.close()
+
+def split_overflow(doc, limit=PHASE_ENTRIES_LIMIT):
+    """
+    Moves the entries of the phases of a serialized process (in the compact
+    schema) beyond limit to overflow documents, which are returned.
+    """
+    
+    overflow = []
+    for (i, phase) in enumerate(doc['phases']):
+        for key in ('files_read', 'files_written', 'directories', 'io'):
+            entries = phase.get(key)
+            if entries is None or len(entries) <= limit:
+                continue
+            phase[key] = entries[:limit]
+            for start in xrange(limit, len(entries), limit):
+                overflow.append({'_id': '%s:%d' % (doc['_id'], len(overflow)),
+                                 'process_id': doc['_id'],
+                                 'session_tag': doc.get('session_tag'),
+                                 'phase': i,
+                                 'key': key,
+                                 'entries': entries[start:start + limit]})
+    
+    doc['overflow'] = len(overflow)
+    return overflow
+
+
+class ReorderWindow:
+    """
+    Streaming stage that puts the trace entries back in time order.
+    SystemTap does not write the records of different CPUs in strict time
+    order, so entries are held in a heap keyed on (timestamp, pid, seq)
+    until an entry more than window ms later has been read, after which
+    no earlier entry is expected anymore.
+    """
+    
+    def __init__(self, window):
+        """
+        Init method for ReorderWindow.
+        
+        -> window is the time (in ms) an entry is held; 0 disables reordering
+        """
+        
+        self.window = window
+        self.heap = []
+        
+        # order in which entries were read, so that entries with the same
+        # timestamp and pid are released in their original order
+        self.seq = 0
+        
+        # latest timestamp read, and timestamp of the last entry released
+        self.latest = None
+        self.released = None
+
+
+    def reorder(self, entries):
+        """
+        Generator that yields entries in time order, holding back the
+        entries in the window (see flush()).
+        """
+        
+        if self.window <= 0:
+            for entry in entries:
+                yield entry
+            return
+        
+        heap = self.heap
+        for entry in entries:
+            if self.released is not None and entry.timestamp < self.released:
+                reprozip.debug.count_warning('entries out of order beyond the reorder window',
+                                             '%s arrived after an entry at %d',
+                                             entry, self.released)
+            heapq.heappush(heap, (entry.timestamp, entry.pid, self.seq, entry))
+            self.seq += 1
+            if self.latest is None or entry.timestamp > self.latest:
+                self.latest = entry.timestamp
+            
+            limit = self.latest - self.window
+            while heap and heap[0][0] < limit:
+                e = heapq.heappop(heap)[3]
+                self.released = e.timestamp
+                yield e
+
+
+    def flush(self):
+        """
+        Generator that yields the entries still held in the window.
+        """
+        
+        while self.heap:
+            e = heapq.heappop(self.heap)[3]
+            self.released = e.timestamp
+            yield e
+
+
+class ProcessIndex:
+    """
+    The processes of a tracing session, kept in memory so that the
+    provenance tree of an experiment that was just traced can be built
+    without querying the database. It answers the queries of a Storage
+    object (see Experiment.retrieve_experiment_data), and only the
+    processes that are returned are serialized.
+    """
+    
+    def __init__(self):
+        self.processes = []
+        
+        # Key: PPID
+        # Value: list of Process objects
+        self.ppid_to_processes = {}
+    
+    
+    def add_process(self, p):
+        self.processes.append(p)
+        self.ppid_to_processes.setdefault(p.ppid, []).append(p)
+    
+    
+    def connect(self):
+        pass
+    
+    
+    def find_main_process(self, argv_regex):
+        regex = re.compile(argv_regex)
+        main = None
+        for p in self.processes:
+            if (main is not None) and (p.creation_time <= main.creation_time):
+                continue
+            for phase in p.phases:
+                if phase.execve_argv and regex.search(phase.execve_argv):
+                    main = p
+                    break
+        
+        if main is None:
+            return None
+        return main.serialize()
+    
+    
+    def find_child_processes(self, ppid, start_time, light=False):
+        return [p.serialize() for p in self.ppid_to_processes.get(ppid, [])
+                if encode_datetime(p.creation_time) >= start_time]
+    
+    
+    def can_aggregate(self):
+        return False
+
+
+class TraceStats:
+    """
+    Telemetry of a tracing session: the number of records emitted by the
+    tracer (from its periodic STATS records), the number of records parsed,
+    and the losses reported by SystemTap when it exits.
+    """
+    
+    # messages printed by stap / staprun on stderr
+    SKIPPED_RE = re.compile(r'skipped probes:\s*(\d+)')
+    ERRORS_RE = re.compile(r'Number of errors:\s*(\d+)')
+    TRANSPORT_RE = re.compile(r'(\d+) transport failures')
+    
+    def __init__(self):
+        # probe point -> number of records emitted (cumulative)
+        self.emitted = {}
+        self.emitted_total = None
+        
+        # record type -> number of records parsed
+        self.parsed = {}
+        
+        self.skipped_probes = 0
+        self.transport_failures = 0
+        self.errors = 0
+
+
+    def add_stats_entry(self, entry):
+        if entry.stat_name == 'records':
+            self.emitted_total = entry.stat_value
+        else:
+            self.emitted[entry.stat_name] = entry.stat_value
+
+
+    def count_parsed(self, entry):
+        self.parsed[entry.syscall_name] = self.parsed.get(entry.syscall_name, 0) + 1
+
+
+    def parse_tracer_stderr(self, stderr):
+        for (regex, attr) in ((self.SKIPPED_RE, 'skipped_probes'),
+                              (self.ERRORS_RE, 'errors'),
+                              (self.TRANSPORT_RE, 'transport_failures')):
+            for value in regex.findall(stderr):
+                setattr(self, attr, max(getattr(self, attr), int(value)))
+
+
+    def parsed_total(self):
+        return sum(self.parsed.values())
+
+
+    def lost_records(self):
+        """
+        Records counted by the tracer that never made it to the log.
+        Counters lag behind the log, so this is a lower bound.
+        """
+        if self.emitted_total is None:
+            return 0
+        return max(self.emitted_total - self.parsed_total(), 0)
+
+
+    def has_data_loss(self):
+        return bool(self.lost_records() or self.skipped_probes or self.transport_failures)
+
+
+    def summary(self):
+        """
+        Returns a list of lines describing the session.
+        """
+        lines = ['%d records parsed' % self.parsed_total()]
+        if self.emitted_total is not None:
+            lines[0] += ', %d emitted by the tracer' % self.emitted_total
+        for name in sorted(self.parsed, key=self.parsed.get, reverse=True):
+            lines.append('  %-16s %d' % (name, self.parsed[name]))
+        lines.append('%d lost records, %d skipped probes, %d transport failures, %d errors' %
+                     (self.lost_records(), self.skipped_probes, self.transport_failures, self.errors))
+        return lines
+
+
+    def serialize(self):
+        """
+        Method that serializes the stats for the database.
+        Probe points contain dots, so they cannot be used as keys.
+        """
+        return dict(emitted=[dict(probe=k, records=v) for (k, v) in sorted(self.emitted.iteritems())],
+                    emitted_total=self.emitted_total,
+                    parsed=[dict(record=k, records=v) for (k, v) in sorted(self.parsed.iteritems())],
+                    parsed_total=self.parsed_total(),
+                    lost_records=self.lost_records(),
+                    skipped_probes=self.skipped_probes,
+                    transport_failures=self.transport_failures,
+                    errors=self.errors)
+
+
+class ResourceUsage:
+    """
+    Resource usage of a tracing session, from the processes that reported
+    theirs when they exited: the totals of CPU time, context switches and
+    bytes read and written, the largest resident set, and the processes
+    that used the most CPU time.
+    """
+    
+    # number of processes in the top list
+    TOP = 10
+    
+    def __init__(self):
+        self.processes = 0
+        
+        # field -> total over the processes
+        self.totals = {}
+        self.maxrss = None
+        
+        # heap of (CPU time, unique id, pid) of the processes that used the
+        # most CPU time
+        self.top = []
+
+
+    def add(self, p):
+        if p.rusage is None:
+            return
+        
+        self.processes += 1
+        for (name, value) in p.rusage.iteritems():
+            if name == 'maxrss':
+                self.maxrss = max(self.maxrss, value)
+            else:
+                self.totals[name] = self.totals.get(name, 0) + value
+        
+        item = (p.rusage.get('utime', 0) + p.rusage.get('stime', 0), p.unique_id(), p.pid)
+        if len(self.top) < self.TOP:
+            heapq.heappush(self.top, item)
+        else:
+            heapq.heappushpop(self.top, item)
+
+
+    def summary(self):
+        """
+        Returns a list of lines describing the session.
+        """
+        if not self.processes:
+            return ['no resource usage reported by the tracer']
+        totals = self.totals
+        lines = ['%d processes: %d ms user, %d ms system, max RSS %s kB' % (self.processes,
+                                                                            totals.get('utime', 0),
+                                                                            totals.get('stime', 0),
+                                                                            self.maxrss)]
+        lines.append('  %d voluntary and %d involuntary context switches, %d bytes read, %d bytes written' %
+                     (totals.get('nvcsw', 0), totals.get('nivcsw', 0),
+                      totals.get('rchar', 0), totals.get('wchar', 0)))
+        for (cpu_time, id, pid) in sorted(self.top, reverse=True):
+            lines.append('  PID %-8d %d ms' % (pid, cpu_time))
+        return lines
+
+
+    def serialize(self):
+        """
+        Method that serializes the resource usage for the database.
+        """
+        ret = dict(processes=self.processes,
+                   maxrss=self.maxrss,
+                   top=[dict(_id=id, pid=pid, cpu_time=cpu_time)
+                        for (cpu_time, id, pid) in sorted(self.top, reverse=True)])
+        ret.update(self.totals)
+        return ret
+
+
+class FileIO:
+    """
+    I/O of a tracing session per file, summed over its processes: bytes
+    and number of the reads and writes, and number of processes. The
+    hottest files (the most bytes read and written) are the ones worth
+    staging on fast storage where the experiment is reproduced.
+    """
+    
+    # number of files in the report saved with the session
+    HOTTEST = 20
+    
+    def __init__(self, path_table):
+        self.path_table = path_table
+        
+        # path id -> [bytes read, reads, bytes written, writes, processes]
+        self.files = {}
+        
+        # path id -> whether it is a pipe, which is not a file to stage
+        self.pipes = {}
+
+
+    def is_pipe(self, filename):
+        pipe = self.pipes.get(filename)
+        if pipe is None:
+            pipe = self.pipes[filename] = self.path_table.path(filename).startswith('PIPE')
+        return pipe
+
+
+    def add(self, p):
+        seen = set()
+        for phase in p.phases:
+            for (filename, io) in phase.io.iteritems():
+                if self.is_pipe(filename):
+                    continue
+                counters = self.files.get(filename)
+                if counters is None:
+                    counters = self.files[filename] = [0, 0, 0, 0, 0]
+                for i in xrange(4):
+                    counters[i] += io[i]
+                if filename not in seen:
+                    seen.add(filename)
+                    counters[4] += 1
+
+
+    def hottest(self, n=None):
+        """
+        Returns the list of (path id, counters) of the n files with the most
+        bytes read and written (all of them if n is None).
+        """
+        key = lambda item: item[1][0] + item[1][2]
+        if n is None:
+            return sorted(self.files.iteritems(), key=key, reverse=True)
+        return heapq.nlargest(n, self.files.iteritems(), key=key)
+
+
+    def summary(self, n=10):
+        """
+        Returns a list of lines describing the hottest files.
+        """
+        path = self.path_table.path
+        if not self.files:
+            return ['no I/O counted by the tracer']
+        lines = ['%d files read or written; the hottest:' % len(self.files)]
+        for (filename, (bytes_read, reads, bytes_written, writes, processes)) in self.hottest(n):
+            lines.append('  %12d B read (%d), %12d B written (%d), %d processes  %s' %
+                         (bytes_read, reads, bytes_written, writes, processes, path(filename)))
+        return lines
+
+
+    def serialize(self):
+        """
+        Method that serializes the hottest files for the database.
+        """
+        path = self.path_table.path
+        return [dict(filename=path(filename), bytes_read=bytes_read, reads=reads,
+                     bytes_written=bytes_written, writes=writes, processes=processes)
+                for (filename, (bytes_read, reads, bytes_written, writes, processes)) in self.hottest(self.HOTTEST)]
+
 
 class Provenance:
     """
     The class Provenance deals with integrating data from the process
-    trace to a MongoDB collection.
+    trace to the database.
     """
     
-    def __init__(self):
+    def __init__(self, keep_chunks=True, reorder_window=0, keep_processes=False):
         """
         Init method for Provenance.
+        
+        -> keep_chunks indicates whether trace chunks should be kept on disk
+           after being parsed
+        -> reorder_window is the time (in ms) in which trace entries are put
+           back in order before being parsed (see ReorderWindow)
+        -> keep_processes indicates whether the exited processes should be
+           kept in memory (see ProcessIndex)
         """
           
         # prefix of the process trace file
         self.file = 'pass-lite.out'
+        
+        # index of the next trace chunk to be parsed; processes that are
+        # still active at the end of a chunk carry over to the next one
+        self.next_chunk = 0
+        self.keep_chunks = keep_chunks
+        
+        # entries that were read but not parsed yet are held here, across
+        # chunks, until the final indexing
+        self.reorder = ReorderWindow(reorder_window)
 
         # Dict mapping PIDs to active processes (i.e., haven't yet exited)
         # Key: PID
         # Value: Process object
         self.pid_to_active_processes = {}
+        
+        # paths seen during the session, shared by all processes
+        self.path_table = PathTable()
+        
+        # filesystem lookups made while resolving symbolic links, kept
+        # for one ingest only
+        self.stat_cache = StatCache(self.path_table)
 
         # the PARENT pids of all exited processes
         self.exited_process_ppids = set()
@@ -65,43 +555,124 @@ class Provenance:
         # current directory for storing log
         self.logdir = None
         
-        self.session_status_col = None
-        self.proc_col = None
+        # database (see reprozip.pack.storage), if any, once the session
+        # is open
+        self.storage = None
+        
+        # number of paths of path_table saved in the database
+        self.saved_paths = 0
+        
+        # ids of the processes saved with overflow documents
+        self.overflow_ids = set()
+        
+        # exited processes, if they are kept in memory
+        self.processes = None
+        if keep_processes:
+            self.processes = ProcessIndex()
+        
+        # telemetry of the tracer
+        self.stats = TraceStats()
+        
+        # resource usage of the processes, and I/O of the files
+        self.rusage = ResourceUsage()
+        self.file_io = FileIO(self.path_table)
+        
+        # lock that serializes parsing between the chunk consumer and
+        # the final indexing
+        self.lock = threading.Lock()
 
 
-    def save_tagged_db_entry(self, col, json_entry):
+    def save_tagged_process(self, p):
+        json_entry = p.serialize_compact()
         json_entry['session_tag'] = self.session_tag
-        col.save(json_entry) # does an insert (if not-exist) or update (if exists)
+        for overflow in split_overflow(json_entry):
+            self.storage.save_overflow(overflow)
+        if json_entry['overflow']:
+            self.overflow_ids.add(json_entry['_id'])
+        self.storage.save_process(json_entry) # does an insert (if not-exist) or update (if exists)
+        profiling.count('documents_written', 1 + json_entry['overflow'])
+    
+    
+    def flush(self):
+        """
+        Saves the paths added to the path table since the last flush, which
+        the processes refer to, and makes the database durable.
+        """
+        
+        n = len(self.path_table)
+        if n > self.saved_paths:
+            path = self.path_table.path
+            self.storage.save_paths(self.session_tag,
+                                    [(i, path(i)) for i in xrange(self.saved_paths, n)])
+            self.saved_paths = n
+        
+        self.storage.flush()
 
 
-    def gen_entries_from_multifile_log(self):
+    def list_chunks(self):
         """
-        Parses the log file one line at a time.
+        Returns a sorted list of (index, path) for the trace chunks in the
+        log directory. A trace that was not rotated is a single chunk.
         """
         
-        fullpath = os.path.join(self.logdir, self.file)
-    
-        if not os.path.isfile(fullpath):
-            reprozip.debug.error('Could not find file %s' %fullpath)
+        prefix = self.file + '.'
+        chunks = []
+        for name in os.listdir(self.logdir):
+            if not name.startswith(prefix):
+                continue
+            index = name[len(prefix):]
+            if index.endswith('.gz'):
+                index = index[:-len('.gz')]
+            if index.isdigit():
+                chunks.append((int(index), os.path.join(self.logdir, name)))
+        chunks.sort()
+        
+        if not chunks and os.path.isfile(os.path.join(self.logdir, self.file)):
+            chunks.append((0, os.path.join(self.logdir, self.file)))
+        
+        return chunks
+
+
+    def gen_entries_from_multifile_log(self, final=True):
+        """
+        Parses the log chunks one line at a time, starting at the first chunk
+        that was not parsed yet. If final is False, the most recent chunk is
+        skipped, since the tracer may still be writing to it.
+        """
+        
+        chunks = [c for c in self.list_chunks() if c[0] >= self.next_chunk]
+        
+        if final and not chunks and self.next_chunk == 0:
+            reprozip.debug.error('Could not find file %s' %os.path.join(self.logdir, self.file))
             raise Exception
-    
-        # opening trace file
-        f = open(fullpath)
-        for (line_no, line) in enumerate(f):
-            try:
-                entry = parse_raw_pass_lite_line(line.rstrip())      
-                yield entry
-            except:
-                reprozip.debug.error('Could not parse the log file: %s' %sys.exc_info()[1])
-                f.close()
+        
+        if not final:
+            chunks = chunks[:-1]
+        
+        for (index, fullpath) in chunks:
+            # chunks are only removed once they are parsed, so a gap means
+            # that provenance was lost
+            if index != self.next_chunk:
+                reprozip.debug.error('Trace chunk %d is missing: %s' %(self.next_chunk, os.path.join(self.logdir, self.file)))
                 raise Exception
+            
+            # compressed chunks are decoded transparently
+            for line in read_chunk_lines(fullpath):
+                try:
+                    entry = parse_raw_pass_lite_line(line)
+                except:
+                    reprozip.debug.error('Could not parse the log file: %s' %sys.exc_info()[1])
+                    raise Exception
+                yield entry
+            
+            self.next_chunk = index + 1
+            if not self.keep_chunks:
+                os.remove(fullpath)
 
 
     def exit_handler(self):
         
         cur_time = get_ms_since_epoch()
-        self.session_status_col.save({'_id': self.session_tag,
-                                      'last_updated_time': datetime.datetime.now()})
         
         # now make all active processes into exited processes since our
         # session has ended!
@@ -109,6 +680,15 @@ class Provenance:
         for p in self.pid_to_active_processes.values():
             p.mark_exit(cur_time, -1) # use a -1 exit code to mark that it was "rudely" killed
             self.handle_process_exit_event(p)
+        
+        # the summary of the session includes the processes above
+        if self.storage is not None:
+            self.storage.save_session_status({'_id': self.session_tag,
+                                              'last_updated_time': datetime.datetime.now(),
+                                              'stats': self.stats.serialize(),
+                                              'rusage': self.rusage.serialize(),
+                                              'hottest_files': self.file_io.serialize()})
+            self.flush()
 
 
     ### pass-lite logs ###
@@ -117,7 +697,13 @@ class Provenance:
         assert p.exited
         
         del self.pid_to_active_processes[p.pid]
-        self.proc_col.remove({'_id': p.unique_id()}) # remove and later (maybe) re-insert
+        self.rusage.add(p)
+        self.file_io.add(p)
+        if self.storage is not None:
+            self.storage.remove_process(p.unique_id()) # remove and later (maybe) re-insert
+            if p.unique_id() in self.overflow_ids:
+                self.overflow_ids.discard(p.unique_id())
+                self.storage.remove_overflow(p.unique_id())
         
         skip_me = False
         
@@ -133,21 +719,38 @@ class Provenance:
 #                skip_me = True
         
         if not skip_me:
-            self.save_tagged_db_entry(self.proc_col, p.serialize())
+            if self.processes is not None:
+                self.processes.add_process(p)
+            if self.storage is not None:
+                self.save_tagged_process(p)
             self.exited_process_ppids.add(p.ppid)
 
 
-    def index_pass_lite_logs(self):
+    def index_pass_lite_logs(self, final=True):
+        """
+        Indexes the trace chunks that were not parsed yet. Unless final is
+        True, the chunk that is currently being written is left for later.
+        """
     
-        entries = self.gen_entries_from_multifile_log()
+        entries = self.reorder.reorder(self.gen_entries_from_multifile_log(final))
+        if final:
+            entries = itertools.chain(entries, self.reorder.flush())
+        self.stat_cache.clear()
+        parsed = self.stats.parsed_total()
         
         try:
             for pl_entry in entries:
+                if pl_entry.syscall_name == 'STATS':
+                    self.stats.add_stats_entry(pl_entry)
+                    continue
+                self.stats.count_parsed(pl_entry)
+                
                 if pl_entry.pid not in self.pid_to_active_processes:
                     # remember, creating a new process adds it to
                     # the pid_to_active_processes dictionary
                     p = Process(pl_entry.pid, pl_entry.ppid, pl_entry.uid,
-                                pl_entry.timestamp, self.pid_to_active_processes)
+                                pl_entry.timestamp, self.pid_to_active_processes,
+                                self.path_table, self.stat_cache)
                     assert self.pid_to_active_processes[pl_entry.pid] == p # sanity check
                 else:
                     p = self.pid_to_active_processes[pl_entry.pid]
@@ -156,8 +759,12 @@ class Provenance:
                 if is_exited:
                     self.handle_process_exit_event(p)
             
-            for p in self.pid_to_active_processes.itervalues():
-                self.save_tagged_db_entry(self.proc_col, p.serialize())
+            if self.storage is not None:
+                if final:
+                    for p in self.pid_to_active_processes.itervalues():
+                        self.save_tagged_process(p)
+                self.flush()
+            profiling.count('events_parsed', self.stats.parsed_total() - parsed)
         except:
             reprozip.debug.error('Error while parsing entries: %s' %sys.exc_info()[1])
             raise Exception
@@ -165,50 +772,55 @@ class Provenance:
 
     def do_index(self):
         
-        self.index_pass_lite_logs()
+        self.lock.acquire()
+        try:
+            self.index_pass_lite_logs()
+        finally:
+            self.lock.release()
         
-        self.session_status_col.save({'_id': self.session_tag,
-                                      'last_updated_time': encode_datetime(get_ms_since_epoch())})
+        if self.storage is not None:
+            self.storage.save_session_status({'_id': self.session_tag,
+                                              'last_updated_time': encode_datetime(get_ms_since_epoch())})
     
     
-    def store(self, logdir, session_tag, port):
+    def open_session(self, logdir, session_tag, storage):
         """
-        Main method that stores the provenance data in MongoDB.
+        Connects to the database (a Storage object) and prepares it for a
+        new session. Without a database (storage is None), the processes
+        are only kept in memory.
         """
         
         self.logdir = logdir
         self.session_tag = session_tag
-    
-        # connecting to mongodb
-        try:
-            c = MongoClient(port=int(port))
-            db = c.reprozip_db
-        except:
-            reprozip.debug.error('Could not connect to MongoDB: %s' %sys.exc_info()[1])
-            raise Exception
         
-        self.proc_col = db.process_trace
-        self.session_status_col = db.session_status
-        
-        self.proc_col.remove({"session_tag": self.session_tag})
-        self.session_status_col.remove({"_id": self.session_tag})
-        
-        # Creating indices
-        # TODO: create indices every time?
-        self.proc_col.ensure_index('pid')
-        self.proc_col.ensure_index('exited')
-        self.proc_col.ensure_index('most_recent_event_timestamp')
-        self.proc_col.ensure_index('session_tag')
+        if storage is not None:
+            storage.connect()
+            storage.open_session(self.session_tag)
+        self.storage = storage
+    
+    
+    def consume_chunks(self):
+        """
+        Indexes the trace chunks that the tracer has finished writing.
+        Called periodically by ChunkConsumer while the experiment runs.
+        """
         
-        # For time range searches!  This multi-key index ensures fast
-        # searches for creation_time alone too!
-        self.proc_col.ensure_index([('creation_time', ASCENDING), ('exit_time', ASCENDING)])
+        self.lock.acquire()
+        try:
+            self.index_pass_lite_logs(final=False)
+        finally:
+            self.lock.release()
+    
+    
+    def store(self, logdir, session_tag, storage):
+        """
+        Main method that stores the provenance data in the database.
+        If the session was already opened (see ChunkConsumer), only the
+        remaining chunks are parsed.
+        """
         
-        self.proc_col.ensure_index('phases.name')
-        self.proc_col.ensure_index('phases.start_time')
-        self.proc_col.ensure_index('phases.files_read.timestamp')
-        self.proc_col.ensure_index('phases.files_written.timestamp')
-        self.proc_col.ensure_index('phases.files_renamed.timestamp')
+        if self.session_tag is None:
+            self.open_session(logdir, session_tag, storage)
         
         # storing everything
         try:
@@ -218,3 +830,60 @@ class Provenance:
         
         # exiting
         self.exit_handler()
+        
+        # the indices are not maintained during the bulk load
+        if self.storage is not None:
+            self.storage.build_indices(self.session_tag)
+        
+        # anomalies found in the trace
+        reprozip.debug.warning_summary()
+
+
+class ChunkConsumer(threading.Thread):
+    """
+    Thread that parses the rotated trace chunks as soon as the tracer moves
+    on to the next one, so that parsing overlaps with the experiment and
+    chunks can be removed from disk early.
+    """
+    
+    def __init__(self, provenance, interval=1):
+        """
+        Init method for ChunkConsumer.
+        
+        -> provenance is the Provenance object whose session is already open
+        -> interval is the time (in seconds) between checks for new chunks
+        """
+        
+        threading.Thread.__init__(self)
+        self.daemon = True
+        
+        self.__provenance = provenance
+        self.__interval = interval
+        self.__stop_event = threading.Event()
+        self.__error = None
+        
+    
+    def get_error(self):
+        return self.__error
+    
+    
+    def run(self):
+        while not self.__stop_event.is_set():
+            try:
+                self.__provenance.consume_chunks()
+            except:
+                self.__error = sys.exc_info()[1]
+                return
+            self.__stop_event.wait(self.__interval)
+    
+    
+    def stop(self):
+        """
+        Stops the consumer, waiting for the chunk being parsed (if any).
+        The remaining chunks are parsed by Provenance.store().
+        """
+        
+        self.__stop_event.set()
+        self.join()
+    
+    error = property(get_error, None, None, None)
@@ -32,4 +32,4 @@
 ##
 ###############################################################################
 
-from reprozip.pack.system_tap.parse_stap_out import Process, parse_raw_pass_lite_line
+from reprozip.pack.system_tap.parse_stap_out import Process, PathTable, StatCache, parse_raw_pass_lite_line
@@ -12,15 +12,14 @@
 ###############################################################################
 
 import os
-import sys
-from copy import deepcopy
 import posix
+import stat
+import bisect
+from array import array
 
 import reprozip.debug
 from reprozip.utils import *
 
-from pymongo import Connection, ASCENDING
-
 IGNORE_DIRS = ['/dev/', '/proc/', '/sys/', '/tmp/']
 
 # the double-pipe delimeter isn't perfect, but it'll do for now
@@ -30,13 +29,36 @@ OPEN_VARIANTS = ('OPEN_READ', 'OPEN_WRITE', 'OPEN_READWRITE')
 OPEN_AT_VARIANTS = ('OPEN_AT_READ', 'OPEN_AT_WRITE', 'OPEN_AT_READWRITE')
 RW_VARIANTS   = ('READ', 'WRITE', 'MMAP_READ', 'MMAP_WRITE', 'MMAP_READWRITE')
 
+# resource usage that may follow the exit code of EXIT_GROUP, in order:
+# user and system CPU time (ms), maximum resident set size (kB), voluntary
+# and involuntary context switches, and bytes read and written
+RUSAGE_FIELDS = ('utime', 'stime', 'maxrss', 'nvcsw', 'nivcsw', 'rchar', 'wchar')
+
 # if multiple file read/write entries occur within this amount of time,
 # only keep the earlier one
 FILE_ACCESS_COALESCE_MS = 200
 
+# timestamps (in ms since the epoch) of file accesses are kept in arrays of
+# machine integers rather than in lists of Python ints; they need 64 bits,
+# so doubles are used where a C long is 32 bits (they are exact up to 2**53)
+if array('l').itemsize >= 8:
+    TIMESTAMP_TYPECODE = 'l'
+else:
+    TIMESTAMP_TYPECODE = 'd'
+
+# maximum number of normalized raw paths remembered by a PathTable
+PATH_CACHE_SIZE = 8192
+
 
 # sub-classes simply add new fields depending on syscall_name
-class RawPassLiteLogEntry:
+class RawPassLiteLogEntry(object):
+    __slots__ = ('syscall_name', 'timestamp', 'pid', 'ppid', 'uid', 'proc_name',
+                 'filename', 'd_filename', 'filename_abspath', 'fd',
+                 'symlink', 'target', 'pwd', 'path',
+                 'pipe_read_fd', 'pipe_write_fd', 'src_fd', 'dst_fd', 'child_pid',
+                 'exec_filename', 'env', 'argv', 'return_code', 'exit_code', 'rusage', 'io',
+                 'old_filename', 'new_filename', 'stat_name', 'stat_value')
+    
     def __init__(self, syscall_name, timestamp, pid, ppid, uid, proc_name):
         self.syscall_name = syscall_name
         self.timestamp = timestamp
@@ -97,6 +119,12 @@ def parse_raw_pass_lite_line(line):
         assert len(rest) == 1
         entry.fd = int(rest[0])
         
+    elif syscall_name == 'IO':
+        # bytes read, reads, bytes written and writes of the fd
+        assert len(rest) == 5
+        entry.fd = int(rest[0])
+        entry.io = tuple(int(value) for value in rest[1:])
+        
     elif syscall_name == 'SYMLINK':
         assert len(rest) == 3
         entry.symlink = rest[0]
@@ -148,8 +176,14 @@ def parse_raw_pass_lite_line(line):
         entry.return_code = int(rest[0])
     
     elif syscall_name == 'EXIT_GROUP':
-        assert len(rest) == 1
+        # older tracers only give the exit code
+        assert len(rest) in (1, 1 + len(RUSAGE_FIELDS))
         entry.exit_code = int(rest[0])
+        entry.rusage = None
+        if len(rest) > 1:
+            # negative values are not known to the tracer
+            entry.rusage = dict((name, int(value)) for (name, value) in zip(RUSAGE_FIELDS, rest[1:])
+                                if int(value) >= 0)
     
     elif syscall_name == 'RENAME':
         assert len(rest) == 2
@@ -158,19 +192,248 @@ def parse_raw_pass_lite_line(line):
         assert entry.old_filename[0] == os.sep # absolute path check
         assert entry.new_filename[0] == os.sep # absolute path check
     
+    elif syscall_name == 'STATS':
+        # periodic counters from the tracer, not related to the process
+        # in the header
+        assert len(rest) == 2
+        entry.stat_name = rest[0]
+        entry.stat_value = int(rest[1])
+    
     else:
         assert False, line
     
     return entry
 
 
-class ProcessPhase:
+def timestamp_value(t):
+    """
+    Returns a timestamp read from a timestamp array as an int.
+    """
+    
+    return int(t)
+
+
+def last_timestamp(times):
+    """
+    Returns the latest access time in the value of a files_read,
+    files_written or dirs dict of a ProcessPhase.
+    """
+    
+    if isinstance(times, array):
+        return times[-1]
+    return times
+
+
+class PathTable(object):
+    """
+    Session-wide table of the paths seen during ingestion: every distinct
+    (normalized) path is stored ONCE and processes refer to it by its integer
+    id.  The results of os.path.normpath / os.path.join on the raw paths
+    from the log are memoized as well, since the same handful of paths
+    (libraries, configuration files, ...) are opened over and over again.
+    """
+    
+    def __init__(self, cache_size=PATH_CACHE_SIZE):
+        # path -> id, and id -> path
+        self.__ids = {}
+        self.__paths = []
+        # id -> 1 if the path starts with one of IGNORE_DIRS
+        self.__ignored = bytearray()
+        
+        # bounded memo of raw path (or (base, raw path)) -> id: the entries
+        # used recently are kept in 'recent', and once it is full it
+        # replaces 'old' (an entry of 'old' that is hit goes back to
+        # 'recent'), which approximates a LRU without the per-access cost
+        # of an ordered dict
+        self.__cache_size = max(cache_size / 2, 1)
+        self.__recent = {}
+        self.__old = {}
+        
+        self.hits = 0
+        self.misses = 0
+
+    
+    def __len__(self):
+        return len(self.__paths)
+
+    
+    def path_id(self, path):
+        """
+        Returns the id of path, which is added to the table if needed.
+        """
+        
+        i = self.__ids.get(path)
+        if i is None:
+            i = len(self.__paths)
+            path = intern(path)
+            self.__ids[path] = i
+            self.__paths.append(path)
+            ignored = 0
+            for d in IGNORE_DIRS:
+                if path.startswith(d):
+                    ignored = 1
+                    break
+            self.__ignored.append(ignored)
+        return i
+
+    
+    def path(self, i):
+        return self.__paths[i]
+
+    
+    def is_ignored(self, i):
+        return self.__ignored[i] == 1
+
+    
+    def __cached(self, key):
+        i = self.__recent.get(key)
+        if i is not None:
+            self.hits += 1
+            return i
+        i = self.__old.get(key)
+        if i is not None:
+            self.hits += 1
+            self.__remember(key, i)
+            return i
+        self.misses += 1
+        return None
+
+    
+    def __remember(self, key, i):
+        if len(self.__recent) >= self.__cache_size:
+            self.__old = self.__recent
+            self.__recent = {}
+        self.__recent[key] = i
+
+    
+    def normpath_id(self, raw):
+        """
+        Returns the id of os.path.normpath(raw).
+        """
+        
+        i = self.__cached(raw)
+        if i is None:
+            i = self.path_id(os.path.normpath(raw))
+            self.__remember(raw, i)
+        return i
+
+    
+    def join_id(self, base, raw):
+        """
+        Returns the id of os.path.normpath(os.path.join(base, raw)).
+        """
+        
+        if os.path.isabs(raw):
+            return self.normpath_id(raw)
+        key = (base, raw)
+        i = self.__cached(key)
+        if i is None:
+            i = self.path_id(os.path.normpath(os.path.join(base, raw)))
+            self.__remember(key, i)
+        return i
+
+
+class StatCache(object):
+    """
+    Cache of the filesystem lookups (existence, type, realpath) made while
+    resolving symbolic links, keyed by path id in a PathTable.  The
+    filesystem may change while the experiment runs, so the cache should
+    only be kept for one ingest (see clear()).
+    """
+    
+    # flags of the cached lookups
+    EXISTS = 1
+    ISDIR = 2
+    ISLINK = 4
+    
+    def __init__(self, path_table):
+        self.path_table = path_table
+        self.__flags = {}
+        self.__realpaths = {}
+        
+        self.hits = 0
+        self.misses = 0
+
+    
+    def clear(self):
+        """
+        Method that forgets the cached lookups (but not the counters).
+        """
+        
+        self.__flags = {}
+        self.__realpaths = {}
+
+    
+    def __lookup(self, i):
+        flags = self.__flags.get(i)
+        if flags is not None:
+            self.hits += 1
+            return flags
+        self.misses += 1
+        
+        # one lstat (and one stat for symbolic links) instead of a call to
+        # os.path.exists, os.path.isdir and os.path.islink each
+        flags = 0
+        try:
+            st = os.lstat(self.path_table.path(i))
+            if stat.S_ISLNK(st.st_mode):
+                flags |= StatCache.ISLINK
+                st = os.stat(self.path_table.path(i))
+            flags |= StatCache.EXISTS
+            if stat.S_ISDIR(st.st_mode):
+                flags |= StatCache.ISDIR
+        except OSError:
+            pass
+        self.__flags[i] = flags
+        return flags
+
+    
+    def exists(self, i):
+        return bool(self.__lookup(i) & StatCache.EXISTS)
+
+    
+    def isdir(self, i):
+        return bool(self.__lookup(i) & StatCache.ISDIR)
+
+    
+    def islink(self, i):
+        return bool(self.__lookup(i) & StatCache.ISLINK)
+
+    
+    def realpath_id(self, i):
+        """
+        Returns the id of os.path.realpath() of the path with id i.
+        """
+        
+        r = self.__realpaths.get(i)
+        if r is not None:
+            self.hits += 1
+            return r
+        self.misses += 1
+        r = self.path_table.path_id(os.path.realpath(self.path_table.path(i)))
+        self.__realpaths[i] = r
+        return r
+
+    
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return 100.0 * self.hits / lookups
+
+
+class ProcessPhase(object):
     """
     A process has 1 or more 'phases', where during each phase it has some
     set name.  A process changes from one phase to the next when an EXECVE
     system call is made, so that it morphs into another executable.
     """
     
+    __slots__ = ('start_time', 'process_name',
+                 'execve_filename', 'execve_pwd', 'execve_argv', 'execve_env',
+                 'files_read', 'files_written', 'dirs', 'symlinks', 'files_renamed',
+                 'io', 'latest_timestamp')
+    
     def __init__(self, start_time, execve_filename=None, execve_pwd=None, execve_argv=None, execve_env=None):
         self.start_time = start_time
         
@@ -183,8 +446,10 @@ class ProcessPhase:
         self.execve_argv = execve_argv
         self.execve_env = execve_env
         
-        # Each entry is a dict mapping from filename to a SORTED LIST of
-        # timestamps
+        # Each entry is a dict mapping from filename (its id in the
+        # PathTable of the session) to its access timestamps: most files are accessed ONCE, so a single
+        # timestamp is kept as an int, and only files accessed more than
+        # once get a SORTED array of timestamps (see _insert_coalesced_time)
         #
         # Apply filters using IGNORE_DIRS to prevent weird pseudo-files from
         # being added to these sets
@@ -194,12 +459,22 @@ class ProcessPhase:
         # directories accessed
         self.dirs = {}
         
-        # mapping from symbolic link to target
+        # mapping from symbolic link to target (ids in the PathTable)
         # symlinks[symlink] = target
         self.symlinks = {}
         
-        # Each entry is a tuple of (timestamp, old_filename, new_filename)
+        # Each entry is a tuple of (timestamp, old_filename, new_filename),
+        # with filenames as ids in the PathTable
         self.files_renamed = set()
+        
+        # bytes and number of the reads and writes of the files, from the IO
+        # entries of their fd's
+        # io[filename] = [bytes read, reads, bytes written, writes]
+        self.io = {}
+        
+        # latest timestamp of the files read, written and renamed, kept
+        # up to date by the add_* methods (see get_latest_timestamp)
+        self.latest_timestamp = start_time
 
 
     def is_empty(self):
@@ -210,59 +485,104 @@ class ProcessPhase:
             assert not self.files_renamed
             assert not self.dirs
             assert not self.symlinks
+            assert not self.io
             return True
         else:
             return False
 
 
-    def _insert_coalesced_time(self, lst, timestamp):
-        # lst must be a list
-        if not lst:
-            lst.append(timestamp)
-        else:
-            # weird out-of-order case
-            if timestamp < lst[-1]:
-                print >> sys.stderr, "WARNING: Inserting out-of-order timestamp", timestamp, "where the latest entry is", lst[-1]
-                
+    def _insert_coalesced_time(self, times, filename, timestamp):
+        """
+        Adds timestamp to the access times of filename in the dict times.
+        """
+        
+        lst = times.get(filename)
+        if lst is None:
+            times[filename] = timestamp
+            return
+        
+        if not isinstance(lst, array):
+            # coalescing optimization for the common case (a single access time)
+            if lst <= timestamp <= lst + FILE_ACCESS_COALESCE_MS:
+                return
+            if timestamp < lst <= timestamp + FILE_ACCESS_COALESCE_MS:
+                # out of order, but close enough: keep the earlier one
+                reprozip.debug.count_warning('out-of-order file access timestamps',
+                                             'Inserting out-of-order timestamp %d where the latest entry is %d',
+                                             timestamp, lst)
+                times[filename] = timestamp
+                return
+            lst = array(TIMESTAMP_TYPECODE, (lst,))
+            times[filename] = lst
+        
+        if timestamp >= lst[-1]:
+            # coalescing optimization
+            if (lst[-1] + FILE_ACCESS_COALESCE_MS) < timestamp:
                 lst.append(timestamp)
-                lst.sort() # keep things in order
-                # TODO: maybe do coalescing here
-            else:
-                # coalescing optimization
-                if (lst[-1] + FILE_ACCESS_COALESCE_MS) < timestamp:
-                    lst.append(timestamp)
+            return
+        
+        # weird out-of-order case
+        reprozip.debug.count_warning('out-of-order file access timestamps',
+                                     'Inserting out-of-order timestamp %d where the latest entry is %d',
+                                     timestamp, lst[-1])
+        
+        # keep things in order, coalescing with both neighbours: consecutive
+        # access times are always more than FILE_ACCESS_COALESCE_MS apart
+        i = bisect.bisect_right(lst, timestamp)
+        if i > 0 and timestamp <= lst[i - 1] + FILE_ACCESS_COALESCE_MS:
+            return
+        if lst[i] <= timestamp + FILE_ACCESS_COALESCE_MS:
+            # the later neighbour is coalesced into the earlier timestamp
+            lst[i] = timestamp
+        else:
+            lst.insert(i, timestamp)
+    
+    
+    def _update_latest_timestamp(self, times, filename):
+        t = timestamp_value(last_timestamp(times[filename]))
+        if t > self.latest_timestamp:
+            self.latest_timestamp = t
 
 
     def add_file_read(self, proc_name, timestamp, filename):
         self._set_or_confirm_name(proc_name)
-        
-        if filename not in self.files_read:
-            self.files_read[filename] = []
-        self._insert_coalesced_time(self.files_read[filename], timestamp)
+        self._insert_coalesced_time(self.files_read, filename, timestamp)
+        self._update_latest_timestamp(self.files_read, filename)
     
     
     def add_file_write(self, proc_name, timestamp, filename):
         self._set_or_confirm_name(proc_name)
-        if filename not in self.files_written:
-            self.files_written[filename] = []
-        self._insert_coalesced_time(self.files_written[filename], timestamp)
+        self._insert_coalesced_time(self.files_written, filename, timestamp)
+        self._update_latest_timestamp(self.files_written, filename)
         
     
     def add_dir(self, proc_name, timestamp, filename):
         self._set_or_confirm_name(proc_name)
-        if filename not in self.dirs:
-            self.dirs[filename] = []
-        self._insert_coalesced_time(self.dirs[filename], timestamp)
+        self._insert_coalesced_time(self.dirs, filename, timestamp)
         
     
     def add_file_rename(self, proc_name, timestamp, old_filename, new_filename):
         self._set_or_confirm_name(proc_name)
         self.files_renamed.add((timestamp, old_filename, new_filename))
+        if timestamp > self.latest_timestamp:
+            self.latest_timestamp = timestamp
         
         
     def add_symlink(self, proc_name, symlink, target):
         self._set_or_confirm_name(proc_name)
         self.symlinks[symlink] = target
+        
+    
+    def add_file_io(self, proc_name, filename, bytes_read, reads, bytes_written, writes):
+        self._set_or_confirm_name(proc_name)
+        counters = self.io.get(filename)
+        if counters is None:
+            self.io[filename] = [bytes_read, reads, bytes_written, writes]
+        else:
+            counters[0] += bytes_read
+            counters[1] += reads
+            counters[2] += bytes_written
+            counters[3] += writes
 
 
     def _set_or_confirm_name(self, proc_name):
@@ -280,19 +600,15 @@ class ProcessPhase:
             # can have multiple names and keep track of ALL names for a phase
             # rather than just one name
             if self.process_name != proc_name:
-                print >> sys.stderr, "WARNING: Process phase name changed from '%s' to '%s'" % (self.process_name, proc_name)
+                reprozip.debug.count_warning('process phase name changes',
+                                             "Process phase name changed from '%s' to '%s'",
+                                             self.process_name, proc_name)
         
-        self.process_name = proc_name # always override it!
+        self.process_name = intern(proc_name) # always override it!
 
 
     def get_latest_timestamp(self):
-        max_time = self.start_time
-        for times in self.files_read.values() + self.files_written.values():
-            for t in times:
-                max_time = max(t, max_time)
-        for (t, _, _) in self.files_renamed:
-            max_time = max(t, max_time)
-        return max_time
+        return self.latest_timestamp
 
 
     def printMe(self):
@@ -305,10 +621,12 @@ class ProcessPhase:
         print "     Files: %d read, %d written, %d renamed" % (len(self.files_read), len(self.files_written), len(self.files_renamed))
 
 
-    def serialize(self):
+    def serialize(self, path_table):
         """
-        Method that serializes the process phase for MongoDB.
+        Method that serializes the process phase for MongoDB, resolving the
+        ids of the filenames in path_table.
         """
+        path = path_table.path
         ret = dict(name=self.process_name,
                    start_time=encode_datetime(self.start_time),
                    execve_filename=self.execve_filename,
@@ -326,35 +644,37 @@ class ProcessPhase:
         
         serialized_files_read = []
         for (k,v) in self.files_read.iteritems():
-            if len(v) > 1:
-                serialized_files_read.append(dict(filename=k, timestamp=[encode_datetime(e) for e in v]))
+            if isinstance(v, array):
+                serialized_files_read.append(dict(filename=path(k), timestamp=[encode_datetime(timestamp_value(e)) for e in v]))
             else:
-                assert len(v) == 1
-                serialized_files_read.append(dict(filename=k, timestamp=encode_datetime(v[0])))
+                serialized_files_read.append(dict(filename=path(k), timestamp=encode_datetime(v)))
         
         serialized_files_written = []
         for (k,v) in self.files_written.iteritems():
-            if len(v) > 1:
-                serialized_files_written.append(dict(filename=k, timestamp=[encode_datetime(e) for e in v]))
+            if isinstance(v, array):
+                serialized_files_written.append(dict(filename=path(k), timestamp=[encode_datetime(timestamp_value(e)) for e in v]))
             else:
-                assert len(v) == 1
-                serialized_files_written.append(dict(filename=k, timestamp=encode_datetime(v[0])))
+                serialized_files_written.append(dict(filename=path(k), timestamp=encode_datetime(v)))
                 
         serialized_dirs = []
         for (k,v) in self.dirs.iteritems():
-            if len(v) > 1:
-                serialized_dirs.append(dict(dirname=k, timestamp=[encode_datetime(e) for e in v]))
+            if isinstance(v, array):
+                serialized_dirs.append(dict(dirname=path(k), timestamp=[encode_datetime(timestamp_value(e)) for e in v]))
             else:
-                assert len(v) == 1
-                serialized_dirs.append(dict(dirname=k, timestamp=encode_datetime(v[0])))
+                serialized_dirs.append(dict(dirname=path(k), timestamp=encode_datetime(v)))
         
         serialized_renames = []
-        for (t, old, new) in sorted(self.files_renamed):
+        for (t, old, new) in sorted((t, path(old), path(new)) for (t, old, new) in self.files_renamed):
             serialized_renames.append(dict(timestamp=encode_datetime(t), old_filename=old, new_filename=new))
             
         serialized_symlinks = []
         for key in self.symlinks:
-            serialized_symlinks.append(dict(symlink=key, target=self.symlinks[key]))
+            serialized_symlinks.append(dict(symlink=path(key), target=path(self.symlinks[key])))
+        
+        serialized_io = []
+        for (k, (bytes_read, reads, bytes_written, writes)) in self.io.iteritems():
+            serialized_io.append(dict(filename=path(k), bytes_read=bytes_read, reads=reads,
+                                      bytes_written=bytes_written, writes=writes))
         
         # turn empty collections into None for simplicity
         if not serialized_files_read:
@@ -367,22 +687,63 @@ class ProcessPhase:
             serialized_symlinks = None
         if not serialized_dirs:
             serialized_dirs = None
+        if not serialized_io:
+            serialized_io = None
         
         ret['files_read'] = serialized_files_read
         ret['files_written'] = serialized_files_written
         ret['files_renamed'] = serialized_renames
         ret['directories'] = serialized_dirs
         ret['symlinks'] = serialized_symlinks
+        ret['io'] = serialized_io
         
         return ret  
+
+
+    def serialize_compact(self):
+        """
+        Method that serializes the process phase in the compact schema
+        (version 2): timestamps are kept as ms since the epoch, filenames
+        as ids of the path table of the session, and entries as lists
+        instead of dicts.
+        """
+        ret = dict(name=self.process_name,
+                   start_time=self.start_time,
+                   execve_filename=self.execve_filename,
+                   execve_pwd=self.execve_pwd,
+                   execve_argv=self.execve_argv,
+                   execve_env=self.execve_env)
+        
+        for (key, d) in (('files_read', self.files_read),
+                         ('files_written', self.files_written),
+                         ('directories', self.dirs)):
+            entries = []
+            for (k,v) in d.iteritems():
+                if isinstance(v, array):
+                    entries.append([k, [timestamp_value(e) for e in v]])
+                else:
+                    entries.append([k, v])
+            ret[key] = entries or None
+        
+        ret['files_renamed'] = [[t, old, new] for (t, old, new) in sorted(self.files_renamed)] or None
+        ret['symlinks'] = [[k, v] for (k, v) in self.symlinks.iteritems()] or None
+        ret['io'] = [[k] + v for (k, v) in self.io.iteritems()] or None
+        
+        return ret
  
 
-class Process:
+class Process(object):
     """
     Class that represents a process.
     """
     
-    def __init__(self, pid, ppid, uid, creation_time, active_processes_dict):
+    __slots__ = ('pid', 'ppid', 'uid', 'other_uids', 'creation_time',
+                 'opened_files', 'opened_pipes', 'phases',
+                 'exited', 'exit_code', 'exit_time', 'rusage', 'wdir', 'prev_abspath',
+                 'most_recent_event_timestamp', 'active_processes_dict',
+                 'path_table', 'stat_cache')
+    
+    def __init__(self, pid, ppid, uid, creation_time, active_processes_dict, path_table=None, stat_cache=None):
         self.pid = pid
         self.ppid = ppid
         
@@ -393,7 +754,7 @@ class Process:
         
         # Open file descriptors (inherit from parent on fork)
         # Key: fd (int)
-        # Value: (filename, mode) where mode can be: {'r', 'w', 'rw'}
+        # Value: (filename id, mode) where mode can be: {'r', 'w', 'rw'}
         self.opened_files = {}
         
         # Some files, for some reason, are opened and not effectively read or
@@ -424,10 +785,15 @@ class Process:
         self.exit_code = None
         self.exit_time = None
         
+        # resource usage reported at the exit (see RUSAGE_FIELDS), if any
+        self.rusage = None
+        
         # for symbolic links, we need to keep track of working directory
         self.wdir = None
         
-        self.prev_entry = None # sometimes we want to refer back to the PREVIOUS entry
+        # the absolute path of an OPEN_ABSPATH entry, which must be
+        # followed by the OPEN_* entry of the same file
+        self.prev_abspath = None
         
         # Optimization for incremental indexing ... always update this with
         # the timestamp of the most recent event, so that we can know when
@@ -439,6 +805,17 @@ class Process:
         # are active (i.e., haven't yet exited)
         self.active_processes_dict = active_processes_dict
         
+        # Filenames are kept as ids in a PathTable, which should also be
+        # shared by all Process objects of the session
+        if path_table is None:
+            path_table = PathTable()
+        self.path_table = path_table
+        
+        # lookups of the filesystem when resolving symbolic links
+        if stat_cache is None:
+            stat_cache = StatCache(path_table)
+        self.stat_cache = stat_cache
+        
         # Now ADD YOURSELF to active_processes_dict:
         self.active_processes_dict[self.pid] = self
     
@@ -458,12 +835,14 @@ class Process:
         for p in self.phases:
             p_latest_timestamp = p.get_latest_timestamp()
             # relax this assertion since sometimes SystemTap produces
-            # timestamps that are SLIGHTLY out of order
-            # (hopefully < 1000 microseconds)
+            # timestamps that are out of order; entries are put back in order
+            # before being parsed (see ReorderWindow in store_data), so this
+            # only happens for entries that arrive later than the window
             #assert p.get_latest_timestamp() <= self.exit_time
             if p_latest_timestamp > self.exit_time:
-                assert p_latest_timestamp <= (self.exit_time + 1000) # fudge factor
-                print >> sys.stderr, 'WARNING: p_latest_timestamp[%d] > exit_time[%d] for PID %d ... patching with %d' % (p_latest_timestamp, self.exit_time, self.pid, p_latest_timestamp)
+                reprozip.debug.count_warning('file accesses after process exit',
+                                             'p_latest_timestamp[%d] > exit_time[%d] for PID %d ... patching with %d',
+                                             p_latest_timestamp, self.exit_time, self.pid, p_latest_timestamp)
                 self.exit_time = p_latest_timestamp
     
     
@@ -499,7 +878,8 @@ class Process:
                    most_recent_event_timestamp=encode_datetime(self.most_recent_event_timestamp),
                    exited=self.exited,
                    exit_code=self.exit_code,
-                   phases=[e.serialize() for e in self.phases])
+                   rusage=self.rusage,
+                   phases=[e.serialize(self.path_table) for e in self.phases])
         
         # ugh ...
         if self.exit_time:
@@ -510,10 +890,33 @@ class Process:
         return ret
     
     
-    def mark_exit(self, exit_time, exit_code):
+    def serialize_compact(self):
+        """
+        Method that serializes process in the compact schema (version 2, see
+        ProcessPhase.serialize_compact). The creation time is still a
+        datetime, since processes of both schemas are queried and sorted on
+        it.
+        """
+        return dict(_id=self.unique_id(),
+                    schema=2,
+                    pid=self.pid,
+                    ppid=self.ppid,
+                    uid=self.uid,
+                    other_uids=self.other_uids,
+                    creation_time=encode_datetime(self.creation_time),
+                    most_recent_event_timestamp=self.most_recent_event_timestamp,
+                    exited=self.exited,
+                    exit_code=self.exit_code,
+                    exit_time=self.exit_time or None,
+                    rusage=self.rusage,
+                    phases=[e.serialize_compact() for e in self.phases])
+    
+    
+    def mark_exit(self, exit_time, exit_code, rusage=None):
         self.exited = True
         self.exit_time = exit_time
         self.exit_code = exit_code
+        self.rusage = rusage
         
         assert self.creation_time
         
@@ -530,7 +933,9 @@ class Process:
             
             max_time += 1 # bump it up by 1 so that it doesn't overlap :)
             
-            print >> sys.stderr, 'WARNING: exit_time[%d] < creation_time[%d] for PID %d ... patching with %d' % (self.exit_time, self.creation_time, self.pid, max_time)
+            reprozip.debug.count_warning('process exits before creation',
+                                         'exit_time[%d] < creation_time[%d] for PID %d ... patching with %d',
+                                         self.exit_time, self.creation_time, self.pid, max_time)
             self.exit_time = max_time
         
         self._finalize() # finalize and freeze this entry!!!
@@ -550,6 +955,9 @@ class Process:
         """
         assert entry.pid == self.pid # sanity check
         
+        prev_abspath = self.prev_abspath
+        self.prev_abspath = None
+        
         # for setuid executables ...
         if entry.uid != self.uid:
             if self.other_uids:
@@ -562,13 +970,18 @@ class Process:
         
         assert not self.exited # don't allow ANY more entries after you've exited
         
+        table = self.path_table
+        fs = self.stat_cache
         
         if (entry.syscall_name in OPEN_VARIANTS):
             # OPEN_ABSPATH always preceeds another OPEN_* entry,
             # or something is wrong ...
-            assert self.prev_entry.syscall_name == 'OPEN_ABSPATH'
-            # use the ABSOLUTE PATH filename from prev_entry
-            filename_abspath = os.path.normpath(self.prev_entry.filename_abspath)
+            if prev_abspath is None:
+                reprozip.debug.count_warning('OPEN entries without OPEN_ABSPATH',
+                                             '%s (fd %d) ignored', entry, entry.fd)
+                return False
+            # use the ABSOLUTE PATH filename from the previous entry
+            filename_abspath = table.normpath_id(prev_abspath)
             
             # ok this check is a bit too harsh ... issue a WARNING if it fails
             # rather than dying.  sometimes 'close' system calls get LOST, so
@@ -576,29 +989,28 @@ class Process:
             # one is opened with the same fd
             #assert entry.fd not in self.opened_files
             if entry.fd in self.opened_files:
-                print >> sys.stderr, "WARNING: On OPEN, fd", entry.fd, "is already being used by", self.opened_files[entry.fd]
+                (fn, mode) = self.opened_files[entry.fd]
+                reprozip.debug.count_warning('reused file descriptors',
+                                             'On OPEN, fd %d is already being used by %s',
+                                             entry.fd, (table.path(fn), mode))
             
             # Resolving symbolic links
             
             symlink = False
-            filename = os.path.normpath(entry.filename)
             if self.wdir:
-                if not os.path.isabs(filename):
-                    filename = os.path.normpath(os.path.join(self.wdir, filename))
+                filename = table.join_id(self.wdir, entry.filename)
                 if (filename != filename_abspath):
                     # we have a symlink!
                     symlink = True
+            else:
+                filename = table.normpath_id(entry.filename)
             
             # Files are being added here!
             # For the reproducibility tool, the timestamp does not matter,
             # but it is important to know that the timestamp being added
             # here is WRONG!
             
-            ignore = False
-            for d in IGNORE_DIRS:
-                if filename_abspath.startswith(d):
-                    ignore = True
-                    break
+            ignore = table.is_ignored(filename_abspath)
                 
             args = (entry.proc_name, entry.timestamp, filename)
             args_symlink = (entry.proc_name, filename, filename_abspath)
@@ -626,29 +1038,28 @@ class Process:
                 assert False
                 
         elif (entry.syscall_name in OPEN_AT_VARIANTS):
-            assert self.prev_entry.syscall_name == 'OPEN_ABSPATH'
-            filename_abspath = os.path.normpath(self.prev_entry.filename_abspath)
+            if prev_abspath is None:
+                reprozip.debug.count_warning('OPEN entries without OPEN_ABSPATH',
+                                             '%s (fd %d) ignored', entry, entry.fd)
+                return False
+            filename_abspath = table.normpath_id(prev_abspath)
             
             if entry.fd in self.opened_files:
-                print >> sys.stderr, "WARNING: On OPEN, fd", entry.fd, "is already being used by", self.opened_files[entry.fd]
+                (fn, mode) = self.opened_files[entry.fd]
+                reprozip.debug.count_warning('reused file descriptors',
+                                             'On OPEN, fd %d is already being used by %s',
+                                             entry.fd, (table.path(fn), mode))
             
             # Resolving symbolic links
             symlink = False
-            filename = os.path.normpath(entry.filename)
-            if not os.path.isabs(filename):
-                d_filename = os.path.normpath(entry.d_filename)
-                if not os.path.isabs(d_filename):
-                    return False
-                filename = os.path.normpath(os.path.join(d_filename, filename))
+            if not os.path.isabs(entry.filename) and not os.path.isabs(entry.d_filename):
+                return False
+            filename = table.join_id(entry.d_filename, entry.filename)
             if (filename != filename_abspath):
                 # we have a symlink!
                 symlink = True
             
-            ignore = False
-            for d in IGNORE_DIRS:
-                if filename_abspath.startswith(d):
-                    ignore = True
-                    break
+            ignore = table.is_ignored(filename_abspath)
                 
             args = (entry.proc_name, entry.timestamp, filename)
             args_symlink = (entry.proc_name, filename, filename_abspath)
@@ -676,97 +1087,93 @@ class Process:
                 assert False
                 
         elif entry.syscall_name == 'SYMLINK':
-            symlink = os.path.normpath(entry.symlink)
-            target = os.path.normpath(entry.target)
-            pwd = os.path.normpath(entry.pwd)
-            
-            if not os.path.isabs(symlink):
-                if not os.path.isabs(pwd):
+            if os.path.isabs(entry.symlink):
+                symlink = table.normpath_id(entry.symlink)
+            else:
+                if not os.path.isabs(entry.pwd):
                     return False
-                symlink = os.path.join(pwd, symlink)
-                if not os.path.exists(symlink):
+                symlink = table.join_id(entry.pwd, entry.symlink)
+                if not fs.exists(symlink):
                     return False
             
-            for d in IGNORE_DIRS:
-                if symlink.startswith(d):
-                    return False 
+            if table.is_ignored(symlink):
+                return False
             
             args = (entry.proc_name, entry.timestamp, symlink)
             # file
-            if not os.path.isdir(symlink):
+            if not fs.isdir(symlink):
                 self.phases[-1].add_file_read(*args)
-                if not os.path.isabs(target):
-                    target = os.path.realpath(symlink)
+                if os.path.isabs(entry.target):
+                    target = table.normpath_id(entry.target)
+                else:
+                    target = fs.realpath_id(symlink)
                 args_symlink = (entry.proc_name, symlink, target)
                 self.phases[-1].add_symlink(*args_symlink)
             # dir
             else:
                 self.phases[-1].add_dir(*args)
-                    
+            
         elif entry.syscall_name == 'SYMLINK_AT':
-            symlink = os.path.normpath(entry.symlink)
-            target = os.path.normpath(entry.target)
-            if not os.path.isabs(symlink):
-                d_filename = os.path.normpath(entry.d_filename)
-                if not os.path.isabs(d_filename):
+            if os.path.isabs(entry.symlink):
+                symlink = table.normpath_id(entry.symlink)
+            else:
+                if not os.path.isabs(entry.d_filename):
                     return False
-                symlink = os.path.normpath(os.path.join(d_filename, symlink))
-                if not os.path.exists(symlink):
+                symlink = table.join_id(entry.d_filename, entry.symlink)
+                if not fs.exists(symlink):
                     return False
-                
-            for d in IGNORE_DIRS:
-                if symlink.startswith(d):
-                    return False 
-                
+            
+            if table.is_ignored(symlink):
+                return False
+            
             args = (entry.proc_name, entry.timestamp, symlink)
             # file
-            if not os.path.isdir(symlink):
+            if not fs.isdir(symlink):
                 self.phases[-1].add_file_read(*args)
-                if not os.path.isabs(target):
-                    target = os.path.realpath(symlink)
+                if os.path.isabs(entry.target):
+                    target = table.normpath_id(entry.target)
+                else:
+                    target = fs.realpath_id(symlink)
                 args_symlink = (entry.proc_name, symlink, target)
                 self.phases[-1].add_symlink(*args_symlink)
             # dir
             else:
                 self.phases[-1].add_dir(*args)
-                
+            
         elif entry.syscall_name in ('STAT', 'ACCESS', 'TRUNCATE'):
-            filename = os.path.normpath(entry.filename)
-            if os.path.isabs(filename) and os.path.exists(filename):
+            if os.path.isabs(entry.filename):
+                filename = table.normpath_id(entry.filename)
+                if not fs.exists(filename):
+                    return False
                 
-                for d in IGNORE_DIRS:
-                    if filename.startswith(d):
-                        return False 
+                if table.is_ignored(filename):
+                    return False
                 
                 args = (entry.proc_name, entry.timestamp, filename)
                 # file
-                if not os.path.isdir(filename):
+                if not fs.isdir(filename):
                     self.phases[-1].add_file_read(*args)
-                    if os.path.islink(filename):
-                        args_symlink = (entry.proc_name, filename, os.path.realpath(filename))
+                    if fs.islink(filename):
+                        args_symlink = (entry.proc_name, filename, fs.realpath_id(filename))
                         self.phases[-1].add_symlink(*args_symlink)
                 # dir
                 else:
                     self.phases[-1].add_dir(*args)
-                    
+            
         elif entry.syscall_name in ('STAT_AT', 'ACCESS_AT'):
-            filename = os.path.normpath(entry.filename)
-            if not os.path.isabs(filename):
-                d_filename = os.path.normpath(entry.d_filename)
-                if not os.path.isabs(d_filename):
-                    return False
-                filename = os.path.normpath(os.path.join(d_filename, filename))
-                
-            for d in IGNORE_DIRS:
-                if filename.startswith(d):
-                    return False 
-                
+            if not os.path.isabs(entry.filename) and not os.path.isabs(entry.d_filename):
+                return False
+            filename = table.join_id(entry.d_filename, entry.filename)
+            
+            if table.is_ignored(filename):
+                return False
+            
             args = (entry.proc_name, entry.timestamp, filename)
             # file
-            if not os.path.isdir(filename):
+            if not fs.isdir(filename):
                 self.phases[-1].add_file_read(*args)
-                if os.path.islink(filename):
-                    args_symlink = (entry.proc_name, filename, os.path.realpath(filename))
+                if fs.islink(filename):
+                    args_symlink = (entry.proc_name, filename, fs.realpath_id(filename))
                     self.phases[-1].add_symlink(*args_symlink)
             # dir
             else:
@@ -819,14 +1226,8 @@ class Process:
             try:
                 (fn, mode) = self.opened_files[entry.fd]
                 
-                skip_me = False
                 # ignore reads to filenames that start with IGNORE_DIRS
-                for d in IGNORE_DIRS:
-                    if fn.startswith(d):
-                        skip_me = True
-                        break
-                
-                if not skip_me:
+                if not table.is_ignored(fn):
                     args = (entry.proc_name, entry.timestamp, fn)
                     
                     if entry.syscall_name in ('READ', 'MMAP_READ'):
@@ -852,12 +1253,19 @@ class Process:
                 #print >> sys.stderr, 'WARNING: orphan', entry.syscall_name, entry.pid, entry.proc_name, entry.fd
                 pass
         
+        elif entry.syscall_name == 'IO':
+            # counters of an fd, before it is closed
+            opened = self.opened_files.get(entry.fd)
+            if opened is not None and not table.is_ignored(opened[0]):
+                self.phases[-1].add_file_io(entry.proc_name, opened[0], *entry.io)
+                self._mark_changed(entry)
+        
         elif entry.syscall_name == 'RENAME':
-            self.phases[-1].add_file_rename(entry.proc_name, entry.timestamp, entry.old_filename, entry.new_filename)
+            self.phases[-1].add_file_rename(entry.proc_name, entry.timestamp, table.path_id(entry.old_filename), table.path_id(entry.new_filename))
             self._mark_changed(entry)
         
         elif entry.syscall_name == 'EXIT_GROUP':
-            self.mark_exit(entry.timestamp, entry.exit_code)
+            self.mark_exit(entry.timestamp, entry.exit_code, entry.rusage)
             self._mark_changed(entry)
             return True
         
@@ -886,8 +1294,8 @@ class Process:
             assert entry.pipe_write_fd not in self.opened_files # sanity check
             # PIPE creates two new file descriptors ...
             # (encode the pid and fd in the pseudo-filename of the pipe)
-            self.opened_files[entry.pipe_read_fd] =  ('PIPE-%d-%d' % (self.pid, entry.pipe_read_fd), 'r')
-            self.opened_files[entry.pipe_write_fd] = ('PIPE-%d-%d' % (self.pid, entry.pipe_write_fd), 'w')
+            self.opened_files[entry.pipe_read_fd] =  (table.path_id('PIPE-%d-%d' % (self.pid, entry.pipe_read_fd)), 'r')
+            self.opened_files[entry.pipe_write_fd] = (table.path_id('PIPE-%d-%d' % (self.pid, entry.pipe_write_fd)), 'w')
             
 #            self.processed_files[entry.pipe_read_fd] = True
 #            self.processed_files[entry.pipe_read_fd] = True
@@ -897,11 +1305,12 @@ class Process:
         elif entry.syscall_name == 'FORK':
             # add a Process object for your offspring ...
             if entry.child_pid not in self.active_processes_dict:
-                child_proc = Process(entry.child_pid, self.pid, entry.uid, entry.timestamp, self.active_processes_dict)
+                child_proc = Process(entry.child_pid, self.pid, entry.uid, entry.timestamp, self.active_processes_dict, table, fs)
                 
-                # child inherits fd's and pipes from parent ... make a deepcopy!
-                child_proc.opened_files = deepcopy(self.opened_files)
-                child_proc.opened_pipes = deepcopy(self.opened_pipes)
+                # child inherits fd's and pipes from parent ... make a copy!
+                # (the values are immutable tuples, so a shallow copy will do)
+                child_proc.opened_files = self.opened_files.copy()
+                child_proc.opened_pipes = self.opened_pipes.copy()
             else:
                 # This shouldn't happen if the SystemTap logs were perfect, but
                 # in reality, some entries come in slightly OUT OF ORDER, so if
@@ -910,6 +1319,9 @@ class Process:
                 #print >> sys.stderr, "WARNING: fork() child PID", entry.child_pid, "already exists!"
                 pass
         
-        self.prev_entry = entry # set previous entry for reference
+        elif entry.syscall_name == 'OPEN_ABSPATH':
+            # kept for the OPEN_* entry that follows
+            self.prev_abspath = entry.filename_abspath
+        
         return False
     
\ No newline at end of file
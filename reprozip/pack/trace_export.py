@@ -0,0 +1,327 @@
+###############################################################################
+##
+## Copyright (C) 2012-2013, NYU-Poly. 
+## All rights reserved.
+## Contact: fchirigati@nyu.edu
+##
+## This file is part of ReproZip.
+##
+## "Redistribution and use in source and binary forms, with or without 
+## modification, are permitted provided that the following conditions are met:
+##
+##  - Redistributions of source code must retain the above copyright notice, 
+##    this list of conditions and the following disclaimer.
+##  - Redistributions in binary form must reproduce the above copyright 
+##    notice, this list of conditions and the following disclaimer in the 
+##    documentation and/or other materials provided with the distribution.
+##  - Neither the name of NYU-Poly nor the names of its 
+##    contributors may be used to endorse or promote products derived from 
+##    this software without specific prior written permission.
+##
+## THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" 
+## AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, 
+## THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR 
+## PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR 
+## CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, 
+## EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, 
+## PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; 
+## OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, 
+## WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR 
+## OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF 
+## ADVISED OF THE POSSIBILITY OF SUCH DAMAGE."
+##
+###############################################################################
+
+from reprozip.pack.storage import get_storage
+from reprozip.pack.query import default_session
+import reprozip.debug
+import reprozip.utils
+import argparse
+import sys
+
+# kinds of file accesses exported, by key of the phases
+FILE_KEYS = (('files_read', 'read'),
+             ('files_written', 'write'),
+             ('directories', 'directory'))
+
+# number of paths kept by the exporter between lookups
+PATH_CACHE_SIZE = 100000
+
+def session_origin(storage, session_tag):
+    """
+    Returns the creation time (ms since the epoch) of the first process of
+    a session, or None.
+    """
+    
+    for doc in storage.find_processes(session_tag, limit=1):
+        return reprozip.utils.decode_datetime(doc['creation_time'])
+    return None
+
+class TraceEventWriter:
+    """
+    Writes trace events as the JSON object of the Chrome trace-event
+    format (also read by Perfetto) one at a time, so that the events of
+    a session are never all in memory. Timestamps are given in ms since
+    the epoch, and written in us since origin.
+    """
+    
+    def __init__(self, out, origin, other_data=None):
+        self.out = out
+        self.origin = origin
+        self.events = 0
+        out.write('{"displayTimeUnit":"ms","otherData":%s,"traceEvents":[\n'
+                  % reprozip.utils.to_compact_json(other_data or {}))
+
+
+    def timestamp(self, t):
+        return (t - self.origin) * 1000
+
+
+    def write(self, event):
+        if self.events:
+            self.out.write(',\n')
+        self.out.write(reprozip.utils.to_compact_json(event))
+        self.events += 1
+
+
+    def close(self):
+        self.out.write('\n]}\n')
+
+
+class TraceExporter:
+    """
+    Exports the processes of a session stored in the database as trace
+    events: a slice per process and per phase (execve), an instant event
+    per file access, and a flow from each parent to the processes it
+    created. Only the events between start and end (ms since the epoch,
+    or None) are exported; processes outside of this window are not
+    read from the database.
+    """
+    
+    def __init__(self, storage, session_tag, start=None, end=None):
+        self.storage = storage
+        self.session_tag = session_tag
+        self.start = start
+        self.end = end
+        
+        # path id -> path, for processes in the compact schema
+        self.paths = {}
+        
+        # pids whose track was named
+        self.named = set()
+
+
+    def in_window(self, t):
+        return ((self.start is None or t >= self.start) and
+                (self.end is None or t <= self.end))
+
+
+    def clip(self, start, end):
+        if self.start is not None:
+            start = max(start, self.start)
+        if self.end is not None:
+            end = min(end, self.end)
+        return (start, max(start, end))
+
+
+    def resolve(self, ids):
+        """
+        Method that returns the dict of the paths of a set of path ids of
+        the session.
+        """
+        missing = [path_id for path_id in ids if path_id not in self.paths]
+        if missing:
+            if len(self.paths) + len(missing) > PATH_CACHE_SIZE:
+                self.paths = {}
+            self.paths.update(self.storage.find_paths(self.session_tag, missing))
+        return self.paths
+
+
+    def file_accesses(self, doc):
+        """
+        Method that returns the list of the file accesses of a process, as
+        (phase index, kind, path, timestamp) tuples.
+        """
+        decode = reprozip.utils.decode_datetime
+        accesses = []
+        
+        if doc.get('schema', 1) < 2:
+            for (i, phase) in enumerate(doc['phases']):
+                for (key, kind) in FILE_KEYS:
+                    name = 'filename'
+                    if key == 'directories':
+                        name = 'dirname'
+                    for entry in phase.get(key) or []:
+                        times = entry['timestamp']
+                        if not isinstance(times, list):
+                            times = [times]
+                        for t in times:
+                            accesses.append((i, kind, entry[name], decode(t)))
+                for entry in phase.get('files_renamed') or []:
+                    accesses.append((i, 'rename', '%s -> %s' % (entry['old_filename'], entry['new_filename']),
+                                     decode(entry['timestamp'])))
+            return accesses
+        
+        entries = []
+        for (i, phase) in enumerate(doc['phases']):
+            for (key, kind) in FILE_KEYS:
+                for entry in phase.get(key) or []:
+                    entries.append((i, kind, entry))
+        if doc.get('overflow'):
+            kinds = dict(FILE_KEYS)
+            for overflow in self.storage.find_overflow(doc['_id']):
+                if overflow['key'] in kinds:
+                    for entry in overflow['entries']:
+                        entries.append((overflow['phase'], kinds[overflow['key']], entry))
+        
+        ids = set(path_id for (i, kind, (path_id, times)) in entries)
+        renames = []
+        for (i, phase) in enumerate(doc['phases']):
+            for (t, old, new) in phase.get('files_renamed') or []:
+                renames.append((i, t, old, new))
+                ids.add(old)
+                ids.add(new)
+        path = self.resolve(ids)
+        
+        for (i, kind, (path_id, times)) in entries:
+            if not isinstance(times, list):
+                times = [times]
+            for t in times:
+                accesses.append((i, kind, path[path_id], t))
+        for (i, t, old, new) in renames:
+            accesses.append((i, 'rename', '%s -> %s' % (path[old], path[new]), t))
+        return accesses
+
+
+    def export_process(self, doc, writer):
+        """
+        Method that writes the events of a process.
+        """
+        decode = reprozip.utils.decode_datetime
+        pid = doc['pid']
+        start = decode(doc['creation_time'])
+        end = decode(doc.get('exit_time')) or decode(doc.get('most_recent_event_timestamp')) or start
+        end = max(start, end)
+        phases = doc['phases']
+        
+        name = None
+        argv = None
+        for phase in phases:
+            name = phase.get('name') or name
+            argv = phase.get('execve_argv') or argv
+        name = name or str(pid)
+        
+        if pid not in self.named:
+            self.named.add(pid)
+            writer.write({'ph': 'M', 'name': 'process_name', 'pid': pid, 'tid': pid,
+                          'args': {'name': name}})
+        
+        (a, b) = self.clip(start, end)
+        writer.write({'ph': 'X', 'cat': 'process', 'name': name, 'pid': pid, 'tid': pid,
+                      'ts': writer.timestamp(a), 'dur': (b - a) * 1000,
+                      'args': {'ppid': doc['ppid'], 'exit_code': doc.get('exit_code'),
+                               'exited': doc.get('exited'), 'argv': argv}})
+        
+        if self.in_window(start):
+            # flow from the parent, at the creation of the process
+            flow = writer.events
+            writer.write({'ph': 's', 'cat': 'fork', 'name': 'fork', 'id': flow,
+                          'pid': doc['ppid'], 'tid': doc['ppid'], 'ts': writer.timestamp(start)})
+            writer.write({'ph': 'f', 'bp': 'e', 'cat': 'fork', 'name': 'fork', 'id': flow,
+                          'pid': pid, 'tid': pid, 'ts': writer.timestamp(start)})
+        
+        for (i, phase) in enumerate(phases):
+            phase_start = decode(phase.get('start_time')) or start
+            phase_end = end
+            if i + 1 < len(phases):
+                phase_end = decode(phases[i + 1].get('start_time')) or end
+            if (self.end is not None and phase_start > self.end) or \
+               (self.start is not None and phase_end < self.start):
+                continue
+            (a, b) = self.clip(phase_start, phase_end)
+            writer.write({'ph': 'X', 'cat': 'phase', 'name': phase.get('name') or name,
+                          'pid': pid, 'tid': pid, 'ts': writer.timestamp(a), 'dur': (b - a) * 1000,
+                          'args': {'phase': i, 'argv': phase.get('execve_argv'),
+                                   'pwd': phase.get('execve_pwd')}})
+        
+        for (i, kind, path, t) in sorted(self.file_accesses(doc), key=lambda access: access[3]):
+            if self.in_window(t):
+                writer.write({'ph': 'i', 's': 't', 'cat': kind, 'name': path,
+                              'pid': pid, 'tid': pid, 'ts': writer.timestamp(t),
+                              'args': {'phase': i}})
+
+
+    def export(self, out):
+        """
+        Method that writes the trace events of the session to out, and
+        returns their number. Timestamps are relative to the creation of
+        the first process of the session.
+        """
+        origin = session_origin(self.storage, self.session_tag)
+        
+        writer = TraceEventWriter(out, origin or 0, {'session_tag': self.session_tag,
+                                                     'origin': origin,
+                                                     'start': self.start,
+                                                     'end': self.end})
+        for doc in self.storage.find_processes_in_window(self.session_tag, self.start, self.end):
+            if doc['creation_time'] is not None:
+                self.export_process(doc, writer)
+        writer.close()
+        return writer.events
+
+
+def export(argv=None):
+    """
+    Exports a tracing session stored in the database to the Chrome
+    trace-event format: 'reprozip export ...'.
+    """
+    
+    parser = argparse.ArgumentParser(prog        = 'reprozip export',
+                                     description = 'exports a tracing session as Chrome trace events, '
+                                                   'to be viewed in chrome://tracing or Perfetto')
+    parser.add_argument('--session', '-s',
+                        help='the session to export - by default, the last one traced')
+    parser.add_argument('--start', type=int,
+                        help='start of the exported window, in ms since the first process of the session')
+    parser.add_argument('--end', type=int,
+                        help='end of the exported window, in ms since the first process of the session')
+    parser.add_argument('--output', '-o',
+                        help='the file to write - by default, the standard output')
+    args = parser.parse_args(argv)
+    
+    session_tag = args.session or default_session()
+    if session_tag is None:
+        reprozip.debug.error('No session was traced; use --session.')
+        sys.exit(1)
+    
+    try:
+        storage = get_storage()
+    except:
+        sys.exit(1)
+    
+    storage.start()
+    storage.wait()
+    
+    out = sys.stdout
+    try:
+        storage.connect()
+        
+        start = end = None
+        origin = session_origin(storage, session_tag) or 0
+        if args.start is not None:
+            start = origin + args.start
+        if args.end is not None:
+            end = origin + args.end
+        
+        if args.output:
+            out = open(args.output, 'w')
+        events = TraceExporter(storage, session_tag, start, end).export(out)
+        if args.output:
+            out.close()
+            reprozip.debug.success('%d trace events written to %s' % (events, args.output))
+    except:
+        reprozip.debug.error(sys.exc_info()[1])
+        storage.stop()
+        sys.exit(1)
+    
+    storage.stop()
@@ -33,21 +33,105 @@
 ###############################################################################
 
 from reprozip.utils import get_ms_since_epoch
-from reprozip.pack.store_data import Provenance
+from reprozip.pack.store_data import Provenance, ChunkConsumer
+from reprozip.pack.config_parser import Parser
+from reprozip.pack.preload.shim import build_shim, shim_env
+from reprozip.pack.ptrace.supervisor import build_supervisor, supervisor_command
 from reprozip.install.utils import guess_sudo, guess_os
 import reprozip.debug
 import subprocess
+import threading
+import gzip
 import time
 import sys
 import os
 
+# compression level for trace chunks: the '||' text format compresses well
+# even with the fastest level, and the tracer must keep up with SystemTap
+COMPRESS_LEVEL = 1
+
+class TraceWriter(threading.Thread):
+    """
+    Thread that reads the output of the tracer from a pipe and writes it to
+    gzip-compressed chunks (prefix.0.gz, prefix.1.gz, ...). Chunks are rotated
+    at line boundaries, and a chunk is closed before the next one is created,
+    so any chunk followed by another one is complete.
+    """
+    
+    def __init__(self, stream, prefix, chunk_size):
+        """
+        Init method for TraceWriter.
+        
+        -> stream is the pipe with the output of the tracer
+        -> prefix is the path of the chunks, without index and extension
+        -> chunk_size is the (uncompressed) size of each chunk, in MB
+        """
+        
+        threading.Thread.__init__(self)
+        self.daemon = True
+        
+        self.__stream = stream
+        self.__prefix = prefix
+        self.__chunk_size = chunk_size * 1024 * 1024
+        
+    def __open_chunk(self, index):
+        # chunks are removed by the consumer, once they are parsed
+        return gzip.open('%s.%d.gz' % (self.__prefix, index), 'wb', COMPRESS_LEVEL)
+        
+    def run(self):
+        fd = self.__stream.fileno()
+        index = 0
+        written = 0
+        out = self.__open_chunk(index)
+        try:
+            while True:
+                block = os.read(fd, 1 << 16)
+                if not block:
+                    break
+                if written + len(block) >= self.__chunk_size:
+                    cut = block.rfind('\n') + 1
+                    if cut > 0:
+                        out.write(block[:cut])
+                        out.close()
+                        index += 1
+                        out = self.__open_chunk(index)
+                        block = block[cut:]
+                        written = 0
+                out.write(block)
+                written += len(block)
+        finally:
+            out.close()
+
+class StreamDrainer(threading.Thread):
+    """
+    Thread that keeps reading a pipe, so that the tracer never blocks on a
+    full stderr, and keeps what was read for later inspection.
+    """
+    
+    def __init__(self, stream):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        
+        self.__stream = stream
+        self.__lines = []
+        
+    def get_output(self):
+        return ''.join(self.__lines)
+        
+    def run(self):
+        for line in iter(self.__stream.readline, ''):
+            self.__lines.append(line)
+            
+    output = property(get_output, None, None, None)
+
 class Tracer:
     """
     The class Tracer represents a tracer to get process information and store
     it in a MongoDB.
     """
     
-    def __init__(self, log_basedir, pass_lite):
+    def __init__(self, log_basedir, pass_lite, verbose=False, backend=None,
+                 keep_processes=False):
         """
         Init method for Tracer.
         
@@ -56,13 +140,42 @@ class Tracer:
            information
         -> integrator is the complete path to the python script that stores all
            the information in a MongoDB
+        -> verbose indicates whether the telemetry of the tracer should be
+           printed in detail, and whether every warning raised while parsing
+           the trace should be printed (instead of a summary)
+        -> backend is either 'systemtap' (SystemTap / DTrace, which require
+           root privileges), 'preload' (an LD_PRELOAD shim loaded only by
+           the processes of the experiment) or 'ptrace' (a supervisor that
+           traces the experiment with ptrace and seccomp); by default, the
+           backend in the configuration file is used
+        -> keep_processes indicates whether the processes of the session
+           should be kept in memory (see get_processes)
         """
         
+        self.__verbose = verbose
+        reprozip.debug.set_verbose_warnings(verbose)
         self.__log_basedir = log_basedir
         self.__pass_lite = pass_lite
         self.__session_name = None
         self.__session_name_path = None
-        self.__provenance = Provenance()
+        
+        # the trace output is rotated in chunks of chunk_size MB
+        parser = Parser()
+        (self.__chunk_size, keep_chunks, self.__compression,
+         config_backend, reorder_window) = parser.read_tracer_config()
+        self.__backend = backend or config_backend
+        if self.__backend not in ('systemtap', 'preload', 'ptrace'):
+            reprozip.debug.error('Unknown tracer backend: %s' %self.__backend)
+            raise Exception
+        if (self.__backend != 'systemtap') and (guess_os() != 'linux'):
+            reprozip.debug.error('The %s tracer backend is only available on Linux.' %self.__backend)
+            raise Exception
+        self.__shim = None
+        self.__supervisor = None
+        self.__provenance = Provenance(keep_chunks, reorder_window, keep_processes)
+        self.__consumer = None
+        self.__writer = None
+        self.__stderr = None
         
         self.__p_tracer = None
         
@@ -78,23 +191,84 @@ class Tracer:
         os.symlink(self.__session_name, cs)
         
         
-    def store_process_data(self, port):
+    def get_processes(self):
         """
-        Method that stores data in MongoDB.
+        Method that returns the processes of the session, if they are kept
+        in memory (a ProcessIndex object), or None.
         """
+        
+        return self.__provenance.processes
+        
+        
+    def store_process_data(self, storage):
+        """
+        Method that stores data in the database (a Storage object, or None
+        if the processes are only kept in memory).
+        """
+        
+        if self.__consumer and self.__consumer.error:
+            reprozip.debug.error('Error while parsing trace chunks: %s' %self.__consumer.error)
+            raise Exception
+        
         self.__provenance.store(self.__session_name_path,
                                 self.__session_name,
-                                port)
+                                storage)
+        
+        self.report_stats()
+        
+    
+    def report_stats(self):
+        """
+        Method that prints the telemetry of the tracer.
+        """
+        
+        stats = self.__provenance.stats
+        
+        print '** Tracer: %d records, %d lost, %d skipped probes **' % (stats.parsed_total(),
+                                                                        stats.lost_records(),
+                                                                        stats.skipped_probes)
+        for line in stats.summary():
+            reprozip.debug.verbose(self.__verbose, line)
+        
+        for line in self.__provenance.rusage.summary():
+            reprozip.debug.verbose(self.__verbose, line)
+        for line in self.__provenance.file_io.summary():
+            reprozip.debug.verbose(self.__verbose, line)
+        
+        fs = self.__provenance.stat_cache
+        reprozip.debug.verbose(self.__verbose,
+                               'stat cache: %d lookups, %.1f%% hits' % (fs.hits + fs.misses,
+                                                                         fs.hit_rate()))
+        
+        if self.__verbose and stats.has_data_loss():
+            msg = 'The tracer lost data (%d records, %d skipped probes, %d transport failures); ' % (stats.lost_records(),
+                                                                                                     stats.skipped_probes,
+                                                                                                     stats.transport_failures)
+            msg += 'some files used by the experiment may be missing from the provenance.'
+            reprozip.debug.warning(msg)
 
         
-    def run_tracer(self):
+    def run_tracer(self, storage=None):
         """
         Method that executes the tracer.
+        
+        If storage is given, or if the processes are kept in memory,
+        completed trace chunks are parsed while the experiment runs.
         """
         
         command_line = ''
         
-        if guess_os() == 'linux':
+        if self.__backend == 'preload':
+            # nothing runs until the experiment is executed with the shim
+            # (see get_experiment_env)
+            self.__shim = build_shim(self.__log_basedir)
+            
+        elif self.__backend == 'ptrace':
+            # the supervisor runs the experiment itself
+            # (see get_experiment_wrapper)
+            self.__supervisor = build_supervisor(self.__log_basedir)
+            
+        elif guess_os() == 'linux':
             command_line = guess_sudo() + ' killall stap'
             
             try:
@@ -107,8 +281,19 @@ class Tracer:
             
             (stdout, stderr) = p.communicate()
 
-            command_line = guess_sudo() + ' stap -o %s/pass-lite.out %s' % (self.__session_name_path,
-                                                                            self.__pass_lite)
+            if self.__compression == 'gzip':
+                # stap writes to stdout, which is compressed and rotated
+                # by a TraceWriter
+                command_line = guess_sudo() + ' stap %s' % self.__pass_lite
+            else:
+                # size-based rotation of the output: pass-lite.out.0, pass-lite.out.1, ...
+                # (without a maximum number of chunks, since SystemTap would
+                # remove chunks that were not parsed yet)
+                rotation = '-S %d' % self.__chunk_size
+                
+                command_line = guess_sudo() + ' stap %s -o %s/pass-lite.out %s' % (rotation,
+                                                                                   self.__session_name_path,
+                                                                                   self.__pass_lite)
             
             try:
                 self.__p_tracer = subprocess.Popen(command_line.split(),
@@ -118,6 +303,15 @@ class Tracer:
                 reprozip.debug.error('Could not run stap: %s' %sys.exc_info()[1])
                 self.__p_tracer = None
                 raise Exception
+            
+            self.__stderr = StreamDrainer(self.__p_tracer.stderr)
+            self.__stderr.start()
+            
+            if self.__compression == 'gzip':
+                self.__writer = TraceWriter(self.__p_tracer.stdout,
+                                            os.path.join(self.__session_name_path, 'pass-lite.out'),
+                                            self.__chunk_size)
+                self.__writer.start()
                 
         elif guess_os() == 'darwin':
             command_line = guess_sudo() + ' killall dtrace'
@@ -143,18 +337,58 @@ class Tracer:
                 reprozip.debug.error('Could not run dtrace: %s' %sys.exc_info()[1])
                 self.__p_tracer = None
                 raise Exception
+            
+            self.__stderr = StreamDrainer(self.__p_tracer.stderr)
+            self.__stderr.start()
         
         # give it some time to begin
-        time.sleep(10)
+        if self.__backend == 'systemtap':
+            time.sleep(10)
+        
+        # parsing chunks while the experiment runs
+        if (storage is not None) or (self.__provenance.processes is not None):
+            self.__provenance.open_session(self.__session_name_path,
+                                           self.__session_name,
+                                           storage)
+            self.__consumer = ChunkConsumer(self.__provenance)
+            self.__consumer.start()
+        
+    def get_experiment_env(self, env, command_line):
+        """
+        Method that returns the environment in which the experiment must be
+        executed: the preload backend only traces processes that load the
+        shim.
+        """
+        
+        if self.__backend != 'preload':
+            return env
+        
+        return shim_env(self.__shim,
+                        os.path.join(self.__session_name_path, 'pass-lite.out.0'),
+                        command_line,
+                        env)
+        
+    def get_experiment_wrapper(self):
+        """
+        Method that returns the arguments that must precede the command line
+        of the experiment, or None if it must be executed as is.
+        """
+        
+        if self.__backend != 'ptrace':
+            return None
+        
+        return supervisor_command(self.__supervisor,
+                                  os.path.join(self.__session_name_path, 'pass-lite.out.0'))
         
     def check_tracer(self):
         """
         Method that checks if there was any problem with the tracer.
         """
         
-        if self.__p_tracer.returncode == None:
+        if (self.__p_tracer != None) and (self.__p_tracer.poll() != None):
             # tracer has terminated - an error has probably occured
-            stderr = self.__p_tracer.stderr.read()
+            self.__stderr.join(5)
+            stderr = self.__stderr.output
             reprozip.debug.error('Error while tracing system calls: \"%s\"' %stderr)
             raise Exception
                 
@@ -164,7 +398,8 @@ class Tracer:
         """
         
         # give it some time to finalize
-        time.sleep(5)
+        if self.__backend == 'systemtap':
+            time.sleep(5)
         
         if (self.__p_tracer == None):
             pass
@@ -179,4 +414,22 @@ class Tracer:
                 msg += 'You may want to try stopping it by running "%s"' %cmd
                 reprozip.debug.warning(msg)
             
+            # SystemTap reports skipped probes and transport failures on
+            # stderr when it exits
+            for i in range(30):
+                if self.__p_tracer.poll() != None:
+                    break
+                time.sleep(1)
+            self.__stderr.join(5)
+            self.__provenance.stats.parse_tracer_stderr(self.__stderr.output)
+            
             self.__p_tracer = None
+        
+        # the last chunk is complete once stap closes its output
+        if self.__writer:
+            self.__writer.join(30)
+            self.__writer = None
+        
+        # the remaining chunks are parsed by store_process_data()
+        if self.__consumer:
+            self.__consumer.stop()
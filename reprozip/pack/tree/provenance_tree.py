@@ -523,7 +523,7 @@ class ProvenanceTree:
         return node.id
     
     
-    def update_root_information(self):
+    def update_root_information(self, files=None):
         """
         Method used to update the information in the root.
         Basically, this method adds files read and written by all the nodes
@@ -531,6 +531,11 @@ class ProvenanceTree:
         captured before. All the dependencies are automatically passed to
         the root. Additionally, symbolic links and their corresponding targets,
         and environment variables are also passed.
+        If files is given, it holds the files read and written, directories
+        and symbolic links of the whole tree, as gathered by the database
+        (see Storage.aggregate_files), and only environment variables and the
+        symbolic links of the programs (see Node.set_execve_argv) are taken
+        from the nodes.
         """
         
         files_read = []
@@ -540,9 +545,10 @@ class ProvenanceTree:
         execve_env = {}
         for id in self.__nodes:
             if id != 0:                
-                files_read += self.__nodes[id].files_read
-                files_written += self.__nodes[id].files_written
-                dirs += self.__nodes[id].dirs
+                if files is None:
+                    files_read += self.__nodes[id].files_read
+                    files_written += self.__nodes[id].files_written
+                    dirs += self.__nodes[id].dirs
                 
                 node_execve_env = self.__nodes[id].execve_env
                 for env in node_execve_env:
@@ -553,6 +559,17 @@ class ProvenanceTree:
                 for symlink in node_symlink_to_target:
                     symlink_to_target[symlink] = node_symlink_to_target[symlink]
         
+        if files is not None:
+            # same normalization as in Node
+            files_read = [os.path.normpath(str(f)) for f in files['files_read']]
+            files_read = [f for f in files_read if not f.startswith('PIPE')]
+            files_written = [os.path.normpath(str(f)) for f in files['files_written']]
+            files_written = [f for f in files_written if not f.startswith('PIPE')]
+            dirs = [os.path.normpath(str(d)) for d in files['directories']]
+            for symlink in files['symlinks']:
+                if not symlink_to_target.has_key(symlink):
+                    symlink_to_target[symlink] = files['symlinks'][symlink]
+        
         self.__nodes[0].add_files_read(list(set(files_read)))
         self.__nodes[0].add_files_written(list(set(files_written)))
         self.__nodes[0].add_targets(symlink_to_target)
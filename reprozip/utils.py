@@ -85,11 +85,30 @@ mongodb_dbpath = os.path.join(log_basedir(), 'mongodb')
 mongodb_logpath = os.path.join(mongodb_dbpath, 'mongodb.log')
 mongodb_quiet = 'True'
 mongodb_journaling = 'False'
+mongodb_idle_timeout = '10'   # minutes a mongod started by ReproZip is kept running after its last use (0: stopped at once)
+
+# Storage defaults
+storage_backend = 'mongodb'   # 'mongodb' (mongod instance) or 'sqlite' (embedded database)
+storage_sqlite_path = os.path.join(log_basedir(), 'reprozip.db')
+storage_in_process = 'True'   # build the provenance of a traced experiment from memory, not from the database
+storage_persist = 'True'      # with in_process, also write the provenance to the database (in background)
+storage_indices = 'ppid, creation_time' # indices of the processes built after each session ('all': every index)
+storage_session_ttl = '0'     # days after which sessions and their log directories are removed (0: never)
+
+# Tracer defaults
+tracer_chunk_size = '64'      # size (in MB) of each trace output file
+tracer_keep_chunks = 'False'  # keep trace output files after they are parsed
+tracer_compression = 'gzip'   # compression of trace output files ('gzip' or 'none')
+tracer_backend = 'systemtap'  # 'systemtap' (SystemTap / DTrace), 'preload' (LD_PRELOAD shim) or 'ptrace'
+tracer_reorder_window = '100' # time window (in ms) in which trace entries are put back in order (0: disabled)
 
 # names in the database
 mongodb_database = 'reprozip_db'
 mongodb_collection = 'process_trace'
 mongodb_session_collection = 'session_status'
+mongodb_path_collection = 'path_dictionary'
+mongodb_overflow_collection = 'process_overflow'
+mongodb_path_index_collection = 'path_index'
 
 def executable_in_path(executable):
     """
@@ -106,6 +125,31 @@ def executable_in_path(executable):
     else:
         return (True, stdout.split()[0])
 
+def compile_c(source, output, flags, libs=[]):
+    """
+    Compiles source into output with cc, unless output is newer than
+    source. Returns a tuple (success, error message).
+    """
+    
+    if os.path.exists(output) and (os.path.getmtime(output) >= os.path.getmtime(source)):
+        return (True, None)
+    
+    (found, cc) = executable_in_path('cc')
+    if not found:
+        return (False, 'a C compiler (cc) could not be found')
+    
+    try:
+        p = subprocess.Popen([cc] + flags + ['-o', output, source] + libs,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+    except OSError, e:
+        return (False, str(e))
+    
+    (stdout, stderr) = p.communicate()
+    if p.returncode != 0:
+        return (False, stderr)
+    return (True, None)
+
 ###############################################################################
 # This part of the code came from Burrito System
 # Burrito System Paper: Philip J. Guo and Margo Seltzer. Burrito: Wrapping Your
@@ -124,6 +168,12 @@ def to_compact_json(obj):
 def encode_datetime(t):
     return datetime.datetime.fromtimestamp(float(t) / 1000)
 
+def decode_datetime(t):
+    # inverse of encode_datetime; timestamps already in ms are kept
+    if isinstance(t, datetime.datetime):
+        return int(time.mktime(t.timetuple())) * 1000 + t.microsecond // 1000
+    return t
+
 HOMEDIR = os.environ['HOME']
 assert HOMEDIR
 
@@ -20,7 +20,8 @@ setup(
                                           'reprozip = reprozip:run',
                                           'reprozip-dep = reprozip.install.dependencies:install_dependencies',
                                           'reprozip-clean-stap = reprozip.install.clean:clean_stap',
-                                          'reprozip-clean-mongodb = reprozip.install.clean:clean_mongodb'
+                                          'reprozip-clean-mongodb = reprozip.install.clean:clean_mongodb',
+                                          'reprozip-sessions = reprozip.pack.sessions:sessions'
                                           ]
                       },
       classifiers = [